@@ -0,0 +1,79 @@
+# coding=utf-8
+"""
+Per line cost of the debug logging on the hot paths while streaming a print with debug logging off
+
+Each line goes through FlashForgePlugin.rewrite_gcode(), FlashForge.write() and readline() until the printer's ok, as
+when OctoPrint streams a file, against a zero latency emulated printer. It is run with the debug switch as it is when
+debug is off, and forced on while the logger still discards debug messages, which is what every call used to cost
+before the switch (building the messages and having the logger throw them away).
+
+	python benchmarks/debuglog.py --count 20000
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import sys
+from timeit import default_timer as timer
+
+import hotpath
+from octoprint_flashforge import logswitch
+from octoprint_flashforge.emulator import EmulatedPrinter
+
+
+def stream(lines, repeat, guarded):
+	"""Return the best time (s) per line streaming lines with the debug switch off (guarded) or forced on"""
+	from octoprint_flashforge import FlashForgePlugin
+
+	plugin = FlashForgePlugin.__new__(FlashForgePlugin)
+	plugin._logger = logging.getLogger("octoprint.plugins.flashforge")
+	plugin._pretranslated = None
+	plugin._rules = hotpath.rules.compile_rules({})
+	plugin._tracer = hotpath.Tracer()
+	connection = hotpath.connect(EmulatedPrinter("dreamer"))
+	plugin._serial_obj = connection
+	comm = hotpath.Comm()
+	# the connection checked the level when it was created
+	logswitch.debug.enabled = not guarded
+	try:
+		best = None
+		for i in range(repeat):
+			start = timer()
+			rewrite = plugin.rewrite_gcode
+			write = connection.write
+			readline = connection.readline
+			for line in lines:
+				cmd = rewrite(comm, "queuing", line, None, line.split(" ", 1)[0])
+				write(cmd.encode())
+				while readline() != b"ok":
+					pass
+			elapsed = (timer() - start) / len(lines)
+			best = elapsed if best is None else min(best, elapsed)
+		return best
+	finally:
+		connection.close()
+		logswitch.debug.refresh()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--repeat", type=int, default=5, help="number of runs, best is reported")
+	parser.add_argument("--count", type=int, default=20000, help="lines per run")
+	args = parser.parse_args()
+
+	logging.getLogger("octoprint.plugins.flashforge").setLevel(logging.INFO)
+	# nothing must change the switch behind the benchmark's back
+	logswitch.DebugSwitch.CHECK_INTERVAL = float("inf")
+	lines = [line.decode() for line in hotpath.moves(args.count)]
+
+	unguarded = stream(lines, args.repeat, False)
+	guarded = stream(lines, args.repeat, True)
+	print("debug messages built and discarded {:8.2f} us/line".format(unguarded * 1e6))
+	print("debug switch off                   {:8.2f} us/line".format(guarded * 1e6))
+	print("saving                             {:8.2f} us/line ({:.1%})".format(
+		(unguarded - guarded) * 1e6, (unguarded - guarded) / unguarded))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""
+Micro-benchmark for the noG91 relative to absolute G0/G1 translation in FlashForge.write()
+
+Compares the lookahead regex previously used by write() against the single pass tokenizer in
+octoprint_flashforge.gcode using the moves from a real sliced file:
+
+	python benchmarks/g1_translate.py path/to/file.gcode
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import sys
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from octoprint_flashforge.gcode import absolute_move
+
+
+regex_g1 = re.compile(
+	b"G[01](?=.* X(?P<X>-?[0-9.]+))?(?=.* Y(?P<Y>-?[0-9.]+))?(?=.* Z(?P<Z>-?[0-9.]+))?(?=.* E(?P<E>-?[0-9.]+))?(?=.* F(?P<F>[0-9.]+))?")
+
+
+def regex_move(line, pos, extruder):
+	"""The translation as it was done in write() before the tokenizer"""
+	match = regex_g1.search(line)
+	data = line
+	if match:
+		data = b"G1"
+		for k, v in match.groupdict().items():
+			if v != None:
+				if k in ['X', 'Y', 'Z']:
+					v = pos[k] + float(v)
+					data += b" %s%06.4f" % (k.encode(), v)
+				elif k == 'E':
+					v = pos[extruder] + float(v)
+					data += b" %s%06.4f" % (k.encode(), v)
+				else:
+					v = int(float(v))
+					data += b" %s%d" % (k.encode(), v)
+	return data
+
+
+def load_moves(path):
+	moves = []
+	with open(path, "rb") as f:
+		for line in f:
+			# what write() sees: comments already stripped by OctoPrint
+			line = line.split(b";", 1)[0].strip()
+			if line.startswith(b"G0 ") or line.startswith(b"G1 "):
+				moves.append(line)
+	return moves
+
+
+def run(translate, moves, repeat):
+	pos = {"X": 0.0, "Y": 0.0, "Z": 0.0, "E0": 0.0, "E1": 0.0}
+	best = None
+	for i in range(repeat):
+		start = timer()
+		for line in moves:
+			translate(line, pos, "E0")
+		elapsed = timer() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return len(moves) / best
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("file", help="sliced g-code file")
+	parser.add_argument("--repeat", type=int, default=5, help="number of runs, best is reported")
+	args = parser.parse_args()
+
+	moves = load_moves(args.file)
+	if not moves:
+		print("no G0/G1 moves found in {}".format(args.file))
+		return 1
+
+	before = run(regex_move, moves, args.repeat)
+	after = run(absolute_move, moves, args.repeat)
+	print("{} G0/G1 moves".format(len(moves)))
+	print("regex     : {:12,.0f} lines/s".format(before))
+	print("tokenizer : {:12,.0f} lines/s ({:.1f}x)".format(after, after / before))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
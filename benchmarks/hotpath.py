@@ -0,0 +1,315 @@
+# coding=utf-8
+"""
+Benchmarks for the hot paths of the transport and translation layers
+
+Runs against the software printer emulator so no hardware is needed:
+
+	write            FlashForge.write() of G0/G1 moves (lines/s)
+	write_noG91      the same with relative moves translated to absolute (lines/s)
+	parse_response   _parse_response() of a recorded mix of printer responses (responses/s)
+	readline         readline() of buffered response lines (lines/s)
+	roundtrip        write() + readline() until ok against a zero latency printer (commands/s)
+	rewrite_gcode    FlashForgePlugin.rewrite_gcode() over a mix of OctoPrint commands (commands/s)
+	upload           SD upload over the command endpoints (MB/s)
+	upload_async     SD upload with 4 queued USB writes over dedicated SD endpoints (MB/s)
+
+Results can be saved as JSON and later runs compared against them, the exit status is 1 if anything got slower by
+more than the tolerance:
+
+	python benchmarks/hotpath.py --json baseline.json
+	python benchmarks/hotpath.py --baseline baseline.json --tolerance 0.15
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+from timeit import default_timer as timer
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from octoprint_flashforge import rules
+from octoprint_flashforge.emulator import EmulatedContext, EmulatedPrinter
+from octoprint_flashforge.flashforge import FlashForge
+from octoprint_flashforge.tracing import Tracer
+
+RESULTS_VERSION = 1
+
+RESPONSES = [
+	b"CMD M105 Received.\r\nT0:210 /210 B:60 /60\r\nok\r\n",
+	b"CMD M119 Received.\r\nEndstop: X-max:1 Y-max:0 Z-max:0\r\nMachineStatus: BUILDING_FROM_SD\r\nMoveMode: MOVING\r\n"
+	b"Status: S:0 L:0 J:0 F:0\r\nLED: 1\r\nCurrentFile: cube.gx\r\nok\r\n",
+	b"CMD G1 Received.\r\nok\r\n",
+	b"CMD G1 Received.\r\n",
+	b"ok\r\n",
+	b"CMD M27 Received.\r\nSD printing byte 12345/987654\r\nok\r\n",
+	b"CMD M114 Received.\r\nX:10.5 Y:20.25 Z:0.3 A:1234.5 B:0\r\nok\r\n",
+	b"CMD M105 Received.\r\nT0:210 /210 B:60 /60\r\nok\r\nCMD G1 Received.\r\nok\r\n",
+]
+""" Responses in roughly the proportions seen while printing """
+
+COMMANDS = [
+	("G1 X10.5 Y20.25 E1.2345", "G1"), ("G1 X11 Y21 E1.3", "G1"), ("G0 X50 Y50 F6000", "G0"),
+	("G1 Z0.3 F1200", "G1"), ("M105", "M105"), ("M106 S0", "M106"), ("M106 S255", "M106"), ("M84", "M84"),
+	("G28", "G28"), ("T1", None), ("M109 S210", "M109"), ("M190 S60", "M190"), ("M20", "M20"), ("G92 E0", "G92"),
+]
+""" Commands queued by OctoPrint, as (cmd, gcode) """
+
+
+class Plugin(object):
+	"""Connection callbacks"""
+
+	def on_connect(self, connection):
+		pass
+
+	def on_disconnect(self, connection):
+		pass
+
+	def on_capabilities(self, connection):
+		pass
+
+	def on_sd_open_failed(self, connection):
+		pass
+
+
+class SinkPrinter(EmulatedPrinter):
+	"""Printer that swallows everything, so only the cost of the connection is measured"""
+
+	def write(self, endpoint, data):
+		pass
+
+
+class Comm(object):
+	"""Enough of OctoPrint's MachineCom for the rewrite rules"""
+
+	def isPrinting(self):
+		return True
+
+	def isCancelling(self):
+		return False
+
+	def isSdFileSelected(self):
+		return False
+
+
+def moves(count):
+	"""G0/G1 moves shaped like sliced g-code"""
+	lines = []
+	for i in range(count):
+		lines.append(b"G1 X%.3f Y%.3f E%.5f" % (100 + (i % 50) * 0.5, 100 + (i % 37) * 0.25, i * 0.03125)
+					 if i % 10 else b"G0 X%.3f Y%.3f F9000" % (120 + (i % 17), 80 + (i % 23)))
+	return lines
+
+
+def connect(printer, **options):
+	context = EmulatedContext([printer])
+	options.setdefault("keep_alive", 3600.0)
+	return FlashForge(Plugin(), None, context, "bench", printer.printer_dict(), read_timeout=1.0, **options)
+
+
+def best_rate(function, repeat):
+	"""Run function() repeat times, it returns the amount of work done, return the best work per second"""
+	best = 0.0
+	for i in range(repeat):
+		start = timer()
+		work = function()
+		elapsed = timer() - start
+		best = max(best, work / max(elapsed, 1e-9))
+	return best
+
+
+def bench_write(repeat, count, noG91=False):
+	connection = connect(SinkPrinter())
+	lines = moves(count)
+	try:
+		connection.disable_G91(noG91)
+		connection.write(b"G91" if noG91 else b"G90")
+
+		def run():
+			write = connection.write
+			for line in lines:
+				write(line)
+			return len(lines)
+		return best_rate(run, repeat)
+	finally:
+		connection.close()
+
+
+def bench_parse_response(repeat, count):
+	connection = connect(SinkPrinter())
+	responses = (RESPONSES * (count // len(RESPONSES) + 1))[:count]
+	try:
+		def run():
+			connection._incoming = queue.Queue()
+			parse = connection._parse_response
+			for response in responses:
+				parse(response)
+			return len(responses)
+		return best_rate(run, repeat)
+	finally:
+		connection.close()
+
+
+def bench_readline(repeat, count):
+	connection = connect(SinkPrinter())
+	response = b"".join(RESPONSES)
+	try:
+		def run():
+			lines = 0
+			connection._incoming = queue.Queue()
+			for i in range(count // 20):
+				connection._parse_response(response)
+			# only the reads are timed
+			start = timer()
+			readline = connection.readline
+			incoming = connection._incoming
+			while not incoming.empty():
+				readline()
+				lines += 1
+			return lines / (timer() - start)
+		return max(run() for i in range(repeat))
+	finally:
+		connection.close()
+
+
+def bench_roundtrip(repeat, count):
+	connection = connect(EmulatedPrinter("dreamer"))
+	try:
+		def run():
+			for i in range(count):
+				connection.write(b"M105")
+				while connection.readline() != b"ok":
+					pass
+			return count
+		return best_rate(run, repeat)
+	finally:
+		connection.close()
+
+
+def bench_rewrite_gcode(repeat, count):
+	from octoprint_flashforge import FlashForgePlugin
+	import logging
+
+	# the plugin needs OctoPrint's settings to be constructed, only set up what rewrite_gcode() uses
+	plugin = FlashForgePlugin.__new__(FlashForgePlugin)
+	plugin._logger = logging.getLogger("octoprint.plugins.flashforge")
+	plugin._pretranslated = None
+	plugin._rules = rules.compile_rules({})
+	plugin._tracer = Tracer()
+	connection = connect(SinkPrinter())
+	plugin._serial_obj = connection
+	comm = Comm()
+	commands = (COMMANDS * (count // len(COMMANDS) + 1))[:count]
+	try:
+		def run():
+			rewrite = plugin.rewrite_gcode
+			for cmd, gcode in commands:
+				rewrite(comm, "queuing", cmd, None, gcode)
+			return len(commands)
+		return best_rate(run, repeat)
+	finally:
+		connection.close()
+
+
+def bench_upload(repeat, size, model, **options):
+	printer = EmulatedPrinter(model)
+	connection = connect(printer, **options)
+	data = bytes(bytearray(i & 0xff for i in range(size)))
+	try:
+		best = 0.0
+		for i in range(repeat):
+			# sd_upload() returns the time taken by the data transfer alone
+			elapsed = connection.sd_upload(io.BytesIO(data), size, "bench.gx")
+			best = max(best, size / 1e6 / max(elapsed, 1e-9))
+		if printer.sd_card.get("bench.gx") != data:
+			raise RuntimeError("uploaded file does not match")
+		return best
+	finally:
+		connection.close()
+
+
+BENCHMARKS = [
+	("write", "lines/s", lambda a: bench_write(a.repeat, a.count)),
+	("write_noG91", "lines/s", lambda a: bench_write(a.repeat, a.count, noG91=True)),
+	("parse_response", "responses/s", lambda a: bench_parse_response(a.repeat, a.count)),
+	("readline", "lines/s", lambda a: bench_readline(a.repeat, a.count)),
+	("roundtrip", "commands/s", lambda a: bench_roundtrip(a.repeat, a.count // 10)),
+	("rewrite_gcode", "commands/s", lambda a: bench_rewrite_gcode(a.repeat, a.count)),
+	("upload", "MB/s", lambda a: bench_upload(a.repeat, a.upload_size, "dreamer")),
+	("upload_async", "MB/s", lambda a: bench_upload(a.repeat, a.upload_size, "guider2", upload_transfers=4)),
+]
+
+
+def compare(results, baseline, tolerance):
+	"""Print the change from the baseline for each benchmark, return the names of the ones that regressed"""
+	regressed = []
+	for name, result in sorted(results.items()):
+		base = baseline.get("results", {}).get(name)
+		if not base:
+			print("{:16} {:>14,.1f} {:12} (no baseline)".format(name, result["value"], result["unit"]))
+			continue
+		change = (result["value"] - base["value"]) / base["value"]
+		flag = ""
+		if change < -tolerance:
+			flag = "  REGRESSION"
+			regressed.append(name)
+		print("{:16} {:>14,.1f} {:12} baseline {:>14,.1f} {:+7.1%}{}".format(
+			name, result["value"], result["unit"], base["value"], change, flag))
+	return regressed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("benchmarks", nargs="*", help="benchmarks to run (default all)")
+	parser.add_argument("--repeat", type=int, default=5, help="number of runs of each benchmark, best is reported")
+	parser.add_argument("--count", type=int, default=20000, help="commands/responses per run")
+	parser.add_argument("--upload-size", type=int, default=4 * 1024 * 1024, help="bytes per upload")
+	parser.add_argument("--json", help="write the results to this file")
+	parser.add_argument("--baseline", help="compare against results saved with --json")
+	parser.add_argument("--tolerance", type=float, default=0.15, help="slowdown (fraction) counted as a regression")
+	args = parser.parse_args()
+
+	unknown = set(args.benchmarks) - set(name for name, unit, run in BENCHMARKS)
+	if unknown:
+		parser.error("unknown benchmark {}".format(", ".join(sorted(unknown))))
+
+	results = {}
+	for name, unit, run in BENCHMARKS:
+		if args.benchmarks and name not in args.benchmarks:
+			continue
+		results[name] = {"value": run(args), "unit": unit}
+		if not args.baseline:
+			print("{:16} {:>14,.1f} {}".format(name, results[name]["value"], unit))
+
+	if args.json:
+		with io.open(args.json, "w", encoding="utf-8") as f:
+			f.write(u"{}".format(json.dumps({
+				"version": RESULTS_VERSION,
+				"python": platform.python_version(),
+				"platform": platform.platform(),
+				"settings": {"repeat": args.repeat, "count": args.count, "upload_size": args.upload_size},
+				"results": results}, indent=2, sort_keys=True)))
+
+	if args.baseline:
+		with io.open(args.baseline, "r", encoding="utf-8") as f:
+			baseline = json.load(f)
+		if baseline.get("version") != RESULTS_VERSION:
+			print("baseline {} has an unsupported version".format(args.baseline))
+			return 2
+		regressed = compare(results, baseline, args.tolerance)
+		if regressed:
+			print("{} benchmark(s) regressed by more than {:.0%}: {}".format(
+				len(regressed), args.tolerance, ", ".join(regressed)))
+			return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
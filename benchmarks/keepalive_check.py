@@ -0,0 +1,80 @@
+# coding=utf-8
+"""
+Check that keep alive polls hold the connection to an idle printer with a short idle limit
+
+Connects to an emulated Dremel 3D20, which stops answering if nothing is written for longer than its idle limit, using
+the keep alive setting of the plugin's own printer profile, and leaves the connection idle. The printer must still
+answer at the end and have been polled throughout:
+
+	python benchmarks/keepalive_check.py [--idle 8] [--io-thread]
+
+The exit status is 1 if the printer dropped the connection.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from octoprint_flashforge.emulator import MODELS, EmulatedContext, EmulatedPrinter
+from octoprint_flashforge.flashforge import FlashForge
+
+DREMEL_3D20 = (0x2a89, 0x8889)
+
+
+class Plugin(object):
+	"""Connection callbacks"""
+
+	def on_connect(self, connection):
+		pass
+
+	def on_disconnect(self, connection):
+		pass
+
+	def on_capabilities(self, connection):
+		pass
+
+	def on_sd_open_failed(self, connection):
+		pass
+
+
+def profile_keep_alive():
+	"""Return the keep alive limit (s) of the 3D20 plugin profile, the emulator's limit if OctoPrint is missing"""
+	try:
+		from octoprint_flashforge import FlashForgePlugin
+	except ImportError:
+		return MODELS["3d20"]["keep_alive"]
+	vid, pid = DREMEL_3D20
+	return FlashForgePlugin.PRINTER_PROFILES[vid][pid]["keepAlive"]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--idle", type=float, default=8.0, help="time (s) to leave the connection idle")
+	parser.add_argument("--io-thread", action="store_true", help="do the USB I/O on a connection owned thread")
+	args = parser.parse_args()
+
+	keep_alive = profile_keep_alive()
+	printer = EmulatedPrinter("3d20")
+	connection = FlashForge(Plugin(), None, EmulatedContext([printer]), "check", printer.printer_dict(),
+							read_timeout=0.5, keep_alive=keep_alive, io_thread=args.io_thread)
+	try:
+		connection.write(b"M601 S1")
+		while connection.readline():
+			pass
+		polled = len(printer.commands)
+		time.sleep(args.idle)
+		polls = len(printer.commands) - polled
+		ok, response = connection.sendcommand(b"M105", 1000)
+	finally:
+		connection.close()
+
+	print("3D20 idle limit {}s, {} polls in {}s idle, {}".format(
+		keep_alive, polls, args.idle, "still connected" if ok else "DROPPED"))
+	return 0 if ok and polls else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,107 @@
+# coding=utf-8
+"""
+Check the g-code minifier against a corpus of sliced files
+
+Each file is minified and both versions are run through a simple motion simulator. The sequence of moves (target
+position and feed rate) must match to within the minifier's resolution. Reports the bytes saved and throughput:
+
+	python benchmarks/minify_check.py [path/to/*.gcode]
+
+Without files it checks the small Cura, PrusaSlicer, Simplify3D and FlashPrint outputs in benchmarks/samples.
+"""
+from __future__ import print_function
+
+import argparse
+import glob
+import io
+import os
+import sys
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from octoprint_flashforge.gcode import regex_word
+from octoprint_flashforge.minify import Minifier, minify_file
+
+AXES = (b"X", b"Y", b"Z", b"E")
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+def simulate(lines):
+	"""Return the list of (X, Y, Z, E, F) after each G0/G1 that moves"""
+
+	pos = dict((axis, 0.0) for axis in AXES)
+	feed = 0.0
+	absolute = absolute_e = True
+	moves = []
+	for line in lines:
+		cmd = line.split(b";", 1)[0].strip()
+		if not cmd:
+			continue
+		gcode = cmd.split(b" ", 1)[0]
+		words = regex_word.findall(cmd[len(gcode):])
+		if gcode in (b"G0", b"G1"):
+			moved = False
+			for letter, value in words:
+				value = float(value)
+				if letter == b"F":
+					feed = value
+				elif letter in pos:
+					if absolute_e if letter == b"E" else absolute:
+						moved = moved or value != pos[letter]
+						pos[letter] = value
+					else:
+						moved = moved or value != 0.0
+						pos[letter] += value
+			if moved:
+				moves.append((pos[b"X"], pos[b"Y"], pos[b"Z"], pos[b"E"], feed))
+		elif gcode == b"G90":
+			absolute = absolute_e = True
+		elif gcode == b"G91":
+			absolute = absolute_e = False
+		elif gcode == b"M82":
+			absolute_e = True
+		elif gcode == b"M83":
+			absolute_e = False
+		elif gcode == b"G92":
+			for letter, value in words or [(axis, b"0") for axis in AXES]:
+				if letter in pos:
+					pos[letter] = float(value)
+	return moves
+
+
+def equivalent(original, minified):
+	"""Return None if the move sequences match or a description of the first difference"""
+
+	tolerance = (0.5 * 10 ** -Minifier.AXIS_DECIMALS,) * 3 + (0.5 * 10 ** -Minifier.EXTRUDER_DECIMALS, 0.5)
+	if len(original) != len(minified):
+		return "{} moves, minified has {}".format(len(original), len(minified))
+	for i, (a, b) in enumerate(zip(original, minified)):
+		for v, w, t in zip(a, b, tolerance):
+			if abs(v - w) > t + 1e-9:
+				return "move {}: {} != {}".format(i, a, b)
+	return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("files", nargs="*", help="sliced g-code files (default: the files in benchmarks/samples)")
+	args = parser.parse_args()
+
+	failed = 0
+	for path in args.files or sorted(glob.glob(os.path.join(SAMPLES, "*.gcode"))):
+		with open(path, "rb") as f:
+			lines = f.readlines()
+		minified = io.BytesIO()
+		start = timer()
+		bytes_in, bytes_out = minify_file(iter(lines), minified)
+		elapsed = timer() - start
+		problem = equivalent(simulate(lines), simulate(minified.getvalue().splitlines()))
+		print("{}: {:,} -> {:,} bytes ({:.1f}% saved), {:,.0f} lines/s, {}".format(
+			path, bytes_in, bytes_out, 100.0 * (bytes_in - bytes_out) / max(bytes_in, 1), len(lines) / max(elapsed, 1e-9),
+			"motion equivalent" if problem is None else "MISMATCH " + problem))
+		failed += problem is not None
+	return 1 if failed else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
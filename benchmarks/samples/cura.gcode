@@ -0,0 +1,179 @@
+;FLAVOR:Marlin
+;TIME:431
+;Filament used: 0.41m
+;Layer height: 0.2
+;Generated with Cura_SteamEngine 4.8.0
+M140 S60
+M105
+M190 S60
+M104 S210
+M105
+M109 S210
+M82 ;absolute extrusion mode
+G28 ;Home
+G1 Z15.0 F6000 ;Move the platform down 15mm
+;Prime the extruder
+G92 E0
+G1 F200 E3
+G92 E0
+G92 E0
+G1 F1500 E-6.5
+;LAYER_COUNT:4
+;LAYER:0
+G0 F3600 X90.200 Y90.200 Z0.3
+;TYPE:WALL-OUTER
+G1 F1500 E0
+G1 F1200 X109.800 Y90.200 E0.73339
+G1 F1200 X109.800 Y109.800 E1.46677
+G1 F1200 X90.200 Y109.800 E2.20016
+G1 F1200 X90.200 Y90.200 E2.93354
+G0 F3600 X90.600 Y90.600
+;TYPE:WALL-INNER
+G1 F1200 X109.400 Y90.600 E3.63700
+G1 F1200 X109.400 Y109.400 E4.34045
+G1 F1200 X90.600 Y109.400 E5.04390
+G1 F1200 X90.600 Y90.600 E5.74735
+;TYPE:FILL
+G0 F3600 X91.200 Y91.200
+G1 F1800 X108.800 Y91.200 E6.40590
+G0 F3600 X108.800 Y93.200
+G1 F1800 X91.200 Y93.200 E7.06445
+G0 F3600 X91.200 Y95.200
+G1 F1800 X108.800 Y95.200 E7.72300
+G0 F3600 X108.800 Y97.200
+G1 F1800 X91.200 Y97.200 E8.38155
+G0 F3600 X91.200 Y99.200
+G1 F1800 X108.800 Y99.200 E9.04010
+G0 F3600 X108.800 Y101.200
+G1 F1800 X91.200 Y101.200 E9.69866
+G0 F3600 X91.200 Y103.200
+G1 F1800 X108.800 Y103.200 E10.35721
+G0 F3600 X108.800 Y105.200
+G1 F1800 X91.200 Y105.200 E11.01576
+G0 F3600 X91.200 Y107.200
+G1 F1800 X108.800 Y107.200 E11.67431
+G1 F1500 E5.17431
+;MESH:NONMESH
+;TIME_ELAPSED:100.000000
+;LAYER:1
+M106 S255
+G0 F3600 X90.200 Y90.200 Z0.5
+;TYPE:WALL-OUTER
+G1 F1200 X109.800 Y90.200 E5.90769
+G1 F1200 X109.800 Y109.800 E6.64108
+G1 F1200 X90.200 Y109.800 E7.37447
+G1 F1200 X90.200 Y90.200 E8.10785
+G0 F3600 X90.600 Y90.600
+;TYPE:WALL-INNER
+G1 F1200 X109.400 Y90.600 E8.81130
+G1 F1200 X109.400 Y109.400 E9.51476
+G1 F1200 X90.600 Y109.400 E10.21821
+G1 F1200 X90.600 Y90.600 E10.92166
+;TYPE:FILL
+G0 F3600 X91.200 Y91.200
+G1 F1800 X91.200 Y108.800 E11.58021
+G0 F3600 X93.200 Y108.800
+G1 F1800 X93.200 Y91.200 E12.23876
+G0 F3600 X95.200 Y91.200
+G1 F1800 X95.200 Y108.800 E12.89731
+G0 F3600 X97.200 Y108.800
+G1 F1800 X97.200 Y91.200 E13.55586
+G0 F3600 X99.200 Y91.200
+G1 F1800 X99.200 Y108.800 E14.21441
+G0 F3600 X101.200 Y108.800
+G1 F1800 X101.200 Y91.200 E14.87296
+G0 F3600 X103.200 Y91.200
+G1 F1800 X103.200 Y108.800 E15.53151
+G0 F3600 X105.200 Y108.800
+G1 F1800 X105.200 Y91.200 E16.19006
+G0 F3600 X107.200 Y91.200
+G1 F1800 X107.200 Y108.800 E16.84861
+G1 F1500 E10.34861
+;MESH:NONMESH
+;TIME_ELAPSED:200.000000
+;LAYER:2
+G0 F3600 X90.200 Y90.200 Z0.7
+;TYPE:WALL-OUTER
+G1 F1200 X109.800 Y90.200 E11.08200
+G1 F1200 X109.800 Y109.800 E11.81539
+G1 F1200 X90.200 Y109.800 E12.54877
+G1 F1200 X90.200 Y90.200 E13.28216
+G0 F3600 X90.600 Y90.600
+;TYPE:WALL-INNER
+G1 F1200 X109.400 Y90.600 E13.98561
+G1 F1200 X109.400 Y109.400 E14.68906
+G1 F1200 X90.600 Y109.400 E15.39251
+G1 F1200 X90.600 Y90.600 E16.09597
+;TYPE:FILL
+G0 F3600 X91.200 Y91.200
+G1 F1800 X108.800 Y91.200 E16.75452
+G0 F3600 X108.800 Y93.200
+G1 F1800 X91.200 Y93.200 E17.41307
+G0 F3600 X91.200 Y95.200
+G1 F1800 X108.800 Y95.200 E18.07162
+G0 F3600 X108.800 Y97.200
+G1 F1800 X91.200 Y97.200 E18.73017
+G0 F3600 X91.200 Y99.200
+G1 F1800 X108.800 Y99.200 E19.38872
+G0 F3600 X108.800 Y101.200
+G1 F1800 X91.200 Y101.200 E20.04727
+G0 F3600 X91.200 Y103.200
+G1 F1800 X108.800 Y103.200 E20.70582
+G0 F3600 X108.800 Y105.200
+G1 F1800 X91.200 Y105.200 E21.36437
+G0 F3600 X91.200 Y107.200
+G1 F1800 X108.800 Y107.200 E22.02292
+G1 F1500 E15.52292
+;MESH:NONMESH
+;TIME_ELAPSED:300.000000
+;LAYER:3
+G0 F3600 X90.200 Y90.200 Z0.9
+;TYPE:WALL-OUTER
+G1 F1200 X109.800 Y90.200 E16.25631
+G1 F1200 X109.800 Y109.800 E16.98969
+G1 F1200 X90.200 Y109.800 E17.72308
+G1 F1200 X90.200 Y90.200 E18.45647
+G0 F3600 X90.600 Y90.600
+;TYPE:WALL-INNER
+G1 F1200 X109.400 Y90.600 E19.15992
+G1 F1200 X109.400 Y109.400 E19.86337
+G1 F1200 X90.600 Y109.400 E20.56682
+G1 F1200 X90.600 Y90.600 E21.27027
+;TYPE:FILL
+G0 F3600 X91.200 Y91.200
+G1 F1800 X91.200 Y108.800 E21.92882
+G0 F3600 X93.200 Y108.800
+G1 F1800 X93.200 Y91.200 E22.58737
+G0 F3600 X95.200 Y91.200
+G1 F1800 X95.200 Y108.800 E23.24593
+G0 F3600 X97.200 Y108.800
+G1 F1800 X97.200 Y91.200 E23.90448
+G0 F3600 X99.200 Y91.200
+G1 F1800 X99.200 Y108.800 E24.56303
+G0 F3600 X101.200 Y108.800
+G1 F1800 X101.200 Y91.200 E25.22158
+G0 F3600 X103.200 Y91.200
+G1 F1800 X103.200 Y108.800 E25.88013
+G0 F3600 X105.200 Y108.800
+G1 F1800 X105.200 Y91.200 E26.53868
+G0 F3600 X107.200 Y91.200
+G1 F1800 X107.200 Y108.800 E27.19723
+G1 F1500 E20.69723
+;MESH:NONMESH
+;TIME_ELAPSED:400.000000
+M140 S0
+M107
+G91 ;Relative positioning
+G1 E-2 F2700 ;Retract a bit
+G1 E-2 Z0.2 F2400 ;Retract and raise Z
+G1 X5 Y5 F3000 ;Wipe out
+G1 Z10 ;Raise Z more
+G90 ;Absolute positioning
+G1 X0 Y200 ;Present print
+M106 S0 ;Turn-off fan
+M104 S0 ;Turn-off hotend
+M140 S0 ;Turn-off bed
+M84 X Y E ;Disable all steppers but Z
+M82 ;absolute extrusion mode
+M104 S0
+;End of Gcode
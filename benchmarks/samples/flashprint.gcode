@@ -0,0 +1,166 @@
+;generated by ffslicer
+;machine_type: Creator Pro
+;right_extruder_temperature: 210
+;platform_temperature: 60
+;layer_height: 0.2
+;base_print_speed: 60
+;travel_speed: 80
+;start gcode
+M118 X19.00 Y11.00 Z0.00 T0
+M140 S60 T0
+M104 S210 T0
+M104 S0 T1
+M107
+G90
+G28
+M132 X Y Z A B
+G1 Z50.000 F420
+G161 X Y F3300
+M7 T0
+M6 T0
+M651
+M907 X100 Y100 Z40 A80 B20
+M108 T0
+;end start gcode
+T0
+;layer:0.2
+G1 Z0.200 F420
+G1 X-9.800 Y-9.800 F4800
+G1 X9.800 Y-9.800 F1800 A0.73339
+G1 X9.800 Y9.800 F1800 A1.46677
+G1 X-9.800 Y9.800 F1800 A2.20016
+G1 X-9.800 Y-9.800 F1800 A2.93354
+G1 X-9.400 Y-9.400 F4800
+G1 A2.93354 F1800
+G1 X9.400 Y-9.400 F1800 A3.63700
+G1 X9.400 Y9.400 F1800 A4.34045
+G1 X-9.400 Y9.400 F1800 A5.04390
+G1 X-9.400 Y-9.400 F1800 A5.74735
+G1 X-8.800 Y-8.800 F4800
+G1 X8.800 Y-8.800 F2400 A6.40590
+G1 X8.800 Y-6.800 F4800
+G1 X-8.800 Y-6.800 F2400 A7.06445
+G1 X-8.800 Y-4.800 F4800
+G1 X8.800 Y-4.800 F2400 A7.72300
+G1 X8.800 Y-2.800 F4800
+G1 X-8.800 Y-2.800 F2400 A8.38155
+G1 X-8.800 Y-0.800 F4800
+G1 X8.800 Y-0.800 F2400 A9.04010
+G1 X8.800 Y1.200 F4800
+G1 X-8.800 Y1.200 F2400 A9.69866
+G1 X-8.800 Y3.200 F4800
+G1 X8.800 Y3.200 F2400 A10.35721
+G1 X8.800 Y5.200 F4800
+G1 X-8.800 Y5.200 F2400 A11.01576
+G1 X-8.800 Y7.200 F4800
+G1 X8.800 Y7.200 F2400 A11.67431
+G1 F1800 A10.37431
+;layer:0.2
+G1 Z0.400 F420
+G1 X-9.800 Y-9.800 F4800
+G1 A10.37431 F1800
+G1 X9.800 Y-9.800 F1800 A11.10769
+G1 X9.800 Y9.800 F1800 A11.84108
+G1 X-9.800 Y9.800 F1800 A12.57447
+G1 X-9.800 Y-9.800 F1800 A13.30785
+G1 X-9.400 Y-9.400 F4800
+G1 A13.30785 F1800
+G1 X9.400 Y-9.400 F1800 A14.01130
+G1 X9.400 Y9.400 F1800 A14.71476
+G1 X-9.400 Y9.400 F1800 A15.41821
+G1 X-9.400 Y-9.400 F1800 A16.12166
+G1 X-8.800 Y-8.800 F4800
+G1 X-8.800 Y8.800 F2400 A16.78021
+G1 X-6.800 Y8.800 F4800
+G1 X-6.800 Y-8.800 F2400 A17.43876
+G1 X-4.800 Y-8.800 F4800
+G1 X-4.800 Y8.800 F2400 A18.09731
+G1 X-2.800 Y8.800 F4800
+G1 X-2.800 Y-8.800 F2400 A18.75586
+G1 X-0.800 Y-8.800 F4800
+G1 X-0.800 Y8.800 F2400 A19.41441
+G1 X1.200 Y8.800 F4800
+G1 X1.200 Y-8.800 F2400 A20.07296
+G1 X3.200 Y-8.800 F4800
+G1 X3.200 Y8.800 F2400 A20.73151
+G1 X5.200 Y8.800 F4800
+G1 X5.200 Y-8.800 F2400 A21.39006
+G1 X7.200 Y-8.800 F4800
+G1 X7.200 Y8.800 F2400 A22.04861
+G1 F1800 A20.74861
+;layer:0.2
+G1 Z0.600 F420
+G1 X-9.800 Y-9.800 F4800
+G1 A20.74861 F1800
+G1 X9.800 Y-9.800 F1800 A21.48200
+G1 X9.800 Y9.800 F1800 A22.21539
+G1 X-9.800 Y9.800 F1800 A22.94877
+G1 X-9.800 Y-9.800 F1800 A23.68216
+G1 X-9.400 Y-9.400 F4800
+G1 A23.68216 F1800
+G1 X9.400 Y-9.400 F1800 A24.38561
+G1 X9.400 Y9.400 F1800 A25.08906
+G1 X-9.400 Y9.400 F1800 A25.79251
+G1 X-9.400 Y-9.400 F1800 A26.49597
+G1 X-8.800 Y-8.800 F4800
+G1 X8.800 Y-8.800 F2400 A27.15452
+G1 X8.800 Y-6.800 F4800
+G1 X-8.800 Y-6.800 F2400 A27.81307
+G1 X-8.800 Y-4.800 F4800
+G1 X8.800 Y-4.800 F2400 A28.47162
+G1 X8.800 Y-2.800 F4800
+G1 X-8.800 Y-2.800 F2400 A29.13017
+G1 X-8.800 Y-0.800 F4800
+G1 X8.800 Y-0.800 F2400 A29.78872
+G1 X8.800 Y1.200 F4800
+G1 X-8.800 Y1.200 F2400 A30.44727
+G1 X-8.800 Y3.200 F4800
+G1 X8.800 Y3.200 F2400 A31.10582
+G1 X8.800 Y5.200 F4800
+G1 X-8.800 Y5.200 F2400 A31.76437
+G1 X-8.800 Y7.200 F4800
+G1 X8.800 Y7.200 F2400 A32.42292
+G1 F1800 A31.12292
+;layer:0.2
+G1 Z0.800 F420
+G1 X-9.800 Y-9.800 F4800
+G1 A31.12292 F1800
+G1 X9.800 Y-9.800 F1800 A31.85631
+G1 X9.800 Y9.800 F1800 A32.58969
+G1 X-9.800 Y9.800 F1800 A33.32308
+G1 X-9.800 Y-9.800 F1800 A34.05647
+G1 X-9.400 Y-9.400 F4800
+G1 A34.05647 F1800
+G1 X9.400 Y-9.400 F1800 A34.75992
+G1 X9.400 Y9.400 F1800 A35.46337
+G1 X-9.400 Y9.400 F1800 A36.16682
+G1 X-9.400 Y-9.400 F1800 A36.87027
+G1 X-8.800 Y-8.800 F4800
+G1 X-8.800 Y8.800 F2400 A37.52882
+G1 X-6.800 Y8.800 F4800
+G1 X-6.800 Y-8.800 F2400 A38.18737
+G1 X-4.800 Y-8.800 F4800
+G1 X-4.800 Y8.800 F2400 A38.84593
+G1 X-2.800 Y8.800 F4800
+G1 X-2.800 Y-8.800 F2400 A39.50448
+G1 X-0.800 Y-8.800 F4800
+G1 X-0.800 Y8.800 F2400 A40.16303
+G1 X1.200 Y8.800 F4800
+G1 X1.200 Y-8.800 F2400 A40.82158
+G1 X3.200 Y-8.800 F4800
+G1 X3.200 Y8.800 F2400 A41.48013
+G1 X5.200 Y8.800 F4800
+G1 X5.200 Y-8.800 F2400 A42.13868
+G1 X7.200 Y-8.800 F4800
+G1 X7.200 Y8.800 F2400 A42.79723
+G1 F1800 A41.49723
+;end gcode
+M107
+M104 S0 T0
+M140 S0 T0
+G162 Z F1800
+G28 X Y
+M132 X Y A B
+M652
+G91
+M18
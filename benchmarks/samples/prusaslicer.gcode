@@ -0,0 +1,186 @@
+; generated by PrusaSlicer 2.3.0+linux-x64 on 2021-03-02 at 18:01:05 UTC
+
+; external perimeters extrusion width = 0.45mm
+; perimeters extrusion width = 0.45mm
+; infill extrusion width = 0.45mm
+
+M73 P0 R7
+M201 X1000 Y1000 Z200 E5000 ; sets maximum accelerations, mm/sec^2
+M203 X200 Y200 Z12 E120 ; sets maximum feedrates, mm/sec
+M204 P1250 R1250 T1250 ; sets acceleration (P, T) and retract acceleration (R), mm/sec^2
+M107
+M190 S60 ; set bed temperature and wait for it to be reached
+M104 S215 ; set temperature
+G28 ; home all axes
+G1 Z5 F5000 ; lift nozzle
+M109 S215 ; set temperature and wait for it to be reached
+G21 ; set units to millimeters
+G90 ; use absolute coordinates
+M83 ; use relative distances for extrusion
+G1 E-.8 F2100
+G1 Z.6 F9000
+G1 X92.8 Y92.8
+G1 Z.2
+G1 E.8 F2100
+;LAYER_CHANGE
+;Z:0.2
+;HEIGHT:0.2
+M73 P0 R7
+G1 X90.600 Y90.600 F9000
+;TYPE:Perimeter
+;WIDTH:0.45
+G1 X109.400 Y90.600 E.70345 F1800
+G1 X109.400 Y109.400 E.70345 F1800
+G1 X90.600 Y109.400 E.70345 F1800
+G1 X90.600 Y90.600 E.70345 F1800
+G1 X90.200 Y90.200 F9000
+;TYPE:External perimeter
+;WIDTH:0.45
+G1 X109.800 Y90.200 E.73339 F1200
+G1 X109.800 Y109.800 E.73339 F1200
+G1 X90.200 Y109.800 E.73339 F1200
+G1 X90.200 Y90.200 E.73339 F1200
+;TYPE:Solid infill
+G1 X91.200 Y91.200 F9000
+G1 X108.800 Y91.200 E.65855 F2400 ; infill
+G1 X108.800 Y93.200 F9000
+G1 X91.200 Y93.200 E.65855 F2400 ; infill
+G1 X91.200 Y95.200 F9000
+G1 X108.800 Y95.200 E.65855 F2400 ; infill
+G1 X108.800 Y97.200 F9000
+G1 X91.200 Y97.200 E.65855 F2400 ; infill
+G1 X91.200 Y99.200 F9000
+G1 X108.800 Y99.200 E.65855 F2400 ; infill
+G1 X108.800 Y101.200 F9000
+G1 X91.200 Y101.200 E.65855 F2400 ; infill
+G1 X91.200 Y103.200 F9000
+G1 X108.800 Y103.200 E.65855 F2400 ; infill
+G1 X108.800 Y105.200 F9000
+G1 X91.200 Y105.200 E.65855 F2400 ; infill
+G1 X91.200 Y107.200 F9000
+G1 X108.800 Y107.200 E.65855 F2400 ; infill
+;LAYER_CHANGE
+;Z:0.4
+;HEIGHT:0.2
+G1 E-.8 F2100
+G1 Z.4 F9000
+M73 P25 R6
+G1 X90.600 Y90.600 F9000
+;TYPE:Perimeter
+;WIDTH:0.45
+G1 X109.400 Y90.600 E.70345 F1800
+G1 X109.400 Y109.400 E.70345 F1800
+G1 X90.600 Y109.400 E.70345 F1800
+G1 X90.600 Y90.600 E.70345 F1800
+G1 X90.200 Y90.200 F9000
+;TYPE:External perimeter
+;WIDTH:0.45
+G1 X109.800 Y90.200 E.73339 F1200
+G1 X109.800 Y109.800 E.73339 F1200
+G1 X90.200 Y109.800 E.73339 F1200
+G1 X90.200 Y90.200 E.73339 F1200
+;TYPE:Solid infill
+G1 X91.200 Y91.200 F9000
+G1 X91.200 Y108.800 E.65855 F2400 ; infill
+G1 X93.200 Y108.800 F9000
+G1 X93.200 Y91.200 E.65855 F2400 ; infill
+G1 X95.200 Y91.200 F9000
+G1 X95.200 Y108.800 E.65855 F2400 ; infill
+G1 X97.200 Y108.800 F9000
+G1 X97.200 Y91.200 E.65855 F2400 ; infill
+G1 X99.200 Y91.200 F9000
+G1 X99.200 Y108.800 E.65855 F2400 ; infill
+G1 X101.200 Y108.800 F9000
+G1 X101.200 Y91.200 E.65855 F2400 ; infill
+G1 X103.200 Y91.200 F9000
+G1 X103.200 Y108.800 E.65855 F2400 ; infill
+G1 X105.200 Y108.800 F9000
+G1 X105.200 Y91.200 E.65855 F2400 ; infill
+G1 X107.200 Y91.200 F9000
+G1 X107.200 Y108.800 E.65855 F2400 ; infill
+;LAYER_CHANGE
+;Z:0.6
+;HEIGHT:0.2
+G1 E-.8 F2100
+G1 Z.6 F9000
+M73 P50 R5
+G1 X90.600 Y90.600 F9000
+;TYPE:Perimeter
+;WIDTH:0.45
+G1 X109.400 Y90.600 E.70345 F1800
+G1 X109.400 Y109.400 E.70345 F1800
+G1 X90.600 Y109.400 E.70345 F1800
+G1 X90.600 Y90.600 E.70345 F1800
+G1 X90.200 Y90.200 F9000
+;TYPE:External perimeter
+;WIDTH:0.45
+G1 X109.800 Y90.200 E.73339 F1200
+G1 X109.800 Y109.800 E.73339 F1200
+G1 X90.200 Y109.800 E.73339 F1200
+G1 X90.200 Y90.200 E.73339 F1200
+;TYPE:Solid infill
+G1 X91.200 Y91.200 F9000
+G1 X108.800 Y91.200 E.65855 F2400 ; infill
+G1 X108.800 Y93.200 F9000
+G1 X91.200 Y93.200 E.65855 F2400 ; infill
+G1 X91.200 Y95.200 F9000
+G1 X108.800 Y95.200 E.65855 F2400 ; infill
+G1 X108.800 Y97.200 F9000
+G1 X91.200 Y97.200 E.65855 F2400 ; infill
+G1 X91.200 Y99.200 F9000
+G1 X108.800 Y99.200 E.65855 F2400 ; infill
+G1 X108.800 Y101.200 F9000
+G1 X91.200 Y101.200 E.65855 F2400 ; infill
+G1 X91.200 Y103.200 F9000
+G1 X108.800 Y103.200 E.65855 F2400 ; infill
+G1 X108.800 Y105.200 F9000
+G1 X91.200 Y105.200 E.65855 F2400 ; infill
+G1 X91.200 Y107.200 F9000
+G1 X108.800 Y107.200 E.65855 F2400 ; infill
+;LAYER_CHANGE
+;Z:0.8
+;HEIGHT:0.2
+G1 E-.8 F2100
+G1 Z.8 F9000
+M73 P75 R4
+G1 X90.600 Y90.600 F9000
+;TYPE:Perimeter
+;WIDTH:0.45
+G1 X109.400 Y90.600 E.70345 F1800
+G1 X109.400 Y109.400 E.70345 F1800
+G1 X90.600 Y109.400 E.70345 F1800
+G1 X90.600 Y90.600 E.70345 F1800
+G1 X90.200 Y90.200 F9000
+;TYPE:External perimeter
+;WIDTH:0.45
+G1 X109.800 Y90.200 E.73339 F1200
+G1 X109.800 Y109.800 E.73339 F1200
+G1 X90.200 Y109.800 E.73339 F1200
+G1 X90.200 Y90.200 E.73339 F1200
+;TYPE:Solid infill
+G1 X91.200 Y91.200 F9000
+G1 X91.200 Y108.800 E.65855 F2400 ; infill
+G1 X93.200 Y108.800 F9000
+G1 X93.200 Y91.200 E.65855 F2400 ; infill
+G1 X95.200 Y91.200 F9000
+G1 X95.200 Y108.800 E.65855 F2400 ; infill
+G1 X97.200 Y108.800 F9000
+G1 X97.200 Y91.200 E.65855 F2400 ; infill
+G1 X99.200 Y91.200 F9000
+G1 X99.200 Y108.800 E.65855 F2400 ; infill
+G1 X101.200 Y108.800 F9000
+G1 X101.200 Y91.200 E.65855 F2400 ; infill
+G1 X103.200 Y91.200 F9000
+G1 X103.200 Y108.800 E.65855 F2400 ; infill
+G1 X105.200 Y108.800 F9000
+G1 X105.200 Y91.200 E.65855 F2400 ; infill
+G1 X107.200 Y91.200 F9000
+G1 X107.200 Y108.800 E.65855 F2400 ; infill
+M107
+G1 E-.8 F2100
+M104 S0 ; turn off temperature
+M140 S0 ; turn off heatbed
+G1 X0 Y200 F3000 ; present print
+M84 ; disable motors
+M73 P100 R0
+; filament used [mm] = 412.35
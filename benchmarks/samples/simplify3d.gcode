@@ -0,0 +1,175 @@
+; G-Code generated by Simplify3D(R) Version 4.1.2
+;   Feb 14, 2021 at 3:12:44 PM
+; Settings Summary
+;   processName,Process1
+;   applyToModels,cube
+;   profileName,FlashForge Creator Pro (modified)
+;   extruderDiameter,0.4
+;   layerHeight,0.2
+G90
+M83
+M106 S0
+M140 S60
+M190 S60
+M104 S210 T0
+M109 S210 T0
+G28 ; home all axes
+G92 E0
+G1 E-1.0000 F1800
+; layer 1, Z = 0.200
+T0
+; tool H0.200 W0.450
+; inner perimeter
+G1 X90.600 Y90.600 F4800
+G1 Z0.200 F1002
+G1 E1.0000 F1800
+G1 X109.400 Y90.600 E0.7035 F1800
+G1 X109.400 Y109.400 E0.7035 F1800
+G1 X90.600 Y109.400 E0.7035 F1800
+G1 X90.600 Y90.600 E0.7035 F1800
+; outer perimeter
+G1 X90.200 Y90.200 F4800
+G1 X109.800 Y90.200 E0.7334 F1800
+G1 X109.800 Y109.800 E0.7334 F1800
+G1 X90.200 Y109.800 E0.7334 F1800
+G1 X90.200 Y90.200 E0.7334 F1800
+; solid layer
+G1 X91.200 Y91.200 F4800
+G1 X108.800 Y91.200 E0.6586 F2400
+G1 X108.800 Y93.200 F4800
+G1 X91.200 Y93.200 E0.6586 F2400
+G1 X91.200 Y95.200 F4800
+G1 X108.800 Y95.200 E0.6586 F2400
+G1 X108.800 Y97.200 F4800
+G1 X91.200 Y97.200 E0.6586 F2400
+G1 X91.200 Y99.200 F4800
+G1 X108.800 Y99.200 E0.6586 F2400
+G1 X108.800 Y101.200 F4800
+G1 X91.200 Y101.200 E0.6586 F2400
+G1 X91.200 Y103.200 F4800
+G1 X108.800 Y103.200 E0.6586 F2400
+G1 X108.800 Y105.200 F4800
+G1 X91.200 Y105.200 E0.6586 F2400
+G1 X91.200 Y107.200 F4800
+G1 X108.800 Y107.200 E0.6586 F2400
+G1 E-1.0000 F1800
+; layer 2, Z = 0.400
+T0
+M106 S255
+; tool H0.200 W0.450
+; inner perimeter
+G1 X90.600 Y90.600 F4800
+G1 Z0.400 F1002
+G1 E1.0000 F1800
+G1 X109.400 Y90.600 E0.7035 F1800
+G1 X109.400 Y109.400 E0.7035 F1800
+G1 X90.600 Y109.400 E0.7035 F1800
+G1 X90.600 Y90.600 E0.7035 F1800
+; outer perimeter
+G1 X90.200 Y90.200 F4800
+G1 X109.800 Y90.200 E0.7334 F1800
+G1 X109.800 Y109.800 E0.7334 F1800
+G1 X90.200 Y109.800 E0.7334 F1800
+G1 X90.200 Y90.200 E0.7334 F1800
+; solid layer
+G1 X91.200 Y91.200 F4800
+G1 X91.200 Y108.800 E0.6586 F2400
+G1 X93.200 Y108.800 F4800
+G1 X93.200 Y91.200 E0.6586 F2400
+G1 X95.200 Y91.200 F4800
+G1 X95.200 Y108.800 E0.6586 F2400
+G1 X97.200 Y108.800 F4800
+G1 X97.200 Y91.200 E0.6586 F2400
+G1 X99.200 Y91.200 F4800
+G1 X99.200 Y108.800 E0.6586 F2400
+G1 X101.200 Y108.800 F4800
+G1 X101.200 Y91.200 E0.6586 F2400
+G1 X103.200 Y91.200 F4800
+G1 X103.200 Y108.800 E0.6586 F2400
+G1 X105.200 Y108.800 F4800
+G1 X105.200 Y91.200 E0.6586 F2400
+G1 X107.200 Y91.200 F4800
+G1 X107.200 Y108.800 E0.6586 F2400
+G1 E-1.0000 F1800
+; layer 3, Z = 0.600
+T0
+; tool H0.200 W0.450
+; inner perimeter
+G1 X90.600 Y90.600 F4800
+G1 Z0.600 F1002
+G1 E1.0000 F1800
+G1 X109.400 Y90.600 E0.7035 F1800
+G1 X109.400 Y109.400 E0.7035 F1800
+G1 X90.600 Y109.400 E0.7035 F1800
+G1 X90.600 Y90.600 E0.7035 F1800
+; outer perimeter
+G1 X90.200 Y90.200 F4800
+G1 X109.800 Y90.200 E0.7334 F1800
+G1 X109.800 Y109.800 E0.7334 F1800
+G1 X90.200 Y109.800 E0.7334 F1800
+G1 X90.200 Y90.200 E0.7334 F1800
+; solid layer
+G1 X91.200 Y91.200 F4800
+G1 X108.800 Y91.200 E0.6586 F2400
+G1 X108.800 Y93.200 F4800
+G1 X91.200 Y93.200 E0.6586 F2400
+G1 X91.200 Y95.200 F4800
+G1 X108.800 Y95.200 E0.6586 F2400
+G1 X108.800 Y97.200 F4800
+G1 X91.200 Y97.200 E0.6586 F2400
+G1 X91.200 Y99.200 F4800
+G1 X108.800 Y99.200 E0.6586 F2400
+G1 X108.800 Y101.200 F4800
+G1 X91.200 Y101.200 E0.6586 F2400
+G1 X91.200 Y103.200 F4800
+G1 X108.800 Y103.200 E0.6586 F2400
+G1 X108.800 Y105.200 F4800
+G1 X91.200 Y105.200 E0.6586 F2400
+G1 X91.200 Y107.200 F4800
+G1 X108.800 Y107.200 E0.6586 F2400
+G1 E-1.0000 F1800
+; layer 4, Z = 0.800
+T0
+; tool H0.200 W0.450
+; inner perimeter
+G1 X90.600 Y90.600 F4800
+G1 Z0.800 F1002
+G1 E1.0000 F1800
+G1 X109.400 Y90.600 E0.7035 F1800
+G1 X109.400 Y109.400 E0.7035 F1800
+G1 X90.600 Y109.400 E0.7035 F1800
+G1 X90.600 Y90.600 E0.7035 F1800
+; outer perimeter
+G1 X90.200 Y90.200 F4800
+G1 X109.800 Y90.200 E0.7334 F1800
+G1 X109.800 Y109.800 E0.7334 F1800
+G1 X90.200 Y109.800 E0.7334 F1800
+G1 X90.200 Y90.200 E0.7334 F1800
+; solid layer
+G1 X91.200 Y91.200 F4800
+G1 X91.200 Y108.800 E0.6586 F2400
+G1 X93.200 Y108.800 F4800
+G1 X93.200 Y91.200 E0.6586 F2400
+G1 X95.200 Y91.200 F4800
+G1 X95.200 Y108.800 E0.6586 F2400
+G1 X97.200 Y108.800 F4800
+G1 X97.200 Y91.200 E0.6586 F2400
+G1 X99.200 Y91.200 F4800
+G1 X99.200 Y108.800 E0.6586 F2400
+G1 X101.200 Y108.800 F4800
+G1 X101.200 Y91.200 E0.6586 F2400
+G1 X103.200 Y91.200 F4800
+G1 X103.200 Y108.800 E0.6586 F2400
+G1 X105.200 Y108.800 F4800
+G1 X105.200 Y91.200 E0.6586 F2400
+G1 X107.200 Y91.200 F4800
+G1 X107.200 Y108.800 E0.6586 F2400
+G1 E-1.0000 F1800
+M104 S0 T0
+M140 S0
+M106 S0
+G28 X0
+M84
+; Build Summary
+;   Build time: 0 hours 6 minutes
+;   Filament length: 412.4 mm (0.41 m)
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""
+Check that an SD upload streams the file rather than holding it in memory
+
+Uploads a large synthetic file (sparse, so it costs no disk space) to an emulated printer with tracemalloc on. The
+peak of the memory allocated during the upload must stay under a fixed ceiling, a few times the upload buffers,
+however big the file is:
+
+	python benchmarks/upload_memory.py [--size 256] [--model dreamer] [--transfers 0]
+
+The exit status is 1 if the peak went over the ceiling or the upload failed. Needs Python 3 (tracemalloc).
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from octoprint_flashforge.emulator import EmulatedContext, EmulatedPrinter
+from octoprint_flashforge.flashforge import FlashForge
+
+CEILING = 64 * 1024
+""" Max bytes allocated at any time during the upload, a few times the upload buffers (one 1 KB chunk per transfer) -
+everything else the upload allocates is per chunk and freed again """
+
+
+class Plugin(object):
+	"""Connection callbacks"""
+
+	def on_connect(self, connection):
+		pass
+
+	def on_disconnect(self, connection):
+		pass
+
+	def on_capabilities(self, connection):
+		pass
+
+	def on_sd_open_failed(self, connection):
+		pass
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--size", type=int, default=256, help="size of the synthetic file (MB)")
+	parser.add_argument("--model", default="dreamer", help="emulated printer model, eg guider2 for SD endpoints")
+	parser.add_argument("--transfers", type=int, default=0, help="asynchronous USB writes to keep queued")
+	parser.add_argument("--ceiling", type=int, default=CEILING, help="max bytes allocated during the upload")
+	args = parser.parse_args()
+
+	size = args.size * 1024 * 1024
+	printer = EmulatedPrinter(args.model, store_uploads=False)
+	connection = FlashForge(Plugin(), None, EmulatedContext([printer]), "check", printer.printer_dict(),
+							read_timeout=0.5, upload_transfers=args.transfers)
+	fd, path = tempfile.mkstemp(suffix=".gx")
+	try:
+		os.ftruncate(fd, size)
+		os.close(fd)
+		connection.write(b"M601 S1")
+		while connection.readline():
+			pass
+		with open(path, "rb") as file:
+			tracemalloc.start()
+			start = timer()
+			try:
+				connection.sd_upload(file, size, "memory.gx")
+				error = None
+			except Exception as exception:
+				error = exception
+			elapsed = timer() - start
+			current, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+	finally:
+		connection.close()
+		os.remove(path)
+
+	print("{}: {} MB in {:.1f}s, peak {:,} bytes allocated (ceiling {:,}), {}".format(
+		args.model, args.size, elapsed, peak, args.ceiling,
+		"upload failed: {}".format(error) if error else "{:,} bytes received".format(printer.uploaded)))
+	return 0 if error is None and printer.uploaded == size and peak <= args.ceiling else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,9 +1,12 @@
 # coding=utf-8
 from __future__ import absolute_import
 
+import json
+import os
+import tempfile
 import threading
 import usb1
-import re
+from timeit import default_timer as timer
 import octoprint.plugin
 from octoprint.settings import default_settings
 from octoprint.util import dict_merge
@@ -12,6 +15,18 @@ import octoprint.settings
 
 
 from . import flashforge
+from . import gcode as gcodes
+from . import minify
+from . import rules
+from .capabilities import CapabilityStore
+from .fleet import Fleet
+from .logswitch import debug
+from .metrics import format_prometheus
+from .pretranslate import PretranslationCache
+from .profiler import SamplingProfiler
+from .recorder import UsbRecorder
+from .sdindex import SdIndex
+from .tracing import Tracer, span
 
 '''
 Special case support:
@@ -24,13 +39,15 @@ G91 (relative positioning) appears not to be supported by Finder 2, Guider 2 (F2
 
 class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 					   octoprint.plugin.AssetPlugin,
-					   octoprint.plugin.TemplatePlugin):
+					   octoprint.plugin.TemplatePlugin,
+					   octoprint.plugin.EventHandlerPlugin,
+					   octoprint.plugin.SimpleApiPlugin):
 	VENDOR_IDS = {0x0315: "PowerSpec", 0x2a89: "Dremel", 0x2b71: "FlashForge"}
 	PRINTER_PROFILES = {
 		0x0315: {
 			0x0001: {"name": "Ultra 3DPrinter (C)"}},  # PowerSpec
 		0x2a89: {
-			0x8889: {"name": "Dremel IdeaBuilder 3D20"}, 0x888d: {"name": "Dremel IdeaBuilder 3D45"}},  # Dremel
+			0x8889: {"name": "Dremel IdeaBuilder 3D20", "keepAlive": 2.0}, 0x888d: {"name": "Dremel IdeaBuilder 3D45"}},  # Dremel
 		0x2b71: {
 			0x0001: {"name": "Dreamer"}, 0x0002: {"name": "Finder v1"},  # FlashForge
 			0x0004: {"name": "Guider II"}, 0x0005: {"name": "Inventor"},
@@ -40,7 +57,10 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 			0x00e7: {"name": "Creator Max"}, 0x00ee: {"name": "Finder v2.12"},
 			0x00f6: {"name": "PowerSpec Ultra 3DPrinter (B)"},
 			0x00ff: {"name": "PowerSpec Ultra 3DPrinter (A)"}}}
-	FILE_PACKET_SIZE = 1024
+	EVENT_UPLOAD_COMPLETE = "plugin_flashforge_upload_complete"
+	""" Event fired after a successful SD upload with the transfer rate (MB/s) in the payload """
+	DYNAMIC_GCODES = ["G91", "M25", "M26", "M110"]
+	""" gcodes where the rewrite depends on the state when they are sent so they can not be pretranslated """
 
 
 	def __init__(self):
@@ -51,9 +71,17 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		self._comm = None
 		self._serial_obj = None
 		self._currentFile = None
-		self._usbcontext = None
+		self._fleet = None
 		self._printers = {}
 		self._printer_profile = {}
+		self._unsupported = ()
+		self._rules = rules.compile_rules(self._printer_profile)
+		self._pretranslated = None
+		self._pretranslate_path = None
+		self._pretranslate_cache = None
+		self._sd_index = None
+		self._tracer = Tracer()
+		self._profiler = None
 		# FlashForge friendly default connection settings
 		self._conn_settings = {
 			'firmwareDetection': False,				# do not try to auto detect firmware
@@ -78,6 +106,14 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		self._logger.info("libusb1: {}".format(usb1.__version__))
 
 
+	def initialize(self):
+		# the data folder is only known once the plugin has been injected
+		self._fleet = Fleet(self, self.VENDOR_IDS,
+							CapabilityStore(os.path.join(self.get_plugin_data_folder(), "capabilities.json")))
+		if self._settings.get_boolean(["trace"]):
+			self._tracer.start(self._settings.get_int(["traceEvents"]))
+
+
 	##~~ SettingsPlugin mixin
 	def get_settings_defaults(self):
 		# add default value ff.noG91 to printer profiles or the setting won't get saved by OctoPrint
@@ -90,7 +126,20 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		# plugin default settings here
 		return dict(
 			ledStatus=1,
-			ledColor=[255, 255, 255]
+			ledColor=[255, 255, 255],
+			asyncUsb=False,		# keep bulk IN transfers in flight using libusb asynchronous I/O
+			ioThread=False,		# do all USB I/O on one thread per printer instead of sharing it between threads with locks
+			pipelineWindow=0,	# number of moves that may be outstanding when printing from OctoPrint, 0 = disabled
+			pretranslate=False,	# run the rewrite rules over a file when it is selected instead of line by line
+			uploadTransfers=0,	# number of asynchronous USB writes to keep queued during SD upload, 0 = synchronous
+			sdDedup=False,		# skip uploading files that are already on the printer SD card
+			sdDedupInvalidate=True,	# forget what is on the SD card when the printer can not open a file
+			minify=False,		# strip comments and redundant words from plain g-code sent to the printer
+			usbCapture=False,	# record the USB traffic of each connection in the data folder (see replay.py)
+			usbCaptureSize=16,	# MB of traffic in each capture file before it is rotated
+			usbCaptureFiles=4,	# number of rotated capture files to keep
+			trace=False,		# record spans for a Chrome trace from startup (can also be started from the API)
+			traceEvents=Tracer.MAX_EVENTS	# number of spans kept in memory for the trace
 		)
 
 
@@ -103,6 +152,65 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		)
 
 
+	##~~ EventHandlerPlugin mixin
+	def on_event(self, event, payload):
+		if event == Events.SETTINGS_UPDATED:
+			# the log level may have been changed
+			debug.refresh()
+		elif event == Events.FILE_SELECTED:
+			self._pretranslated = None
+			self._pretranslate_path = None
+			if self._serial_obj and payload and payload.get("origin") == "local" and \
+				self._settings.get_boolean(["pretranslate"]):
+				path = self._pretranslate_path = self._file_manager.path_on_disk("local", payload["path"])
+				thread = threading.Thread(target=self.pretranslate, args=(path,), name="FlashForge.Pretranslate")
+				thread.daemon = True
+				thread.start()
+		elif event in (Events.FILE_DESELECTED, Events.DISCONNECTED):
+			self._pretranslated = None
+			self._pretranslate_path = None
+		elif event == Events.PRINT_STARTED:
+			minifier = self._serial_obj.minifier if self._serial_obj else None
+			if minifier:
+				minifier.reset()
+		elif event in (Events.PRINT_DONE, Events.PRINT_FAILED, Events.PRINT_CANCELLED):
+			minifier = self._serial_obj.minifier if self._serial_obj else None
+			if minifier and minifier.bytes_in:
+				self._logger.info("Minified {}: saved {} of {} bytes ({:.1f}%)".format(
+					payload.get("name") if payload else "", minifier.saved, minifier.bytes_in,
+					100.0 * minifier.saved / minifier.bytes_in))
+
+
+	def pretranslate(self, path):
+		""" Run the rewrite rules over a file that has been selected for printing directly from OctoPrint
+
+		Lines from the file are then looked up in the result rather than being rewritten one by one during the print.
+		"""
+		if not self._pretranslate_cache:
+			self._pretranslate_cache = PretranslationCache(
+				os.path.join(self.get_plugin_data_folder(), "pretranslated"),
+				lambda cmd, gcode: self._rewrite_command(None, cmd, None, gcode, rules.STATE_PRINTING),
+				self.DYNAMIC_GCODES)
+		flags = dict(
+			noG28XY="noG28XY" in self._printer_profile,
+			noM132="noM132" in self._printer_profile,
+			noG91=self.G91_disabled())
+		flags.update(("drop" + gcode, True) for gcode in self._unsupported)
+		try:
+			pretranslated = self._pretranslate_cache.get(path, flags)
+			if path == self._pretranslate_path:
+				# still the selected file
+				self._pretranslated = pretranslated
+		except (IOError, OSError, TypeError, ValueError) as error:
+			# the print falls back to rewriting each command as it is sent
+			self._logger.info("unable to pretranslate {}: {}".format(path, error))
+
+
+	##~~ Custom events hook
+	def register_custom_events(self, *args, **kwargs):
+		return ["upload_complete"]
+
+
 	##~~ Softwareupdate hook
 	def get_update_information(self):
 		# Plugin specific configuration to use with the Software Update Plugin.
@@ -127,35 +235,36 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 	# Look for a supported printer
 	def detect_printer(self):
 		self._logger.debug("detect_printer()")
-		if self._serial_obj:
-			return self._printers
+		self._printers = self._fleet.detect()
+		return self._printers
 
-		self._printers = {}
-		if not self._usbcontext:
-			self._usbcontext = usb1.USBContext()
-			self._usbcontext.open()
-
-		for device in self._usbcontext.getDeviceIterator(skip_on_error=True):
-			vendor_id = device.getVendorID()
-			device_id = device.getProductID()
-			device_name = 'unknown device'
-			try:
-				# this will typically fail if we don't have permission to access this USB device
-				device_name = device.getProduct()
-			except usb1.USBError as usberror:
-				self._logger.debug('Unable to get device name {}'.format(usberror))
-			self._logger.debug(
-				"Found device '{}' with Vendor ID: {:#06X}, USB ID: {:#06X}".format(device_name, vendor_id,
-																					device_id))
-
-			if vendor_id in self.VENDOR_IDS:
-				# we have a printer of some kind
-				bus = device.getBusNumber()
-				addr = device.getDeviceAddress()
-				device_name += ", port:{}:{}".format(bus, addr)
-				vendor_name = self.VENDOR_IDS[vendor_id]
-				self._logger.info("Found a {} {}".format(vendor_name, device_name))
-				self._printers[device_name] = {'bus': bus, 'addr': addr, 'vid': vendor_id, 'did': device_id}
+
+	def printer_profile(self, printer):
+		"""Return the entry in PRINTER_PROFILES for a printer dict from detect_printer()"""
+		return self.PRINTER_PROFILES.get(printer["vid"], {}).get(printer["did"], {})
+
+
+	def connection_options(self, printer):
+		"""Return the FlashForge connection options for a printer dict from detect_printer()"""
+		return dict(
+			async_io=self._settings.get_boolean(["asyncUsb"]),
+			io_thread=self._settings.get_boolean(["ioThread"]),
+			pipeline=self._settings.get_int(["pipelineWindow"]),
+			keep_alive=self.printer_profile(printer).get("keepAlive", flashforge.FlashForge.KEEP_ALIVE_IDLE),
+			upload_transfers=self._settings.get_int(["uploadTransfers"]),
+			minify=self._settings.get_boolean(["minify"]),
+			recorder=self._recorder(printer),
+			tracer=self._tracer)
+
+
+	def _recorder(self, printer):
+		"""Return a UsbRecorder for a connection to the printer if USB capture is enabled"""
+		if not self._settings.get_boolean(["usbCapture"]):
+			return None
+		path = os.path.join(self.get_plugin_data_folder(), "captures", "{:04x}-{:04x}-{}-{}.ffusb".format(
+			printer["vid"], printer["did"], printer["bus"], printer["addr"]))
+		return UsbRecorder(path, self._settings.get_int(["usbCaptureSize"]) * 1024 * 1024,
+						   self._settings.get_int(["usbCaptureFiles"]))
 
 
 	def printer_factory(self, comm, portname, baudrate, read_timeout, *args, **kwargs):
@@ -168,13 +277,15 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 			return None
 
 		self._comm = comm
-		serial_obj = flashforge.FlashForge(self, comm, self._usbcontext, portname, self._printers[portname],
-										   read_timeout=float(read_timeout))
-		if self._printers[portname]["did"] in self.PRINTER_PROFILES[self._printers[portname]["vid"]]:
-			self._printer_profile = self.PRINTER_PROFILES[self._printers[portname]["vid"]][self._printers[portname]["did"]]
-		else:
-			self._printer_profile = {}
-		return serial_obj
+		self._printer_profile = self.printer_profile(self._printers[portname])
+		connection = self._fleet.connect(portname, comm, read_timeout=float(read_timeout),
+										 **self.connection_options(self._printers[portname]))
+		# commands an earlier connection found this model does not answer are dropped rather than left to time out
+		self._unsupported = tuple(connection.capabilities["unsupported"])
+		if self._unsupported:
+			self._logger.info("dropping unsupported commands {}".format(", ".join(self._unsupported)))
+		self._rules = rules.compile_rules(self._printer_profile, unsupported=self._unsupported)
+		return connection
 
 
 	def get_additional_port_names(self, *args, **kwargs):
@@ -216,6 +327,154 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		self._serial_obj = None
 
 
+	def get_status(self):
+		"""Return the current PrinterStatus snapshot of the connected printer or None if not connected
+
+		Reading the status does not generate any USB traffic so it can be polled at high rates.
+		"""
+		serial_obj = self._serial_obj
+		return serial_obj.status if serial_obj else None
+
+
+	##~~ SimpleApiPlugin mixin
+
+	def get_api_commands(self):
+		return dict(
+			connect=["port"],
+			disconnect=["port"],
+			command=["port", "command"],
+			upload=["port", "path"],
+			trace=["enable"],
+			profile=[],
+			forget_unsupported=[])
+
+
+	def on_api_get(self, request):
+		"""GET /api/plugin/flashforge returns the current status snapshot of the OctoPrint printer and the fleet
+
+		GET /api/plugin/flashforge?metrics returns the metrics of every connection in the Prometheus text format.
+		GET /api/plugin/flashforge?trace returns the spans recorded since tracing was started as a Chrome trace.
+		GET /api/plugin/flashforge?profile returns the stacks sampled by the last profile in the collapsed format.
+		"""
+		import flask
+
+		if "profile" in request.args:
+			profiler = self._profiler
+			response = flask.make_response(profiler.collapsed() if profiler else "")
+			response.headers["Content-Type"] = "text/plain; charset=utf-8"
+			return response
+
+		if "trace" in request.args:
+			response = flask.make_response(json.dumps(self._tracer.export()))
+			response.headers["Content-Type"] = "application/json"
+			response.headers["Content-Disposition"] = "attachment; filename=flashforge-trace.json"
+			return response
+
+		if "metrics" in request.args:
+			connections = []
+			for port in sorted(self._fleet.connected()):
+				connection = self._fleet.connection(port)
+				if connection:
+					connections.append((port, connection.metrics, connection.gauges()))
+			response = flask.make_response(format_prometheus(connections))
+			response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+			return response
+
+		status = self.get_status()
+		connected = self._fleet.connected()
+		fleet = {}
+		for port, printer in self._fleet.printers().items():
+			connection = self._fleet.connection(port)
+			fleet[port] = dict(
+				connected=port in connected,
+				octoprint=bool(connection and connection.is_octoprint_client()),
+				status=connection.status.to_dict() if connection else None)
+		return flask.jsonify(connected=status is not None, status=status.to_dict() if status else None, fleet=fleet)
+
+
+	def on_api_command(self, command, data):
+		"""Fleet management - connect to any detected printer and queue commands and uploads to it
+
+		The trace command starts (enable true) or stops span tracing. The profile command starts sampling the I/O
+		threads for duration seconds (default 30, interval s between samples) or stops it early with stop true. The
+		forget_unsupported command has every printer sent the commands that were learned to be unsupported again.
+		"""
+		import flask
+		from octoprint.access.permissions import Permissions
+
+		if not Permissions.CONTROL.can():
+			return flask.make_response("Insufficient rights", 403)
+
+		if command == "trace":
+			if data["enable"]:
+				self._tracer.start(self._settings.get_int(["traceEvents"]))
+			else:
+				self._tracer.stop()
+			return flask.jsonify(tracing=self._tracer.enabled, spans=len(self._tracer))
+		elif command == "profile":
+			profiler = self._profiler
+			if data.get("stop"):
+				if profiler:
+					profiler.stop()
+			elif not (profiler and profiler.running):
+				profiler = self._profiler = SamplingProfiler(float(data.get("duration", 30.0)),
+															 float(data.get("interval", SamplingProfiler.INTERVAL)))
+				profiler.start()
+			return flask.jsonify(profiler.summary() if profiler else dict(running=False))
+		elif command == "forget_unsupported":
+			self._fleet.forget_unsupported()
+			self._unsupported = ()
+			self._rules = rules.compile_rules(self._printer_profile)
+			return flask.jsonify(unsupported=[])
+
+		port = data["port"]
+		try:
+			if command == "connect":
+				printers = self._fleet.printers()
+				if port not in printers:
+					printers = self.detect_printer()
+				if port not in printers:
+					return flask.make_response("Unknown printer {}".format(port), 404)
+				self._fleet.connect(port, **self.connection_options(printers[port]))
+				return flask.jsonify(connected=True)
+			elif command == "disconnect":
+				self._fleet.disconnect(port)
+				return flask.jsonify(connected=False)
+			elif command == "command":
+				job = self._fleet.command(port, data["command"].encode(), int(data.get("timeout", 1000)))
+				if not job.wait(float(data.get("wait", 10.0))):
+					return flask.jsonify(done=False)
+				if job.error:
+					return flask.make_response("{}".format(job.error), 409)
+				ok, response = job.result
+				return flask.jsonify(done=True, ok=ok, response=response.decode("utf-8", "replace") if response else "")
+			elif command == "upload":
+				job = self._fleet.upload(port, self._file_manager.path_on_disk("local", data["path"]),
+										 data.get("remote"))
+				if job.done() and job.error:
+					return flask.make_response("{}".format(job.error), 409)
+				return flask.jsonify(queued=True)
+		except flashforge.FlashForgeError as ffe:
+			return flask.make_response("{}".format(ffe), 409)
+
+
+	def on_sd_open_failed(self, serial_obj):
+		"""Called by the printer connection when the printer reports it could not open a file on the SD card"""
+		if self._settings.get_boolean(["sdDedupInvalidate"]):
+			key = self._sd_index_key(serial_obj)
+			if key:
+				self._sd_index.invalidate(key)
+
+
+	def _sd_index_key(self, serial_obj):
+		"""Return the SD index key for the printer or None if SD dedup is disabled or the printer is not identified"""
+		if not self._settings.get_boolean(["sdDedup"]) or not serial_obj or not serial_obj.identity:
+			return None
+		if not self._sd_index:
+			self._sd_index = SdIndex(os.path.join(self.get_plugin_data_folder(), "sd_index.json"))
+		return SdIndex.printer_key(serial_obj.printer, serial_obj.identity)
+
+
 	# Flag F2G2
 	def G91_disabled(self):
 		profile = self._printer_profile_manager.get_current_or_default()
@@ -225,129 +484,60 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 	# Called when gcode commands are being placed in the queue by OctoPrint:
 	# Mostly important for control panel or translating and printing non FlashPrint file directly from OctoPrint
 	def rewrite_gcode(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+		if self._tracer.enabled:
+			start = timer()
+			result = self._rewrite_gcode(comm_instance, cmd, cmd_type, gcode, kwargs.get("tags"))
+			self._tracer.complete("rewrite_gcode", "plugin", start, timer(), dict(cmd=cmd))
+			return result
+		return self._rewrite_gcode(comm_instance, cmd, cmd_type, gcode, kwargs.get("tags"))
+
+
+	def _rewrite_gcode(self, comm_instance, cmd, cmd_type, gcode, tags):
 		if self._serial_obj:
 
-			# Commands should begin with G,M,T
-			if not re.match(r'^[GMT]\d+', cmd):
-				# most likely part of the header in a .gx FlashPrint file
-				self._logger.debug("rewrite_gcode(): unrecognized command")
-				return []
+			if self._pretranslated and "source:file" in (tags or ()):
+				# line from the file being printed, use the translation prepared when the file was selected
+				result = self._pretranslated.lookup(cmd, gcode)
+				if result is not None:
+					return result
 
-			self._logger.debug("rewrite_gcode(): gcode:{}, cmd:{}".format(gcode, cmd))
+			cmd = self._rewrite_command(comm_instance, cmd, cmd_type, gcode, self._rewrite_state(comm_instance))
+			if cmd == [] and debug.enabled:
+				self._logger.debug("rewrite_gcode(): dropping command")
 
-			# TODO: detect printer state earlier in connection process and don't send M146, etc if the printer
-			#  is already busy when we connect
-			# TODO: filter M146 and other commands? when printing from SD because they cause comms to hang
-
-			# allow a very limited set of commands while printing from SD to minimize problems...
-			if self._serial_obj.is_sd_printing() and gcode not in ["M24", "M25", "M26", "M27", "M105", "M110", "M112", "M114", "M115", "M117", "M400"]:
-				cmd = []
-
-			# homing
-			elif gcode == "G28":
-				cmd = cmd.replace('0', '')
-				if cmd == "G28 X Y" and "noG28XY" in self._printer_profile:
-					# F2G2: does not support "G28 X Y"?
-					cmd = ["G28 X", "G28 Y"]
-
-			# relative positioning
-			elif gcode == "G91":
-				if self.G91_disabled():
-					# F2G2: try to convert relative positioning to absolute so add in some commands
-					self._serial_obj.disable_G91(True)
-					cmd = [("G91", cmd_type), "M114"]
-				else:
-					self._serial_obj.disable_G91(False)
-
-			# M20 list SD card, M21 init SD card - do not work and some printers may not respond causing timeouts,
-			# so ignore them
-			elif (gcode == "M20" or gcode == "M21"):
-				cmd = []
-
-			# M23 = select (and start printing) sd file
-			elif gcode == "M23":
-				# if the file path is incorrect (eg it came from Cura) then ignore the command
-				if "M23 /" in cmd:
-					cmd = []
-
-			# M25 = pause
-			elif gcode == "M25":
-				# pause during cancel causes issues
-				if comm_instance.isCancelling():
-					cmd = []
-
-			# M26 is sent by OctoPrint during SD prints:
-			# M26 in Marlin = set SD card position : FlashForge = cancel
-			elif gcode == "M26":
-				# M26 S0 generated during OctoPrint cancel - use it to send cancel
-				if (cmd == "M26 S0" and comm_instance.isCancelling()) or cmd == "M26":
-					cmd = [("M26", cmd_type)]
-				else:
-					cmd = []
-
-			# M82 in Marlin = extruder abs positioning : FlashForge = undefined?
-			elif gcode == "M82":
-				cmd = []
-
-			# M83 in Marlin = extruder rel positioning : FlashForge = undefined?
-			elif gcode == "M83":
-				cmd = []
-
-			# M84 by default sent when OctoPrint cancelling print
-			# M84 in Marlin = disable steppers : M18 is FlashForge equivalent
-			elif gcode == "M84":
-				cmd = ["M18"]
-
-			# M106 S0 is sent by OctoPrint control panel:
-			# M106 S0 in Marlin = fan off : M107 is FlashForge equivalent
-			elif gcode == "M106":
-				if "S0" in cmd:
-					cmd = ["M107"]
-
-			# M108 is sent by OctoPrint during SD cancel if abortHeatupOnCancel is set:
-			# M108 in Marlin = stop heat wait & continue : FlashForge M108 Tx = change toolhead (no equivalent?),
-			# drop if this is the command
-			elif cmd == "M108":
-				cmd = []
-
-			# M109 in Marlin = wait for extruder temp : M6 in FlashForge (this may need to be moved to the write() method)
-			elif gcode == "M109":
-				cmd = [cmd.replace("M109", "M6")]
-
-			# M110 is sent by OctoPrint as default hello but also when connected:
-			# M110 Set line number/hello in Marlin : FlashForge uses M601 S0 to take control via USB
-			elif gcode == "M110":
-				# if we connected and the printer is already printing then trigger an M27 so we can trigger a file open
-				# for OctoPrint
-				if self._serial_obj.is_sd_printing() and not self._comm.isSdFileSelected():
-					cmd = ["M27"]
-				else:
-					cmd = []
+		return cmd
 
-			# M119 get status we generate automatically so skip this
-			elif gcode == "M119":
-				cmd = []
 
-			# M132 load default positions does not work at command line for some printers
-			elif gcode == "M132" and "noM132" in self._printer_profile:
-				cmd = []
+	def _rewrite_command(self, comm_instance, cmd, cmd_type, gcode, state):
+		""" Apply the FlashForge rewrite rules for the given connection state to a command
 
-			# M146 = set LED colors: do not send while printing from SD (does not work, may cause issues)
-			elif gcode == "M146" and self._serial_obj.is_sd_printing():
-				cmd = []
+		Returns the command unchanged, modified, a list of replacement commands or [] to drop it
+		"""
+		# Commands should begin with G,M,T
+		if not gcodes.is_command(cmd):
+			# most likely part of the header in a .gx FlashPrint file
+			if debug.enabled:
+				self._logger.debug("rewrite_gcode(): unrecognized command")
+			return []
 
-			# M190 in Marlin = wait for bed temp : M7 in FlashForge
-			elif gcode == "M190":
-				cmd = [cmd.replace("M190", "M7")]
+		if debug.enabled:
+			self._logger.debug("rewrite_gcode(): gcode:{}, cmd:{}".format(gcode, cmd))
 
-			# Tx = select extruder : FlashForge uses M108
-			elif gcode == "T":
-				cmd = [("M108 %s" % cmd, cmd_type)]
+		# TODO: detect printer state earlier in connection process and don't send M146, etc if the printer
+		#  is already busy when we connect
+		# TODO: filter M146 and other commands? when printing from SD because they cause comms to hang
+		table = self._rules[state]
+		action = table.actions.get(gcode, table.default)
+		return action(self, comm_instance, cmd, cmd_type) if action else cmd
 
-			if cmd == []:
-				self._logger.debug("rewrite_gcode(): dropping command")
 
-		return cmd
+	def _rewrite_state(self, comm_instance):
+		""" Connection state used to select the rewrite rules """
+		if self._serial_obj.is_sd_printing():
+			return rules.STATE_SD_PRINTING
+		if comm_instance is not None and comm_instance.isPrinting():
+			return rules.STATE_PRINTING
+		return rules.STATE_IDLE
 
 
 	# Uploading files directly to internal SD card
@@ -357,12 +547,14 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 
 		Note the filename can contain a sub-folder path to the place on OctoPrint where the file is located!
 		"""
-		from timeit import default_timer as timer
-
 		if not self._serial_obj:
 			return
 
-		def process_upload():
+		def process_upload(file, file_size):
+			with span(self._tracer, "process_upload", "plugin", file=filename):
+				upload(file, file_size)
+
+		def upload(file, file_size):
 			error = ""
 			errormsg = "Unable to upload to SD card"
 
@@ -372,72 +564,72 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 				self._logger.info("aborting: print already in progress")
 				sd_upload_failed(filename, remote_name, timer()-start)
 				eventManager().fire(Events.ERROR, {"error":  errormsg + " - printer is busy.", "reason": "start_print"})
+				file.close()
 				return
 
-			# there must be something coming back from the printer (eg keep alive) or we will block here until the
-			# Octoprint comm monitor readline times out
-			self._serial_obj.makeexclusive(True)
-			self._serial_obj.enable_keep_alive(False)
-
-			# make sure heaters are off
-			ok, answer = self._serial_obj.sendcommand(b"M104 S0 T0")
-			if not ok:
-				error = "{}: {}".format(errormsg, answer)
-				errormsg += " - printer busy."
-			else:
-				self._serial_obj.sendcommand(b"M104 S0 T1")
-				self._serial_obj.sendcommand(b"M140 S0")
-
-				ok, answer = self._serial_obj.sendcommand(b"M28 %d 0:/user/%s" % (file_size, remote_name.encode()), 5000)
-				if not ok or b"open failed" in answer:
-					error = "{}: {}".format(errormsg, answer)
-					errormsg += " - could not create file on printer SD card."
+			# skip the upload if the same file is already on the SD card
+			digest = None
+			sd_key = self._sd_index_key(self._serial_obj)
+			if sd_key:
+				try:
+					digest = SdIndex.hash(path)
+				except (IOError, OSError) as ioe:
+					self._logger.info("unable to hash {}: {}".format(path, ioe))
+				else:
+					existing = self._sd_index.lookup(sd_key, digest)
+					if existing:
+						self._logger.info("{} is already on the SD card as {}, skipping upload".format(filename, existing))
+						file.close()
+						sd_upload_succeeded(filename, existing, timer()-start)
+						self._comm.selectFile("0:/user/%s\r\n" % existing, True)
+						return
+
+			# strip comments etc from plain g-code, into a temporary file because M28 needs the size up front
+			saved = 0
+			if self._settings.get_boolean(["minify"]) and not minify.is_binary(path):
+				minified = None
+				try:
+					minified = tempfile.TemporaryFile(dir=self.get_plugin_data_folder())
+					bytes_in, bytes_out = minify.minify_file(file, minified)
+					minified.seek(0)
+				except (IOError, OSError) as ioe:
+					self._logger.info("unable to minify {}, uploading as is: {}".format(filename, ioe))
+					if minified:
+						minified.close()
+					file.seek(0)
+				else:
+					file.close()
+					file = minified
+					file_size = bytes_out
+					saved = bytes_in - bytes_out
+					self._logger.info("Minified {}: saved {} of {} bytes".format(filename, saved, bytes_in))
 
-			if not error:
-				self._logger.debug("M28 file tx started")
+			def progress(sent, size):
+				if debug.enabled:
+					self._logger.debug("Sent: %d%% %d/%d" % (int(100.0 * sent / size), sent, size))
 
-				try:
-					chunk_start_index = 0
-					while chunk_start_index < file_size:
-						chunk_end_index = min(chunk_start_index + self.FILE_PACKET_SIZE, file_size)
-						chunk = bgcode[chunk_start_index:chunk_end_index]
-						if not chunk:
-							error = "unexpected eof"
-							break
-
-						if self._serial_obj.writeraw(chunk, False):
-							upload_percent = int(100.0 * chunk_end_index / file_size)
-							self._logger.debug("Sent: %d%% %d/%d" % (upload_percent, chunk_end_index, file_size))
-						else:
-							error = "file transfer interrupted"
-							break
-
-						chunk_start_index += self.FILE_PACKET_SIZE
-
-					if not error:
-						result, response = self._serial_obj.sendcommand(b"M29", 10000)
-						if result and b"CMD M28" in response:
-							response = self._serial_obj.readraw(1000)
-						if result and b"failed" not in response:
-							sd_upload_succeeded(filename, remote_name, timer()-start)
-						else:
-							error = "file transfer incomplete"
-
-				except flashforge.FlashForgeError:
-					error = "file transfer incomplete"
-
-				errormsg = "{} - {}.".format(errormsg, error)
+			try:
+				tx_time = self._serial_obj.sd_upload(file, file_size, remote_name, progress)
+			except flashforge.FlashForgeError as ffe:
+				error = "{}".format(ffe)
+			finally:
+				file.close()
 
 			if error:
 				self._logger.info("Upload failed: {}".format(error))
 				sd_upload_failed(filename, remote_name, timer()-start)
-				self._serial_obj.makeexclusive(False)
-				self._serial_obj.enable_keep_alive(True)
-				eventManager().fire(Events.ERROR, {"error": errormsg, "reason": "start_print"})
+				eventManager().fire(Events.ERROR, {"error": "{} - {}.".format(errormsg, error), "reason": "start_print"})
 				return
 
-			self._serial_obj.makeexclusive(False)
-			self._serial_obj.enable_keep_alive(True)
+			elapsed = timer() - start
+			rate = file_size / tx_time / 1000000.0 if tx_time > 0 else 0.0
+			self._logger.info("Uploaded {} bytes in {:.2f}s ({:.3f} MB/s)".format(file_size, tx_time, rate))
+			if digest:
+				self._sd_index.add(sd_key, digest, remote_name)
+			sd_upload_succeeded(filename, remote_name, elapsed)
+			eventManager().fire(self.EVENT_UPLOAD_COMPLETE, dict(local=filename, remote=remote_name, size=file_size,
+																 time=elapsed, rate=rate, saved=saved))
+
 			# NB M23 select will also trigger a print on FlashForge
 			self._comm.selectFile("0:/user/%s\r\n" % remote_name, True)
 			# TODO: need to set the correct file size for the progress indicator
@@ -448,7 +640,7 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 		start = timer()
 		# Unfortunately we cannot get the list of files on the SD card from FlashForge so we just name the remote
 		# file the same as the source and hope for the best
-		bgcode = b""
+		file = None
 		file_size = 0
 		remote_name = filename.split("/")[-1]
 
@@ -457,16 +649,16 @@ class FlashForgePlugin(octoprint.plugin.SettingsPlugin,
 
 		try:
 			file = open(path, "rb")
-			bgcode = file.read()
-			file_size = len(bgcode)
-			file.close()
+			file_size = os.fstat(file.fileno()).st_size
 		except:
+			if file:
+				file.close()
 			errormsg = "could not open local file."
 			self._logger.info("aborting: " + errormsg)
 			sd_upload_failed(filename, remote_name, timer()-start)
 			eventManager().fire(Events.ERROR, {"error": errormsg, "reason": "start_print"})
 		else:
-			thread = threading.Thread(target=process_upload, name="FlashForge.SD_Uploader")
+			thread = threading.Thread(target=process_upload, args=(file, file_size), name="FlashForge.SD_Uploader")
 			thread.daemon = True
 			thread.start()
 
@@ -493,5 +685,6 @@ def __plugin_load__():
 		"octoprint.comm.protocol.firmware.capabilities": __plugin_implementation__.printer_capabilities,
 		"octoprint.filemanager.extension_tree": __plugin_implementation__.get_extension_tree,
 		"octoprint.comm.protocol.gcode.queuing": __plugin_implementation__.rewrite_gcode,
-		"octoprint.printer.sdcardupload": __plugin_implementation__.upload_to_sd
+		"octoprint.printer.sdcardupload": __plugin_implementation__.upload_to_sd,
+		"octoprint.events.register_custom_events": __plugin_implementation__.register_custom_events
 	}
@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import threading
+import time
+
+
+class CapabilityStore(object):
+	"""What each printer model is known to support, remembered between connections
+
+	A record is created the first time a model connects and updated as the connection learns more about the printer
+	(firmware string, commands it never answers, whether OctoPrint turned off the simulated temperature reports). Later
+	connections use it to skip USB endpoint discovery and drop the unsupported commands instead of waiting for answers
+	that never come.
+
+	Unsupported commands are forgotten UNSUPPORTED_EXPIRY after they were learned, so a command that was wrongly learned
+	(or that a firmware update added) is sent to the printer again.
+
+	Stored as JSON: {"vid:pid": {"firmware": M115 firmware version, "endpoints": endpoint layout, "autotemp": bool,
+	"unsupported": [gcode], "learned": {gcode: time learned unsupported}, "time": last update}}
+	"""
+
+	UNSUPPORTED_EXPIRY = 7 * 24 * 3600.0
+	""" Time (s) an unsupported command is remembered for """
+
+	def __init__(self, path):
+		"""
+		Parameters:
+			path : file to store the records in
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._path = path
+		self._lock = threading.Lock()
+		self._records = None
+
+
+	@staticmethod
+	def model_key(printer):
+		"""Return the record key for a printer dict from detect_printer() (vid, did)"""
+		return "{:04x}:{:04x}".format(printer["vid"], printer["did"])
+
+
+	def get(self, printer):
+		"""Return the capability record for the printer's model or None if it has not connected before"""
+
+		with self._lock:
+			record = self._load().get(self.model_key(printer))
+		if not record:
+			return None
+		now = time.time()
+		learned = self._learned(record)
+		unsupported = [gcode for gcode in record.get("unsupported", ())
+					   if now - learned.get(gcode, 0) < self.UNSUPPORTED_EXPIRY]
+		return dict(record, firmware=self._firmware(record), unsupported=unsupported)
+
+
+	@staticmethod
+	def _firmware(record):
+		"""Return the firmware version of a record, None if there is none"""
+		firmware = record.get("firmware") if record else None
+		if firmware and "Firmware:" in firmware:
+			# older records hold the whole M115 answer of one unit rather than the firmware version
+			return None
+		return firmware
+
+
+	@staticmethod
+	def _learned(record):
+		"""Return dict of gcode -> time each unsupported command of a record was learned"""
+		learned = record.get("learned")
+		if learned is None:
+			# older records do not say, count from their last update
+			learned = dict((gcode, record.get("time", 0)) for gcode in record.get("unsupported", ()))
+		return learned
+
+
+	def forget_unsupported(self, printer=None):
+		"""Forget the unsupported commands of the printer's model, or of every model if printer is None"""
+
+		with self._lock:
+			records = self._load()
+			keys = [self.model_key(printer)] if printer else list(records.keys())
+			for key in keys:
+				if key in records:
+					records[key]["unsupported"] = []
+					records[key]["learned"] = {}
+			self._save()
+
+
+	def update(self, printer, capabilities):
+		"""Replace the record for the printer's model with the capabilities of a connection to it
+
+		Parameters:
+			printer : printer dict from detect_printer()
+			capabilities : dict from FlashForge.capabilities
+		"""
+		key = self.model_key(printer)
+		with self._lock:
+			records = self._load()
+			old = records.get(key)
+			old_firmware = self._firmware(old)
+			firmware = capabilities.get("firmware")
+			if old_firmware and firmware and old_firmware != firmware:
+				self._logger.info("firmware of {} changed from {} to {}".format(key, old_firmware, firmware))
+			now = time.time()
+			learned = self._learned(old) if old else {}
+			record = dict(capabilities, time=now, learned={})
+			for gcode in capabilities.get("unsupported", ()):
+				# keep when the command was learned so passing it on to every new connection does not renew it
+				when = learned.get(gcode, now)
+				record["learned"][gcode] = when if now - when < self.UNSUPPORTED_EXPIRY else now
+			if not record.get("firmware"):
+				# not identified yet, do not forget what we knew
+				record["firmware"] = old_firmware
+			records[key] = record
+			self._save()
+
+
+	def _load(self):
+		if self._records is None:
+			self._records = {}
+			if os.path.exists(self._path):
+				try:
+					with io.open(self._path, "r", encoding="utf-8") as f:
+						self._records = json.load(f)
+				except (IOError, OSError, ValueError) as error:
+					self._logger.info("ignoring corrupt capability records {}: {}".format(self._path, error))
+		return self._records
+
+
+	def _save(self):
+		try:
+			folder = os.path.dirname(self._path)
+			if not os.path.isdir(folder):
+				os.makedirs(folder)
+			with io.open(self._path, "w", encoding="utf-8") as f:
+				# json.dump() writes str on Python 2, which a text file does not take
+				f.write(u"" + json.dumps(self._records))
+		except (IOError, OSError, TypeError, ValueError) as error:
+			self._logger.info("unable to save capability records {}: {}".format(self._path, error))
@@ -0,0 +1,131 @@
+"""
+Matching printer responses to the commands that caused them.
+
+Every command written to the printer gets a pending response record, queued per gcode in the order the commands were
+sent. The printer answers each command with a "CMD <gcode> Received." frame, so a frame resolves the oldest record for
+its gcode. Records are either a CommandFuture (a command the plugin sent itself, which gets the frame) or None (a command
+from OctoPrint or the keep alive, whose answer goes to readline()).
+"""
+import threading
+from collections import deque
+
+
+class CommandFuture(object):
+	"""Pending answer to a command sent by the plugin"""
+
+	__slots__ = ("command", "gcode", "frame", "abandoned", "_event")
+
+	def __init__(self, command):
+		"""
+		Parameters:
+			command : FF formatted g-code command (bytes)
+		"""
+		self.command = command
+		self.gcode = command.split(b" ", 1)[0]
+		self.frame = None
+		self.abandoned = False
+		self._event = threading.Event()
+
+
+	def __repr__(self):
+		return "CommandFuture({}, {})".format(self.command, self.frame if self.done() else "pending")
+
+
+	def done(self):
+		"""Return true once the command was answered or the printer was found to have ignored it"""
+		return self._event.is_set()
+
+
+	def wait(self, timeout=None):
+		"""Wait up to timeout (s) for the answer, returns true if the future is done"""
+		return self._event.wait(timeout)
+
+
+	@property
+	def ok(self):
+		"""True if the printer answered with ok, indicating the command was accepted"""
+		return self.frame is not None and self.frame.ok
+
+
+	@property
+	def response(self):
+		"""Answer from the printer as \r\n terminated lines, empty if there was none"""
+		if self.frame is None:
+			return b""
+		return b"".join(line + b"\r\n" for line in self.frame.tolines())
+
+
+	def abandon(self):
+		"""Nobody is waiting any more - the answer is dropped when it arrives rather than passed to OctoPrint"""
+		self.abandoned = True
+
+
+	def _resolve(self, frame):
+		self.frame = frame
+		self._event.set()
+
+
+class Correlator(object):
+	"""Pending response records of the commands written to the printer, resolved in order per gcode"""
+
+	MAX_PENDING = 256
+	""" Records kept per gcode, older ones are forgotten if the printer stops answering a gcode """
+
+	def __init__(self, max_pending=MAX_PENDING):
+		self._max_pending = max_pending
+		self._pending = {}		# gcode -> deque of CommandFuture or None, oldest first
+		# appending to and popping from a deque are atomic, the lock is only needed to add a gcode
+		self._lock = threading.Lock()
+
+
+	def expect(self, gcode, future=None):
+		"""Record that a command was written
+
+		Parameters:
+			gcode : gcode of the command (bytes)
+			future : CommandFuture for a command sent by the plugin, None for one whose answer goes to OctoPrint
+		"""
+		records = self._pending.get(gcode)
+		if records is None:
+			with self._lock:
+				records = self._pending.setdefault(gcode, deque(maxlen=self._max_pending))
+		records.append(future)
+
+
+	def resolve(self, frame):
+		"""Match a response frame with the oldest pending record for its gcode
+
+		Returns:
+			CommandFuture the frame answers (resolved with it), None if the frame is for OctoPrint
+		"""
+		future = self._pop(frame.gcode)
+		if future is not None:
+			future._resolve(frame)
+		return future
+
+
+	def skip(self, gcode):
+		"""The printer ignored the oldest pending command for gcode - drop its record, a plugin command is resolved
+		without an answer"""
+		future = self._pop(gcode)
+		if future is not None:
+			future._resolve(None)
+
+
+	def pending(self):
+		"""Number of commands waiting for an answer"""
+		with self._lock:
+			queues = list(self._pending.values())
+		return sum(len(records) for records in queues)
+
+
+	def _pop(self, gcode):
+		"""Remove and return the oldest record for gcode, None if there is none"""
+		records = self._pending.get(gcode)
+		if records:
+			try:
+				return records.popleft()
+			except IndexError:
+				# taken by another thread in the meantime
+				pass
+		return None
@@ -0,0 +1,197 @@
+"""
+Index of the supported USB devices attached to the host.
+
+The index is kept up to date by libusb hotplug callbacks (or, where libusb has no hotplug support, by enumerating
+every ENUMERATE_INTERVAL seconds) so listing ports and connecting are dictionary lookups instead of walking every USB
+device and reading its string descriptors. The USB endpoint layout discovered when connecting is cached per VID/PID.
+"""
+import threading
+
+import usb1
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+
+class DeviceIndex(object):
+	"""Supported USB devices by port name"""
+
+	EVENT_TIMEOUT = 0.5
+	""" Max time (s) the index thread blocks in libusb before checking if it should exit """
+	ENUMERATE_INTERVAL = 10.0
+	""" Time (s) between enumerations when libusb has no hotplug support """
+
+	def __init__(self, usbcontext, vendor_ids):
+		"""
+		Parameters:
+			usbcontext : usb1.USBContext
+			vendor_ids : dict of supported USB vendor ids -> vendor name
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+
+		self._usbcontext = usbcontext
+		self._vendor_ids = vendor_ids
+		self._lock = threading.Lock()
+		self._printers = {}			# port name -> printer dict
+		self._devices = {}			# (bus, addr) -> (port name, usb1.USBDevice)
+		self._endpoints = {}		# (vid, did) -> endpoint layout
+		self._hotplug = []			# hotplug callback handles
+		self._pending = queue.Queue()	# (un)plugged devices waiting to be processed outside of libusb
+		self._thread = None
+		self._running = False
+		self._stop_event = threading.Event()
+
+
+	def start(self):
+		"""Populate the index and start tracking changes"""
+
+		self._running = True
+		self._stop_event.clear()
+		hotplug = usb1.hasCapability(usb1.CAP_HAS_HOTPLUG)
+		if hotplug:
+			try:
+				for vendor_id in self._vendor_ids:
+					# HOTPLUG_ENUMERATE reports the devices that are already attached
+					self._hotplug.append(self._usbcontext.hotplugRegisterCallback(self._on_hotplug, vendor_id=vendor_id))
+			except usb1.USBError as usberror:
+				self._logger.info("USB hotplug unavailable, falling back to enumeration: {}".format(usberror))
+				hotplug = False
+		if hotplug:
+			# the callbacks only queue the changes, name the devices before returning so the index is complete
+			self._process_pending()
+		else:
+			self.enumerate()
+
+		self._thread = threading.Thread(target=self._run_hotplug if hotplug else self._run_enumerate,
+										name="FlashForge.USB_Devices")
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self):
+		self._running = False
+		self._stop_event.set()
+		for handle in self._hotplug:
+			try:
+				self._usbcontext.hotplugDeregisterCallback(handle)
+			except usb1.USBError:
+				pass
+		self._hotplug = []
+		if self._thread and self._thread is not threading.current_thread():
+			self._thread.join()
+		self._thread = None
+
+
+	def is_running(self):
+		return self._running
+
+
+	def printers(self):
+		"""Return dict of port name -> printer dict (bus, addr, vid, did)"""
+		with self._lock:
+			return dict(self._printers)
+
+
+	def device(self, printer):
+		"""Return the usb1.USBDevice for a printer dict or None if it is no longer attached"""
+		with self._lock:
+			entry = self._devices.get((printer["bus"], printer["addr"]))
+		return entry[1] if entry else None
+
+
+	def endpoints(self, printer):
+		"""Return the cached endpoint layout for the printer's VID/PID or None"""
+		return self._endpoints.get((printer["vid"], printer["did"]))
+
+
+	def set_endpoints(self, printer, endpoints):
+		"""Cache the endpoint layout discovered for the printer's VID/PID"""
+		self._endpoints[(printer["vid"], printer["did"])] = endpoints
+
+
+	def enumerate(self):
+		"""Walk every attached USB device and rebuild the index, known devices are not queried again"""
+
+		seen = set()
+		for device in self._usbcontext.getDeviceIterator(skip_on_error=True):
+			if device.getVendorID() in self._vendor_ids:
+				seen.add((device.getBusNumber(), device.getDeviceAddress()))
+				self._arrived(device)
+		with self._lock:
+			gone = [key for key in self._devices if key not in seen]
+		for key in gone:
+			self._left(key)
+
+
+	def _run_hotplug(self):
+		while self._running:
+			try:
+				self._usbcontext.handleEventsTimeout(tv=self.EVENT_TIMEOUT)
+			except usb1.USBErrorInterrupted:
+				pass
+			except usb1.USBError as usberror:
+				self._logger.info("USB hotplug event handling failed, falling back to enumeration: {}".format(usberror))
+				self._run_enumerate()
+				return
+			self._process_pending()
+		self._logger.debug("device index thread exiting")
+
+
+	def _run_enumerate(self):
+		while not self._stop_event.wait(self.ENUMERATE_INTERVAL):
+			try:
+				self.enumerate()
+			except usb1.USBError as usberror:
+				self._logger.debug("USB enumeration failed {}".format(usberror))
+		self._logger.debug("device index thread exiting")
+
+
+	def _on_hotplug(self, context, device, event):
+		"""libusb hotplug callback - no synchronous libusb calls allowed here so just queue the change"""
+		self._pending.put((device, event))
+		return False
+
+
+	def _process_pending(self):
+		while True:
+			try:
+				device, event = self._pending.get_nowait()
+			except queue.Empty:
+				return
+			if event == usb1.HOTPLUG_EVENT_DEVICE_ARRIVED:
+				self._arrived(device)
+			else:
+				self._left((device.getBusNumber(), device.getDeviceAddress()))
+
+
+	def _arrived(self, device):
+		key = (device.getBusNumber(), device.getDeviceAddress())
+		with self._lock:
+			if key in self._devices:
+				return
+		vendor_id = device.getVendorID()
+		device_name = 'unknown device'
+		try:
+			# this will typically fail if we don't have permission to access this USB device
+			device_name = device.getProduct()
+		except usb1.USBError as usberror:
+			self._logger.debug('Unable to get device name {}'.format(usberror))
+		# we have a printer of some kind
+		device_name += ", port:{}:{}".format(*key)
+		self._logger.info("Found a {} {}".format(self._vendor_ids[vendor_id], device_name))
+		with self._lock:
+			self._devices[key] = (device_name, device)
+			self._printers[device_name] = {'bus': key[0], 'addr': key[1], 'vid': vendor_id,
+										   'did': device.getProductID()}
+
+
+	def _left(self, key):
+		with self._lock:
+			entry = self._devices.pop(key, None)
+			if entry:
+				del self._printers[entry[0]]
+		if entry:
+			self._logger.info("Lost {}".format(entry[0]))
@@ -0,0 +1,877 @@
+"""
+Software emulation of FlashForge based printers for testing and benchmarking without hardware.
+
+EmulatedContext stands in for usb1.USBContext, the devices it returns for usb1.USBDevice and their handles for
+usb1.USBDeviceHandle (synchronous bulk I/O and asynchronous transfers), so a FlashForge connection runs unmodified on
+top of it:
+
+	context = EmulatedContext([EmulatedPrinter("finder2", latency=0.005)])
+	printer = context.printers[0]
+	connection = FlashForge(plugin, None, context, "emulated", printer.printer_dict())
+
+The printer answers in the FlashForge format ("CMD Mxxx Received." ... "ok"), tracks machine status and move mode for
+M119, heats towards M104/M140 targets, prints files stored on its emulated SD card (M23-M27) and accepts uploads with
+M28/M29. Model quirks (unanswered commands, keep alive limits, oddly formatted responses) come from MODELS and can be
+overridden per printer.
+"""
+import heapq
+import itertools
+import re
+import threading
+from timeit import default_timer as timer
+
+import usb1
+
+
+MODELS = {
+	"dreamer": dict(vid=0x2b71, pid=0x0001, name="Dreamer", firmware="V2.15 20190918", tools=2, size=(230, 150, 140),
+					unterminated_ok=["M104"]),
+	"finder2": dict(vid=0x2b71, pid=0x0007, name="Finder", firmware="V2.1.5 20180319", size=(140, 140, 140),
+					ignore=["M132", "G28 X Y"]),
+	"guider2": dict(vid=0x2b71, pid=0x0004, name="Guider II", firmware="V1.6.1 20190306", size=(280, 250, 300),
+					sd_endpoints=True),
+	"creatorpro2": dict(vid=0x2b71, pid=0x000e, name="Creator Pro 2", firmware="V1.2.3 20200409", tools=2,
+						size=(200, 148, 150)),
+	"3d20": dict(vid=0x2a89, pid=0x8889, name="Dremel 3D20", firmware="V2.0.2 20170323", size=(230, 150, 140),
+				 keep_alive=2.0, m27_idle_no_ok=True),
+	"3d45": dict(vid=0x2a89, pid=0x888d, name="Dremel 3D45", firmware="V3.1.4 20200302", size=(255, 155, 170),
+				 sd_endpoints=True, packet_size=512),
+	"ultra3d": dict(vid=0x0315, pid=0x0001, name="Ultra 3DPrinter", firmware="V1.0.5 20170719", size=(230, 150, 160),
+					progress_after_done=True),
+}
+""" Emulated models: USB ids, M115 details and quirks
+
+	tools : number of extruders
+	size : build volume reported by M115
+	sd_endpoints : true if uploads go over a second pair of bulk endpoints
+	packet_size : max USB packet size of the endpoints
+	ignore : commands (gcode or full command) the firmware never answers
+	unterminated_ok : gcodes whose ok is not followed by a line terminator
+	keep_alive : the printer stops answering if nothing is written for this long (s)
+	m27_idle_no_ok : M27 is not answered with an ok when not printing from SD
+	progress_after_done : M27 keeps reporting the progress of the last SD print after it finished
+"""
+
+CMD_IN = 0x81
+CMD_OUT = 0x01
+SD_IN = 0x83
+SD_OUT = 0x03
+
+regex_word = re.compile(b"([A-Z])(-?[0-9.]+)")
+
+
+class EmulatedPrinter(object):
+	"""The printer at the far end of an emulated USB device"""
+
+	def __init__(self, model="dreamer", latency=0.0, bus=1, addr=2, serial="EMU000001", move_time=0.0,
+				 home_time=0.5, heat_rate=50.0, sd_rate=10000.0, store_uploads=True, **options):
+		"""
+		Parameters:
+			model : key into MODELS
+			latency : time (s) between a command arriving and its response being available
+			bus, addr : USB bus and device address
+			serial : serial number reported by M115
+			move_time : time (s) each G0/G1 move takes, the ok is sent when it completes
+			home_time : time (s) G28 takes
+			heat_rate : degrees per second the heaters change temperature
+			sd_rate : bytes per second of an SD print
+			store_uploads : false to only count the bytes of uploaded files (eg huge synthetic ones) rather than keep
+				them, the files on the SD card are then empty
+			options : override any of the MODELS settings
+		"""
+		spec = dict(MODELS[model])
+		spec.update(options)
+		self.model = model
+		self.vid = spec["vid"]
+		self.pid = spec["pid"]
+		self.name = spec["name"]
+		self.firmware = spec["firmware"]
+		self.tools = spec.get("tools", 1)
+		self.size = spec.get("size", (200, 200, 200))
+		self.sd_endpoints = spec.get("sd_endpoints", False)
+		self.packet_size = spec.get("packet_size", 64)
+		self.ignore = set(command.encode() for command in spec.get("ignore", ()))
+		self.unterminated_ok = set(gcode.encode() for gcode in spec.get("unterminated_ok", ()))
+		self.keep_alive = spec.get("keep_alive")
+		self.m27_idle_no_ok = spec.get("m27_idle_no_ok", False)
+		self.progress_after_done = spec.get("progress_after_done", False)
+		self.latency = latency
+		self.bus = bus
+		self.addr = addr
+		self.serial = serial
+		self.move_time = move_time
+		self.home_time = home_time
+		self.heat_rate = heat_rate
+		self.sd_rate = sd_rate
+		self.store_uploads = store_uploads
+
+		self.commands = []		# every command received, in order
+		self.sd_card = {}		# file name -> contents
+		self.uploaded = 0		# bytes received by uploads
+
+		self._cv = threading.Condition()
+		self._out = []			# heap of (ready time, sequence, bytes)
+		self._sequence = itertools.count()
+		self._listeners = []
+		self._machine_status = "READY"
+		self._move_mode = "READY"
+		self._busy_until = 0.0
+		self._busy_mode = None
+		self._temperatures = dict(("T{}".format(tool), [22.0, 0.0]) for tool in range(self.tools))
+		self._temperatures["B"] = [21.0, 0.0]
+		self._waiting_on = None		# (heater, move mode) a M6/M7 is waiting for
+		self._sd_file = None
+		self._sd_position = 0.0
+		self._sd_size = 0
+		self._upload = None			# [remote name, size, bytearray, bytes received]
+		self._last_input = timer()
+		self._last_tick = timer()
+		self._in_control = False
+		self._unresponsive = False
+
+
+	def printer_dict(self):
+		"""Printer dict as returned by FlashForgePlugin.detect_printer()"""
+		return {"bus": self.bus, "addr": self.addr, "vid": self.vid, "did": self.pid}
+
+
+	@property
+	def machine_status(self):
+		with self._cv:
+			self._tick(timer())
+			return self._machine_status
+
+
+	@property
+	def move_mode(self):
+		with self._cv:
+			self._tick(timer())
+			return self._move_mode
+
+
+	def temperature(self, heater):
+		"""Return (actual, target) of a heater eg "T0", "B" """
+		with self._cv:
+			self._tick(timer())
+			return tuple(self._temperatures[heater])
+
+
+	def reset(self):
+		"""Interface claimed - forget about a connection the printer had dropped"""
+		with self._cv:
+			self._out = []
+			self._unresponsive = False
+			self._in_control = False
+			self._last_input = timer()
+
+
+	##~~ USB side
+
+	def write(self, endpoint, data):
+		"""Data written to one of the OUT endpoints"""
+
+		data = bytes(data)
+		with self._cv:
+			now = timer()
+			self._tick(now)
+			if self._unresponsive:
+				return
+			self._last_input = now
+			if self._upload is not None and self._upload[3] < self._upload[1] and \
+				(endpoint == SD_OUT or not self.sd_endpoints):
+				self._receive_file(data)
+				return
+			if endpoint != CMD_OUT:
+				return
+			for line in data.splitlines():
+				line = line.strip()
+				if line.startswith(b"~") and len(line) > 1:
+					self._command(line[1:], now)
+			self._cv.notify_all()
+		self._notify()
+
+
+	def read(self, length, timeout):
+		"""Read a response from the IN endpoint, waits up to timeout (s, None = forever)
+
+		Raises:
+			usb1.USBErrorTimeout if nothing arrives in time
+		"""
+		deadline = None if timeout is None else timer() + timeout
+		with self._cv:
+			while True:
+				now = timer()
+				self._tick(now)
+				data = self._take(length, now)
+				if data:
+					return data
+				wait = self._next_ready(now)
+				if deadline is not None:
+					remaining = deadline - now
+					if remaining <= 0:
+						error = usb1.USBErrorTimeout()
+						error.received = b""
+						raise error
+					wait = remaining if wait is None else min(wait, remaining)
+				self._cv.wait(wait)
+
+
+	def poll(self, length):
+		"""Return response data that is ready without waiting (b"" if none)"""
+		with self._cv:
+			now = timer()
+			self._tick(now)
+			return self._take(length, now)
+
+
+	def next_ready(self):
+		"""Time (s) until more response data is ready, None if nothing is pending, 0 if it is ready now"""
+		with self._cv:
+			now = timer()
+			self._tick(now)
+			return self._next_ready(now)
+
+
+	def add_listener(self, listener):
+		"""Call listener() whenever new response data is queued"""
+		self._listeners.append(listener)
+
+
+	def _notify(self):
+		for listener in self._listeners:
+			listener()
+
+
+	def _take(self, length, now):
+		out = self._out
+		if not out or out[0][0] > now:
+			return b""
+		chunks = []
+		size = 0
+		while out and out[0][0] <= now and size < length:
+			ready, sequence, data = heapq.heappop(out)
+			if size + len(data) > length:
+				# the rest goes out in the next read
+				heapq.heappush(out, (ready, sequence, data[length - size:]))
+				data = data[:length - size]
+			chunks.append(data)
+			size += len(data)
+		return b"".join(chunks)
+
+
+	def _next_ready(self, now):
+		wait = max(0.0, self._out[0][0] - now) if self._out else None
+		for due in (self._busy_until, self._sd_done_time()):
+			if due and due > now:
+				wait = due - now if wait is None else min(wait, due - now)
+		return wait
+
+
+	def _respond(self, data, now, delay=0.0):
+		heapq.heappush(self._out, (now + self.latency + delay, next(self._sequence), data))
+
+
+	##~~ Simulation
+
+	def _tick(self, now):
+		"""Advance heaters, moves and SD printing to now"""
+
+		elapsed = now - self._last_tick
+		self._last_tick = now
+		if self.keep_alive and self._in_control and now - self._last_input > self.keep_alive:
+			# the printer gave up on us
+			self._unresponsive = True
+			self._in_control = False
+
+		for heater, temperature in self._temperatures.items():
+			actual, target = temperature
+			goal = target if target else 21.0
+			step = elapsed * (self.heat_rate if target else self.heat_rate / 5.0)
+			temperature[0] = min(goal, actual + step) if actual < goal else max(goal, actual - step)
+
+		if self._waiting_on:
+			actual, target = self._temperatures[self._waiting_on[0]]
+			if actual >= target - 1.0:
+				self._waiting_on = None
+		if self._busy_until and now >= self._busy_until:
+			self._busy_until = 0.0
+			self._busy_mode = None
+		if self._machine_status == "READY":
+			self._move_mode = self._busy_mode or (self._waiting_on[1] if self._waiting_on else "READY")
+
+		if self._machine_status == "BUILDING_FROM_SD" and self._move_mode != "PAUSED":
+			self._sd_position = min(self._sd_size, self._sd_position + elapsed * self.sd_rate)
+			if self._sd_position >= self._sd_size:
+				self._machine_status = "READY"
+				self._move_mode = "READY"
+				if not self.progress_after_done:
+					self._sd_file = None
+
+
+	def _sd_done_time(self):
+		if self._machine_status != "BUILDING_FROM_SD" or self._move_mode == "PAUSED" or not self.sd_rate:
+			return None
+		return self._last_tick + (self._sd_size - self._sd_position) / self.sd_rate
+
+
+	def _command(self, cmd, now):
+		self.commands.append(cmd)
+		gcode = cmd.split(b" ", 1)[0]
+		if gcode in self.ignore or cmd in self.ignore:
+			return
+		handler = getattr(self, "_on_" + gcode.decode("ascii", "replace").lower(), None)
+		lines, delay = handler(cmd, now) if handler else ([], 0.0)
+		if lines is None:
+			# the handler has answered
+			return
+		ok = b"ok" if gcode in self.unterminated_ok else b"ok\r\n"
+		response = b"CMD %s Received.\r\n" % gcode + b"".join(line + b"\r\n" for line in lines)
+		if delay:
+			# the ok follows when the command completes
+			self._respond(response, now)
+			self._respond(ok, now, delay)
+		else:
+			self._respond(response + ok, now)
+
+
+	def _receive_file(self, data):
+		name, size, contents, received = self._upload
+		length = min(len(data), size - received)
+		if self.store_uploads:
+			contents.extend(data[:length])
+		self._upload[3] += length
+		self.uploaded += length
+
+
+	def _status_lines(self):
+		return [b"Endstop: X-max:1 Y-max:0 Z-max:0",
+				b"MachineStatus: " + self._machine_status.encode(),
+				b"MoveMode: " + self._move_mode.encode(),
+				b"Status: S:0 L:0 J:0 F:0",
+				b"LED: 1",
+				b"CurrentFile: " + (self._sd_file or "").encode()]
+
+
+	def _move(self, now, duration, mode="MOVING"):
+		"""Queue a motion, returns the time until it completes"""
+		start = max(now, self._busy_until)
+		self._busy_until = start + duration
+		self._busy_mode = mode
+		self._tick(now)
+		return self._busy_until - now
+
+
+	##~~ Commands - each returns (response lines, time until the ok is sent)
+
+	def _on_m601(self, cmd, now):
+		self._in_control = True
+		return [b"Control Success."], 0.0
+
+
+	def _on_m602(self, cmd, now):
+		self._in_control = False
+		return [b"Control Release."], 0.0
+
+
+	def _on_m115(self, cmd, now):
+		return [b"Machine Type: " + self.name.encode(),
+				b"Machine Name: " + self.name.encode(),
+				b"Firmware: " + self.firmware.encode(),
+				b"SN: " + self.serial.encode(),
+				b"X: %d Y: %d Z: %d" % self.size,
+				b"Tool Count: %d" % self.tools], 0.0
+
+
+	def _on_m119(self, cmd, now):
+		return self._status_lines(), 0.0
+
+
+	def _on_m105(self, cmd, now):
+		heaters = sorted(heater for heater in self._temperatures if heater != "B") + ["B"]
+		return [b" ".join(b"%s:%d /%d" % ((heater.encode(),) + tuple(int(t) for t in self._temperatures[heater]))
+						  for heater in heaters)], 0.0
+
+
+	def _on_m114(self, cmd, now):
+		return [b"X:0 Y:0 Z:0 A:0 B:0"], 0.0
+
+
+	def _on_m104(self, cmd, now):
+		words = dict(regex_word.findall(cmd[4:]))
+		heater = "T{}".format(int(float(words.get(b"T", b"0"))))
+		if heater in self._temperatures:
+			self._temperatures[heater][1] = float(words.get(b"S", b"0"))
+		return [], 0.0
+
+
+	def _on_m140(self, cmd, now):
+		words = dict(regex_word.findall(cmd[4:]))
+		self._temperatures["B"][1] = float(words.get(b"S", b"0"))
+		return [], 0.0
+
+
+	def _wait_on(self, heater, mode, now):
+		if heater in self._temperatures and self._temperatures[heater][1]:
+			self._waiting_on = (heater, mode)
+			self._tick(now)
+		return [], 0.0
+
+
+	def _on_m6(self, cmd, now):
+		words = dict(regex_word.findall(cmd[2:]))
+		return self._wait_on("T{}".format(int(float(words.get(b"T", b"0")))), "WAIT_ON_TOOL", now)
+
+
+	def _on_m7(self, cmd, now):
+		return self._wait_on("B", "WAIT_ON_PLATFORM", now)
+
+
+	def _on_g28(self, cmd, now):
+		return [], self._move(now, self.home_time, "HOMING")
+
+
+	def _on_g0(self, cmd, now):
+		return [], self._move(now, self.move_time) if self.move_time else 0.0
+
+
+	_on_g1 = _on_g0
+
+
+	def _on_m112(self, cmd, now):
+		self._busy_until = 0.0
+		self._waiting_on = None
+		self._machine_status = "READY"
+		self._move_mode = "READY"
+		for temperature in self._temperatures.values():
+			temperature[1] = 0.0
+		return [], 0.0
+
+
+	def _on_m28(self, cmd, now):
+		parts = cmd.split(b" ", 2)
+		try:
+			size = int(parts[1])
+			name = parts[2].decode()
+		except (IndexError, ValueError):
+			return [b"open failed, File: ."], 0.0
+		if not name.startswith("0:/user/"):
+			return [b"open failed, File: " + name.encode() + b"."], 0.0
+		self._upload = [name[len("0:/user/"):], size, bytearray(), 0]
+		return [b"Writing to file: " + name.encode()], 0.0
+
+
+	def _on_m29(self, cmd, now):
+		if self._upload is None:
+			return [b"Saving file failed."], 0.0
+		name, size, contents, received = self._upload
+		self._upload = None
+		if received != size:
+			return [b"Saving file failed."], 0.0
+		self.sd_card[name] = bytes(contents)
+		return [b"Done saving file."], 0.0
+
+
+	def _on_m23(self, cmd, now):
+		name = cmd[4:].strip().decode()
+		if name.startswith("0:/user/"):
+			name = name[len("0:/user/"):]
+		if name not in self.sd_card:
+			return [b"open failed, File: " + name.encode() + b"."], 0.0
+		self._sd_file = name
+		self._sd_size = len(self.sd_card[name])
+		self._sd_position = 0.0
+		self._machine_status = "BUILDING_FROM_SD"
+		self._move_mode = "MOVING"
+		return [b"File opened: %s Size: %d" % (name.encode(), self._sd_size), b"File selected"], 0.0
+
+
+	def _on_m24(self, cmd, now):
+		if self._machine_status == "BUILDING_FROM_SD":
+			self._move_mode = "MOVING"
+		return [], 0.0
+
+
+	def _on_m25(self, cmd, now):
+		if self._machine_status == "BUILDING_FROM_SD":
+			self._move_mode = "PAUSED"
+		return [], 0.0
+
+
+	def _on_m26(self, cmd, now):
+		if self._machine_status == "BUILDING_FROM_SD":
+			self._machine_status = "READY"
+			self._move_mode = "READY"
+			if not self.progress_after_done:
+				self._sd_file = None
+		return [], 0.0
+
+
+	def _on_m27(self, cmd, now):
+		if self._sd_file is None:
+			if self.m27_idle_no_ok:
+				# answered without an ok, patched up by the connection
+				self._respond(b"CMD M27 Received.\r\n", now)
+				return None, 0.0
+			return [b"SD printing byte 0/0"], 0.0
+		return [b"SD printing byte %d/%d" % (int(self._sd_position), self._sd_size)], 0.0
+
+
+class EmulatedEndpoint(object):
+	def __init__(self, address, packet_size):
+		self._address = address
+		self._packet_size = packet_size
+
+	def getAddress(self):
+		return self._address
+
+	def getAttributes(self):
+		return usb1.TRANSFER_TYPE_BULK
+
+	def getMaxPacketSize(self):
+		return self._packet_size
+
+
+class EmulatedSetting(object):
+	def __init__(self, endpoints):
+		self._endpoints = endpoints
+
+	def __iter__(self):
+		return iter(self._endpoints)
+
+	def getNumber(self):
+		return 0
+
+	def getClass(self):
+		return 0xff
+
+	def getSubClass(self):
+		return 0
+
+	def getProtocol(self):
+		return 0
+
+	def getNumEndpoints(self):
+		return len(self._endpoints)
+
+
+class EmulatedDevice(object):
+	"""usb1.USBDevice for an EmulatedPrinter"""
+
+	def __init__(self, context, printer):
+		self._context = context
+		self.printer = printer
+		self.claimed = None
+
+	def __repr__(self):
+		return "EmulatedDevice({} {}:{})".format(self.printer.name, self.printer.bus, self.printer.addr)
+
+	def getBusNumber(self):
+		return self.printer.bus
+
+	def getDeviceAddress(self):
+		return self.printer.addr
+
+	def getVendorID(self):
+		return self.printer.vid
+
+	def getProductID(self):
+		return self.printer.pid
+
+	def getProduct(self):
+		return self.printer.name
+
+	def getSerialNumber(self):
+		return self.printer.serial
+
+	def iterConfigurations(self):
+		size = self.printer.packet_size
+		endpoints = [EmulatedEndpoint(CMD_IN, size), EmulatedEndpoint(CMD_OUT, size)]
+		if self.printer.sd_endpoints:
+			endpoints += [EmulatedEndpoint(SD_IN, size), EmulatedEndpoint(SD_OUT, size)]
+		# one configuration with one interface with one setting
+		yield [[EmulatedSetting(endpoints)]]
+
+	def open(self):
+		if self not in self._context.devices:
+			raise usb1.USBErrorNoDevice()
+		return EmulatedHandle(self._context, self)
+
+
+class EmulatedHandle(object):
+	"""usb1.USBDeviceHandle for an EmulatedDevice"""
+
+	def __init__(self, context, device):
+		self._context = context
+		self._device = device
+		self._printer = device.printer
+		self._claimed = False
+		self._closed = False
+
+	def getDevice(self):
+		return self._device
+
+	def _check(self):
+		if self._closed:
+			raise usb1.USBErrorNoDevice()
+		if self._device not in self._context.devices:
+			raise usb1.USBErrorNoDevice()
+
+	def claimInterface(self, interface):
+		self._check()
+		if self._device.claimed not in (None, self):
+			raise usb1.USBErrorBusy()
+		self._device.claimed = self
+		self._claimed = True
+		self._printer.reset()
+
+	def releaseInterface(self, interface):
+		if self._claimed:
+			self._claimed = False
+			if self._device.claimed is self:
+				self._device.claimed = None
+
+	def close(self):
+		self.releaseInterface(0)
+		self._closed = True
+
+	def bulkWrite(self, endpoint, data, timeout=0):
+		self._check()
+		self._printer.write(endpoint, data)
+		return len(data)
+
+	def bulkRead(self, endpoint, length, timeout=0):
+		self._check()
+		if endpoint == SD_IN:
+			# nothing is ever sent back on the SD endpoint
+			error = usb1.USBErrorTimeout()
+			error.received = b""
+			raise error
+		return self._printer.read(length, timeout / 1000.0 if timeout else None)
+
+	def getTransfer(self, iso_packets=0):
+		self._check()
+		return EmulatedTransfer(self._context, self)
+
+
+class EmulatedTransfer(object):
+	"""usb1.USBTransfer for bulk transfers on an EmulatedHandle, completed by EmulatedContext.handleEventsTimeout()"""
+
+	def __init__(self, context, handle):
+		self._context = context
+		self._handle = handle
+		self._endpoint = None
+		self._buffer = None
+		self._callback = None
+		self._user_data = None
+		self._timeout = 0
+		self._deadline = None
+		self._submitted = False
+		self._cancelled = False
+		self._status = None
+		self._length = 0
+
+	def setBulk(self, endpoint, buffer_or_len, callback=None, user_data=None, timeout=0):
+		if self._submitted:
+			raise ValueError("Cannot alter a submitted transfer")
+		self._endpoint = endpoint
+		self._buffer = bytearray(buffer_or_len) if isinstance(buffer_or_len, int) else buffer_or_len
+		self._callback = callback
+		self._user_data = user_data
+		self._timeout = timeout
+
+	def submit(self):
+		if self._submitted:
+			raise usb1.USBErrorBusy()
+		self._handle._check()
+		self._submitted = True
+		self._cancelled = False
+		self._status = None
+		self._length = 0
+		self._deadline = timer() + self._timeout / 1000.0 if self._timeout else None
+		self._context._submit(self)
+
+	def cancel(self):
+		if not self._submitted:
+			raise usb1.USBErrorNotFound()
+		self._cancelled = True
+		self._context._wake()
+
+	def isSubmitted(self):
+		return self._submitted
+
+	def getStatus(self):
+		return self._status
+
+	def getActualLength(self):
+		return self._length
+
+	def getBuffer(self):
+		return self._buffer
+
+	def getEndpoint(self):
+		return self._endpoint
+
+	def getUserData(self):
+		return self._user_data
+
+	def close(self):
+		if self._submitted:
+			raise ValueError("Cannot close a submitted transfer")
+		self._buffer = None
+
+	def _complete(self, now):
+		"""Return the status if the transfer can complete now, None to keep it pending"""
+
+		if self._cancelled:
+			return usb1.TRANSFER_CANCELLED
+		printer = self._handle._printer
+		if not self._endpoint & usb1.ENDPOINT_IN:
+			printer.write(self._endpoint, memoryview(self._buffer))
+			self._length = len(self._buffer)
+			return usb1.TRANSFER_COMPLETED
+		if self._endpoint != SD_IN:
+			data = printer.poll(len(self._buffer))
+			if data:
+				self._buffer[:len(data)] = data
+				self._length = len(data)
+				return usb1.TRANSFER_COMPLETED
+		if self._deadline is not None and now >= self._deadline:
+			return usb1.TRANSFER_TIMED_OUT
+		return None
+
+
+class EmulatedContext(object):
+	"""usb1.USBContext with emulated printers attached"""
+
+	def __init__(self, printers=()):
+		"""
+		Parameters:
+			printers : EmulatedPrinter instances attached at start
+		"""
+		self._cv = threading.Condition()
+		self._pending = []
+		self._hotplug = {}
+		self._handles = itertools.count(1)
+		self.devices = []
+		for printer in printers:
+			self.plug(printer)
+
+
+	@property
+	def printers(self):
+		return [device.printer for device in self.devices]
+
+
+	def open(self):
+		return self
+
+
+	def close(self):
+		self._hotplug = {}
+
+
+	def getDeviceIterator(self, skip_on_error=False):
+		return iter(list(self.devices))
+
+
+	def getDeviceList(self, skip_on_error=False):
+		return list(self.devices)
+
+
+	def plug(self, printer):
+		"""Attach a printer, reported to hotplug callbacks"""
+		device = EmulatedDevice(self, printer)
+		printer.add_listener(self._wake)
+		self.devices.append(device)
+		self._hotplug_event(device, usb1.HOTPLUG_EVENT_DEVICE_ARRIVED)
+		return device
+
+
+	def unplug(self, printer):
+		"""Detach a printer, its handles fail with USBErrorNoDevice"""
+		for device in [device for device in self.devices if device.printer is printer]:
+			self.devices.remove(device)
+			self._hotplug_event(device, usb1.HOTPLUG_EVENT_DEVICE_LEFT)
+		self._wake()
+
+
+	def hotplugRegisterCallback(self, callback, events=usb1.HOTPLUG_EVENT_DEVICE_ARRIVED | usb1.HOTPLUG_EVENT_DEVICE_LEFT,
+								flags=usb1.HOTPLUG_ENUMERATE, vendor_id=usb1.HOTPLUG_MATCH_ANY,
+								product_id=usb1.HOTPLUG_MATCH_ANY, dev_class=usb1.HOTPLUG_MATCH_ANY):
+		handle = next(self._handles)
+		self._hotplug[handle] = (callback, events, vendor_id, product_id)
+		if flags & usb1.HOTPLUG_ENUMERATE and events & usb1.HOTPLUG_EVENT_DEVICE_ARRIVED:
+			for device in list(self.devices):
+				if self._hotplug_matches(handle, device):
+					callback(self, device, usb1.HOTPLUG_EVENT_DEVICE_ARRIVED)
+		return handle
+
+
+	def hotplugDeregisterCallback(self, handle):
+		self._hotplug.pop(handle, None)
+
+
+	def _hotplug_matches(self, handle, device):
+		callback, events, vendor_id, product_id = self._hotplug[handle]
+		return vendor_id in (usb1.HOTPLUG_MATCH_ANY, device.getVendorID()) and \
+			product_id in (usb1.HOTPLUG_MATCH_ANY, device.getProductID())
+
+
+	def _hotplug_event(self, device, event):
+		for handle in list(self._hotplug):
+			callback, events = self._hotplug[handle][:2]
+			if events & event and self._hotplug_matches(handle, device) and callback(self, device, event):
+				# returning true deregisters the callback
+				del self._hotplug[handle]
+
+
+	def _submit(self, transfer):
+		with self._cv:
+			self._pending.append(transfer)
+			self._cv.notify_all()
+
+
+	def _wake(self):
+		with self._cv:
+			self._cv.notify_all()
+
+
+	def handleEventsTimeout(self, tv=0):
+		"""Complete the transfers that can complete, waiting up to tv (s) for at least one to"""
+
+		deadline = timer() + (tv or 0)
+		while True:
+			now = timer()
+			completed = []
+			with self._cv:
+				for transfer in list(self._pending):
+					status = transfer._complete(now)
+					if status is not None:
+						self._pending.remove(transfer)
+						transfer._submitted = False
+						transfer._status = status
+						completed.append(transfer)
+				if not completed:
+					remaining = deadline - now
+					if remaining <= 0:
+						return
+					self._cv.wait(min([remaining] + self._waits(now)))
+					continue
+			# callbacks run outside the lock, they usually resubmit
+			for transfer in completed:
+				if transfer._callback:
+					transfer._callback(transfer)
+			return
+
+
+	def _waits(self, now):
+		"""Times (s) until a pending transfer may be able to complete"""
+		waits = []
+		for transfer in self._pending:
+			if transfer._deadline is not None:
+				waits.append(max(0.0, transfer._deadline - now))
+			if transfer._endpoint & usb1.ENDPOINT_IN:
+				ready = transfer._handle._printer.next_ready()
+				if ready is not None:
+					waits.append(ready)
+		return waits
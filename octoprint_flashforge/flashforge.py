@@ -1,6 +1,9 @@
 import usb1
 import threading
 import re
+from collections import deque
+from functools import partial
+from timeit import default_timer as timer
 
 try:
 	import queue
@@ -10,6 +13,20 @@ except ImportError:
 from octoprint.settings import settings
 from octoprint.events import Events, eventManager
 
+from .correlation import CommandFuture, Correlator
+from .gcode import absolute_move
+from .iothread import IoError, IoThread, PRIORITY_COMMAND, PRIORITY_POLL, PRIORITY_UPLOAD, PRIORITY_URGENT
+from .logswitch import debug
+from .metrics import ConnectionMetrics
+from .minify import Minifier
+from .recorder import IN, OUT, UPLOAD
+from .response import parse_frames
+from .rxbuffer import ReceiveBuffer
+from .status import EMPTY_STATUS, parse_m105, parse_m119
+from .tracing import span
+from .upload import UploadEngine, UploadError
+from .usbasync import AsyncReader
+
 
 class FlashForgeError(Exception):
 	def __init__(self, message, error=0):
@@ -19,6 +36,15 @@ class FlashForgeError(Exception):
 
 class FlashForge(object):
 	BUFFER_SIZE = 512
+	""" Read size used if the endpoint max packet size is unknown """
+	READ_PACKETS = 8
+	""" Size of each read from the command endpoint in max size USB packets """
+	ASYNC_TRANSFERS = 4
+	""" Number of bulk IN transfers kept in flight when using asynchronous USB I/O """
+	UPLOAD_CHUNK_SIZE = 1024
+	""" Size of each write when uploading a file over the command endpoints """
+	UPLOAD_PACKETS = 16
+	""" Size of each write in max size USB packets when uploading a file over dedicated SD endpoints """
 
 	STATE_UNKNOWN = 0
 	STATE_READY = 1
@@ -31,41 +57,116 @@ class FlashForge(object):
 
 	PRINTING_STATES = [STATE_BUILDING, STATE_SD_BUILDING, STATE_SD_PAUSED]
 
+	MOVE_GCODES = [b"G0", b"G1", b"G2", b"G3"]
+	""" Commands that may be pipelined while printing from OctoPrint """
+
+	KEEP_ALIVE_IDLE = 3.0
+	""" Default max time (s) the printer tolerates the command channel being idle, most printers seem to tolerate up to
+	~3.5s but the Dremel 3D20 needs something at least every 2s (see keepAlive in the plugin profiles) """
+	KEEP_ALIVE_MARGIN = 0.75
+	""" Keep alives are sent once the channel has been idle for this fraction of the limit, so thread wake up and USB
+	write latency can not push them past it """
+	STATUS_INTERVAL = 2.0
+	""" How often (s) printer status is polled by piggybacking M119 on commands sent by OctoPrint """
+	POLL_COALESCE = 1.0
+	""" A temperature poll due within this time (s) is sent in the same transfer as a status poll """
+	NO_STATUS_GCODES = [b"M112"]
+	""" Commands that status polls must not be appended to """
+	ALWAYS_SUPPORTED_GCODES = [b"M6", b"M7", b"M105", b"M112", b"M115", b"M119", b"M601"]
+	""" Commands that are never recorded as unsupported, even if the printer did not answer them in order (eg the
+	heat and wait commands) """
+	UNSUPPORTED_MISSES = 3
+	""" Times the printer must ignore a command before it is treated as unsupported, a single answer lost in a busy
+	response does not say much """
+	MAX_UNANSWERED = 32
+	""" Number of commands tracked while waiting for the printer to answer them """
+
+	DRAIN_QUIET = 0.25
+	""" Time (s) the printer must stay quiet while draining its responses on close """
+	DRAIN_DEADLINE = 1.0
+	""" Max time (s) spent draining responses on close """
+	TEARDOWN_TIMEOUT = 2.0
+	""" Max time (s) to wait for the keep alive thread or a previous connection's USB release """
+
+	_releasing = {}
+	""" (bus, addr) -> thread releasing the USB interface of a closed connection """
+	_releasing_lock = threading.Lock()
+
 	regex_SDPrintProgress = re.compile(b"(?P<current>[0-9]+)/(?P<total>[0-9]+)")
 	""" Regex matching SD print progress from M27. """
 	regex_gcode = re.compile(b"^(N[0-9]+\s+)?(?P<gcode>[GM][0-9]+)(\s+(?P<payload>.+))?")
 	""" Regex matching gcodes in write(). """
-	regex_g1 = re.compile(
-		b"G[01](?=.* X(?P<X>-?[0-9.]+))?(?=.* Y(?P<Y>-?[0-9.]+))?(?=.* Z(?P<Z>-?[0-9.]+))?(?=.* E(?P<E>-?[0-9.]+))?(?=.* F(?P<F>[0-9.]+))?")
-	""" Regex matching move G1 commands for noG91 handling. """
 	regex_M114position = re.compile(
 		b"X:(?P<X>-?[0-9.]+) Y:(?P<Y>-?[0-9.]+) Z:(?P<Z>-?[0-9.]+) E0:(?P<E0>-?[0-9.]+)( E1:(?P<E1>-?[0-9.]+))?")
 	""" Regex matching position values from M114 """
 
-	def __init__(self, plugin, comm, usbcontext, portname, printer, read_timeout=10.0, write_timeout=10.0):
+	def __init__(self, plugin, comm, usbcontext, portname, printer, read_timeout=10.0, write_timeout=10.0,
+				 async_io=False, pipeline=0, keep_alive=KEEP_ALIVE_IDLE,
+				 upload_transfers=0, minify=False, device=None, endpoints=None, capabilities=None, recorder=None,
+				 tracer=None, io_thread=False):
 		import logging
 		self._logger = logging.getLogger("octoprint.plugins.flashforge")
 		self._logger.debug("__init__()")
+		debug.refresh()
 
 		self._plugin = plugin
 		self._comm = comm
 		self._usbcontext = usbcontext
 		self._handle = None
 		self._portname = portname
+		self._printer = printer
 		self._read_timeout = read_timeout
 		self._write_timeout = write_timeout
 		self._keep_alive_t = None
 		self._keep_alive_enabled = False
-		self._status_time = 0.0
-		self._temp_time = 0.0
+		self._keep_alive_idle = keep_alive
+		self._keep_alive_wakeup = threading.Event()
+		self._last_write = 0.0
+		self._last_status = 0.0
+		self._last_temp = 0.0
 		self._temp_interval = 0.0
-		self._autotemp_enabled = True
+		capabilities = capabilities or {}
+		self._autotemp_enabled = capabilities.get("autotemp", True)
 		self._is_autotemp = False
 		self._incoming = queue.Queue()
 		self._readlock = threading.Lock()
 		self._writelock = threading.Lock()
 		self._printerstate = self.STATE_UNKNOWN
 		self._disconnect_event = False
+		self._status = EMPTY_STATUS
+		# the identity (whole M115 answer, including the serial number) is per unit so it is only known once the
+		# printer answers, the firmware version is per model and remembered between connections
+		self._identity = None
+		self._firmware = capabilities.get("firmware")
+		self._is_autoident = False
+		self._statuslock = threading.Lock()
+
+		# learning which M commands the printer never answers (it answers in order so anything sent before the
+		# command an answer is for has been ignored)
+		self._unsupported = set(capabilities.get("unsupported", ()))
+		self._supported = set()
+		self._misses = {}			# gcode -> times the printer ignored it
+		self._unanswered = deque(maxlen=self.MAX_UNANSWERED)
+		self._tracklock = threading.Lock()
+		# matching answers with the commands that caused them, so the plugin's own commands get theirs
+		self._correlator = Correlator()
+		self._response_handlers = {
+			b"M23": self._on_m23_response,
+			b"M27": self._on_m27_response,
+			b"M105": self._on_m105_response,
+			b"M114": self._on_m114_response,
+			b"M115": self._on_m115_response,
+			b"M119": self._on_m119_response,
+			None: self._on_ack_response
+		}
+		for gcode in self.MOVE_GCODES:
+			self._response_handlers[gcode] = self._on_ack_response
+
+		# pipelining of moves while printing from OctoPrint: each entry is True if OctoPrint was already sent the ok
+		self._pipeline_window = pipeline
+		self._pipeline_credits = pipeline
+		self._pipeline = deque()
+		self._pipelinelock = threading.Lock()
 
 		self._noG91 = False
 		self._relative_pos = False
@@ -76,34 +177,59 @@ class FlashForge(object):
 		self._usb_cmd_endpoint_out = 0
 		self._usb_sd_endpoint_in = 0
 		self._usb_sd_endpoint_out = 0
-
-		for device in self._usbcontext.getDeviceIterator(skip_on_error=True):
-			if printer["bus"] == device.getBusNumber() and printer["addr"] == device.getDeviceAddress():
-				try:
-					self._handle = device.open()
-				except usb1.USBErrorAccess:
-					eventManager().fire(Events.ERROR, {
-						"error": "Found printer but there is a connection problem - check Terminal window for details.",
-						"reason": "connection"})
-					raise FlashForgeError("\r\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\r\n\r\n"
-										  "Unable to connect to FlashForge printer - permission error.\r\n\r\n"
-										  "If you are using OctoPi/Linux add permission to access this device by editing file:\r\n /etc/udev/rules.d/99-octoprint.rules\r\n\r\n"
-										  "and adding the line:\r\n"
-										  "SUBSYSTEM==\"usb\", ATTR{{idVendor}}==\"{:04x}\", MODE=\"0666\"\r\n\r\n"
-										  "You can do this as follows:\r\n"
-										  "1) Connect to your OctoPi/Octoprint device using ssh\r\n"
-										  "2) Type the following to open a text editor:\r\n"
-										  "sudo nano /etc/udev/rules.d/99-octoprint.rules\r\n"
-										  "3) Add the following line:\r\n"
-										  "SUBSYSTEM==\"usb\", ATTR{{idVendor}}==\"{:04x}\", MODE=\"0666\"\r\n"
-										  "4) Save the file and close the editor\r\n"
-										  "5) Verify the file permissions are set to \"rw-r--r--\" by typing:\r\n"
-										  "ls -al /etc/udev/rules.d/99-octoprint.rules\r\n"
-										  "6) Reboot your system for the rule to take effect.\r\n\r\n"
-										  "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\r\n\r\n".format(printer["vid"], printer["vid"]))
-				except usb1.USBError as usberror:
-					raise FlashForgeError('Unable to connect to FlashForge printer - may already be in use', usberror)
-				break
+		self._usb_cmd_read_size = self.BUFFER_SIZE
+		self._endpoints = None
+		self._upload_chunk_size = self.UPLOAD_CHUNK_SIZE
+		self._upload_transfers = upload_transfers
+		self._minifier = Minifier() if minify else None
+		self._metrics = ConnectionMetrics()
+		self._recorder = recorder
+		self._tracer = tracer
+
+		# response data from the printer, with asynchronous USB I/O it is filled by the libusb completion callbacks
+		self._rxbuffer = ReceiveBuffer()
+		self._reader = None
+		self._rxerror = None
+		self._rxcondition = threading.Condition()
+		self._rx_time = 0.0
+
+		# with an I/O thread all USB traffic goes through it
+		self._io = None
+
+		# a previous connection to this printer may still be letting go of it
+		self.wait_released(printer)
+
+		if device is None:
+			for candidate in self._usbcontext.getDeviceIterator(skip_on_error=True):
+				if printer["bus"] == candidate.getBusNumber() and printer["addr"] == candidate.getDeviceAddress():
+					device = candidate
+					break
+
+		if device is not None:
+			try:
+				self._handle = device.open()
+			except usb1.USBErrorAccess:
+				eventManager().fire(Events.ERROR, {
+					"error": "Found printer but there is a connection problem - check Terminal window for details.",
+					"reason": "connection"})
+				raise FlashForgeError("\r\n>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>\r\n\r\n"
+									  "Unable to connect to FlashForge printer - permission error.\r\n\r\n"
+									  "If you are using OctoPi/Linux add permission to access this device by editing file:\r\n /etc/udev/rules.d/99-octoprint.rules\r\n\r\n"
+									  "and adding the line:\r\n"
+									  "SUBSYSTEM==\"usb\", ATTR{{idVendor}}==\"{:04x}\", MODE=\"0666\"\r\n\r\n"
+									  "You can do this as follows:\r\n"
+									  "1) Connect to your OctoPi/Octoprint device using ssh\r\n"
+									  "2) Type the following to open a text editor:\r\n"
+									  "sudo nano /etc/udev/rules.d/99-octoprint.rules\r\n"
+									  "3) Add the following line:\r\n"
+									  "SUBSYSTEM==\"usb\", ATTR{{idVendor}}==\"{:04x}\", MODE=\"0666\"\r\n"
+									  "4) Save the file and close the editor\r\n"
+									  "5) Verify the file permissions are set to \"rw-r--r--\" by typing:\r\n"
+									  "ls -al /etc/udev/rules.d/99-octoprint.rules\r\n"
+									  "6) Reboot your system for the rule to take effect.\r\n\r\n"
+									  "<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\r\n\r\n".format(printer["vid"], printer["vid"]))
+			except usb1.USBError as usberror:
+				raise FlashForgeError('Unable to connect to FlashForge printer - may already be in use', usberror)
 
 		if not self._handle:
 			self._logger.debug("No FlashForge printer found")
@@ -115,37 +241,56 @@ class FlashForge(object):
 			raise FlashForgeError('Unable to connect to FlashForge printer - may already be in use', usberror)
 
 		self._logger.debug("claimed USB interface")
-		device = self._handle.getDevice()
-		# look for an in and out endpoint pair:
-		for configuration in device.iterConfigurations():
-			for interface in configuration:
-				for setting in interface:
-					self._logger.debug(" setting number: 0x{:02x}, class: 0x{:02x}, subclass: 0x{:02x}, protocol: 0x{:02x}, #endpoints: {}".format(
-						setting.getNumber(), setting.getClass(), setting.getSubClass(), setting.getProtocol(), setting.getNumEndpoints()))
-					endpoint_in = 0
-					endpoint_out = 0
-					for endpoint in setting:
-						self._logger.debug("  found endpoint type {} at address 0x{:02x}, max packet size {}".
-							format(usb1.libusb1.libusb_transfer_type.get(endpoint.getAttributes()),
-							endpoint.getAddress(),
-							endpoint.getMaxPacketSize()))
-						if usb1.libusb1.libusb_transfer_type.get(endpoint.getAttributes()) == 'LIBUSB_TRANSFER_TYPE_BULK':
-							address = endpoint.getAddress()
-							if address & usb1.ENDPOINT_IN:
-								endpoint_in = address
-							else:
-								endpoint_out = address
-							if endpoint_in and endpoint_out:
-								# we have a pair of endpoints, assign them as needed
-								# assume first pair is for commands, second for SD upload
-								if not self._usb_cmd_endpoint_out:
-									self._usb_cmd_endpoint_in = endpoint_in
-									self._usb_cmd_endpoint_out = endpoint_out
-									endpoint_in = endpoint_out = 0
-								elif not self._usb_sd_endpoint_out:
-									self._usb_sd_endpoint_in = endpoint_in
-									self._usb_sd_endpoint_out = endpoint_out
-									break
+		if endpoints:
+			# layout cached from an earlier connection to the same model
+			self._usb_cmd_endpoint_in = endpoints["cmd_in"]
+			self._usb_cmd_endpoint_out = endpoints["cmd_out"]
+			self._usb_sd_endpoint_in = endpoints["sd_in"]
+			self._usb_sd_endpoint_out = endpoints["sd_out"]
+			self._usb_cmd_read_size = endpoints["cmd_read_size"]
+			self._upload_chunk_size = endpoints["upload_chunk_size"]
+		else:
+			device = self._handle.getDevice()
+			# look for an in and out endpoint pair:
+			for configuration in device.iterConfigurations():
+				for interface in configuration:
+					for setting in interface:
+						self._logger.debug(" setting number: 0x{:02x}, class: 0x{:02x}, subclass: 0x{:02x}, protocol: 0x{:02x}, #endpoints: {}".format(
+							setting.getNumber(), setting.getClass(), setting.getSubClass(), setting.getProtocol(), setting.getNumEndpoints()))
+						endpoint_in = 0
+						endpoint_out = 0
+						max_packet_size = 0
+						out_packet_size = 0
+						for endpoint in setting:
+							self._logger.debug("  found endpoint type {} at address 0x{:02x}, max packet size {}".
+								format(usb1.libusb1.libusb_transfer_type.get(endpoint.getAttributes()),
+								endpoint.getAddress(),
+								endpoint.getMaxPacketSize()))
+							if usb1.libusb1.libusb_transfer_type.get(endpoint.getAttributes()) == 'LIBUSB_TRANSFER_TYPE_BULK':
+								address = endpoint.getAddress()
+								if address & usb1.ENDPOINT_IN:
+									endpoint_in = address
+									max_packet_size = endpoint.getMaxPacketSize()
+								else:
+									endpoint_out = address
+									out_packet_size = endpoint.getMaxPacketSize()
+								if endpoint_in and endpoint_out:
+									# we have a pair of endpoints, assign them as needed
+									# assume first pair is for commands, second for SD upload
+									if not self._usb_cmd_endpoint_out:
+										self._usb_cmd_endpoint_in = endpoint_in
+										self._usb_cmd_endpoint_out = endpoint_out
+										if max_packet_size:
+											# reads must be a multiple of the packet size or libusb may report an overflow
+											self._usb_cmd_read_size = max_packet_size * self.READ_PACKETS
+										endpoint_in = endpoint_out = 0
+									elif not self._usb_sd_endpoint_out:
+										self._usb_sd_endpoint_in = endpoint_in
+										self._usb_sd_endpoint_out = endpoint_out
+										if out_packet_size:
+											# dedicated endpoints are not shared with commands so can take bigger writes
+											self._upload_chunk_size = out_packet_size * self.UPLOAD_PACKETS
+										break
 
 		# if we don't have endpoints for SD upload then use the regular ones
 		if not self._usb_sd_endpoint_out:
@@ -157,9 +302,31 @@ class FlashForge(object):
 		self._logger.debug(
 			"  sd_endpoint_out 0x{:02x}, sd_endpoint_in 0x{:02x}".
 			format(self._usb_sd_endpoint_out, self._usb_sd_endpoint_in))
+		self._logger.debug("  cmd read size {}, upload chunk size {}".format(self._usb_cmd_read_size,
+																				 self._upload_chunk_size))
 		if not (self._usb_cmd_endpoint_in and self._usb_cmd_endpoint_out):
 			self.close()
 			raise FlashForgeError('Unable to find USB endpoints - turn on debug output and check octoprint.log')
+		self._endpoints = dict(cmd_in=self._usb_cmd_endpoint_in, cmd_out=self._usb_cmd_endpoint_out,
+							   sd_in=self._usb_sd_endpoint_in, sd_out=self._usb_sd_endpoint_out,
+							   cmd_read_size=self._usb_cmd_read_size, upload_chunk_size=self._upload_chunk_size)
+		if self._recorder:
+			self._recorder.start(dict(port=portname, printer=printer, endpoints=self._endpoints))
+
+		if async_io or io_thread:
+			# the I/O thread must not block in a read while requests are waiting, so responses are always received
+			# asynchronously with it
+			self._reader = AsyncReader(self._usbcontext, self._handle, self._usb_cmd_endpoint_in, self._on_async_data,
+									   self._on_async_error, self.ASYNC_TRANSFERS, self._usb_cmd_read_size)
+			try:
+				self._reader.start()
+			except usb1.USBError as usberror:
+				self._reader = None
+				self.close()
+				raise FlashForgeError('Unable to start asynchronous USB I/O', usberror)
+		if io_thread:
+			self._io = IoThread("FlashForge.IO", self._dispatch)
+			self._io.start()
 
 		self._keep_alive_t = threading.Thread(target=self.keep_alive, name="FlashForge.Keep_Alive")
 		self._keep_alive_t.daemon = True
@@ -172,7 +339,8 @@ class FlashForge(object):
 	def timeout(self):
 		"""Return timeout for reads. OctoPrint Serial Factory property"""
 
-		self._logger.debug("timeout()")
+		if debug.enabled:
+			self._logger.debug("timeout()")
 		return self._read_timeout
 
 
@@ -188,7 +356,8 @@ class FlashForge(object):
 	def write_timeout(self):
 		"""Return timeout for writes. OctoPrint Serial Factory property"""
 
-		self._logger.debug("write_timeout()")
+		if debug.enabled:
+			self._logger.debug("write_timeout()")
 		return self._write_timeout
 
 
@@ -206,6 +375,89 @@ class FlashForge(object):
 		return self._portname
 
 
+	@property
+	def status(self):
+		"""Current PrinterStatus snapshot - reading it does not generate any USB traffic"""
+		return self._status
+
+
+	@property
+	def identity(self):
+		"""Printer identity (str) from the M115 response or None if it has not been received yet"""
+		return self._identity
+
+
+	@property
+	def firmware(self):
+		"""Firmware version (str) from the M115 response, or remembered from an earlier connection to the same model"""
+		return self._firmware
+
+
+	@property
+	def endpoints(self):
+		"""USB endpoint layout of the printer, can be passed to the constructor to skip discovery next time"""
+		return self._endpoints
+
+
+	@property
+	def metrics(self):
+		"""ConnectionMetrics of this connection"""
+		return self._metrics
+
+
+	def gauges(self):
+		"""Current state of the connection for the metrics endpoint, as dict of name -> (value, help)"""
+		incoming = self._incoming
+		gauges = {
+			"connected": (1 if self._handle else 0, "1 while the printer is connected"),
+			"incoming_lines": (incoming.qsize() if incoming else 0, "Response lines buffered for readline()"),
+			"pipeline_outstanding": (len(self._pipeline), "Pipelined moves waiting for the printer's ok"),
+			"unanswered_commands": (len(self._unanswered), "M commands waiting for the printer to answer them"),
+			"pending_responses": (self._correlator.pending(), "Commands waiting to be matched with their answer"),
+		}
+		io = self._io
+		if io is not None:
+			gauges["io_queue"] = (io.queued, "USB requests waiting for the I/O thread")
+		return gauges
+
+
+	@property
+	def capabilities(self):
+		"""What has been learned about the printer, can be passed to the constructor to shorten the next handshake
+
+		Returns:
+			dict with firmware (M115 firmware version), endpoints, autotemp (simulated temperature reports wanted) and
+			unsupported (list of gcodes the printer does not answer)
+		"""
+		with self._tracklock:
+			unsupported = sorted(self._unsupported)
+		return dict(firmware=self._firmware, endpoints=self._endpoints, autotemp=self._autotemp_enabled,
+					unsupported=unsupported)
+
+
+	def is_octoprint_client(self):
+		"""Return true if this is the connection OctoPrint is using"""
+		return self._comm is not None
+
+
+	@property
+	def minifier(self):
+		"""Minifier applied to the commands sent by OctoPrint or None if minification is disabled"""
+		return self._minifier
+
+
+	@property
+	def printer(self):
+		"""Printer dict (bus, addr, vid, did) this connection was opened for"""
+		return self._printer
+
+
+	def _update_status(self, **changes):
+		"""Replace the status snapshot with one including the changes"""
+		with self._statuslock:
+			self._status = self._status.update(**changes)
+
+
 	def _valid_command(self, command):
 		""" Check if command is valid for FF (allow line numbers N for emergency shutdown M112)
 
@@ -218,40 +470,83 @@ class FlashForge(object):
 	def keep_alive(self):
 		"""Keep printer connection alive
 
-		Some printers drop the connection if they don't receive something at least every 4s, so we will send M119 to
-		get status every few seconds.
+		Some printers drop the connection if they don't receive something at least every few seconds, so if nothing
+		has been written for most of the keep alive idle time we send M119 to get status.
 		Also use for auto-reporting temperature so we can pass temp to Octoprint when the print queue is blocked by
 		printer waiting for heatup, etc otherwise OctoPrint will think the printer is not responding...
+		Rather than waking up on a fixed interval the thread sleeps until the next poll is due or it is woken up
+		because the schedule changed.
 		"""
-		exit_flag = threading.Event()
-		self._status_time = 0.0
-		self._temp_time = 0.0
-		keep_alive = 0.5
-		self._logger.debug("keep_alive() set to:{}".format(keep_alive))
+		self._logger.debug("keep_alive() idle limit:{}".format(self._keep_alive_idle))
 		# do not queue commands if the connection is going away
 		while self._handle and not self._disconnect_event:
+			wait = None
 			if self._keep_alive_enabled:
 				# even though we have blocking on the write() routine we do not want to try to write while uploading to
 				# SD etc since it can generate confusion when the upload completes and a keep alive goes through at the
 				# same time
-				self._temp_time += keep_alive
-				if self._temp_interval and self._temp_time >= self._temp_interval:
-					# do the fake auto reporting of temp OctoPrint
-					self._is_autotemp = True
-					self.write(b"M105")
-					self._temp_time = 0.0
-				self._status_time += keep_alive
-				if self._status_time >= 2.0:
-					# get status every 2s so printer gets something during long ops
-					# Dremel 3D20 seems to require something at least every 2s - other FF printers seem to be able to wait up to 3.5s
-					# may want to make this a setting
-					self.write(b"M119")
-					self._status_time = 0.0
-			if exit_flag.wait(timeout=keep_alive):
-				exit()
+				now = timer()
+				debug.check(now)
+				idle_due = self._last_write + self._keep_alive_idle * self.KEEP_ALIVE_MARGIN
+				temp_due = self._last_temp + self._temp_interval if self._temp_interval else None
+				if now >= idle_due or (temp_due is not None and now >= temp_due):
+					self._poll(temp_due is not None and now + self.POLL_COALESCE >= temp_due)
+					continue
+				wait = idle_due - now if temp_due is None else min(idle_due, temp_due) - now
+			self._keep_alive_wakeup.wait(wait)
+			self._keep_alive_wakeup.clear()
 		self._logger.debug("keep_alive() exiting")
 
 
+	def _poll(self, temperature):
+		"""Send a status poll, with a temperature poll in the same transfer if requested"""
+
+		data = b"~M119\r\n~M105\r\n" if temperature else b"~M119\r\n"
+		if debug.enabled:
+			self._logger.debug("keep_alive() poll: {}".format(data.decode().replace("\r\n", " ")))
+		start = timer()
+		future = None
+		with self._writelock:
+			if not self._handle or self._disconnect_event:
+				return
+			now = timer()
+			self._track(data, now)
+			if temperature:
+				# do the fake auto reporting of temp OctoPrint
+				self._is_autotemp = True
+				self._last_temp = now
+			if self._recorder:
+				self._recorder.record(OUT, self._usb_cmd_endpoint_out, data)
+			if self._io:
+				future = self._io.submit(partial(self._handle.bulkWrite, self._usb_cmd_endpoint_out, data,
+												 int(self._write_timeout * 1000.0)), PRIORITY_POLL)
+			else:
+				self._poll_write(data)
+			self._last_write = self._last_status = now
+		if future is not None:
+			# wait outside the lock so OctoPrint's commands can be queued ahead of the poll
+			self._poll_write(data, future)
+		tracer = self._tracer
+		if tracer is not None and tracer.enabled:
+			tracer.complete("writelock", "lock", start, now)
+			tracer.complete("keep_alive poll", "io", start, timer(), dict(data=data))
+
+
+	def _poll_write(self, data, future=None):
+		"""Write a poll, or wait for the I/O thread to write it if it was queued as future"""
+
+		try:
+			if future is None:
+				self._handle.bulkWrite(self._usb_cmd_endpoint_out, data, int(self._write_timeout * 1000.0))
+			else:
+				future.result()
+			self._metrics.cmd_out_bytes += len(data)
+		except (usb1.USBError, IoError) as usberror:
+			self._metrics.usb_errors += 1
+			if debug.enabled:
+				self._logger.debug("keep_alive() USB error {}".format(usberror))
+
+
 	def enable_keep_alive(self, enable):
 		"""Disable keep alive if we are streaming to the printer - eg file upload
 		Even though there is blocking on the read/write this helps prevent issues/simplifies
@@ -259,34 +554,39 @@ class FlashForge(object):
 		"""
 		self._logger.debug("enable_keep_alive({})".format(enable))
 		self._keep_alive_enabled = enable
-		self._temp_time = 0.0
-		self._status_time = 0.0
+		self._last_write = self._last_status = self._last_temp = timer()
+		self._keep_alive_wakeup.set()
 
 
 	def is_ready(self):
 		"""Return true if the printer is idle"""
 
-		self._logger.debug("is_ready()")
+		if debug.enabled:
+			self._logger.debug("is_ready()")
 		return self._printerstate == self.STATE_READY
 
 
 	def is_printing(self):
 		"""Return true if the printer is in any printing state"""
 
-		self._logger.debug("is_printing()")
+		if debug.enabled:
+			self._logger.debug("is_printing()")
 		return self._printerstate in self.PRINTING_STATES
 
 
 	def is_sd_printing(self):
 		"""Return true if the printer is in any printing state"""
 
-		self._logger.debug("is_sd_printing()")
+		if debug.enabled:
+			self._logger.debug("is_sd_printing()")
 		return self._printerstate in [self.STATE_SD_PAUSED, self.STATE_SD_BUILDING]
 
 
 	def disable_autotemp(self):
 		"""Disable simulated auto temp reporting if printer claims to do it"""
-		self._autotemp_enabled = False
+		if self._autotemp_enabled:
+			self._autotemp_enabled = False
+			self._plugin.on_capabilities(self)
 
 
 	def disable_G91(self, disable):
@@ -300,15 +600,22 @@ class FlashForge(object):
 		Formats the commands sent by OctoPrint to make them FlashForge friendly.
 		"""
 
-		self._logger.debug("write() called by thread {}".format(threading.currentThread().getName()))
+		if debug.enabled:
+			self._logger.debug("write() called by thread {}".format(threading.currentThread().getName()))
 		if not self._handle:
 			# do not queue commands if the connection is going away
 			return
 
+		start = timer()
 		self._writelock.acquire()
+		now = timer()
+		metrics = self._metrics
+		metrics.writelock_wait_seconds.observe(now - start)
 
 		# save the length for return on success
 		data_len = len(data)
+		pipelined = False
+		priority = PRIORITY_COMMAND
 
 		# strip carriage return, etc so we can terminate lines the FlashForge way
 		data = data.strip(b" \r\n")
@@ -317,33 +624,24 @@ class FlashForge(object):
 		# try to filter out garbage commands (we need to replace with something harmless)
 		# do this here instead of octoprint.comm.protocol.gcode.sending hook so DisplayLayerProgress plugin will work
 		if len(data) and not self._valid_command(data):
-			self._logger.debug("filtering command {0}".format(data.decode()))
+			if debug.enabled:
+				self._logger.debug("filtering command {0}".format(data.decode()))
 			data = b"M105"
 		else:
 			cmd = data.split(b' ', 1)
 			payload = b"" if len(cmd) == 1 else cmd[1]
 			gcode = cmd[0]
+			pipelined = self._pipeline_window > 0 and gcode in self.MOVE_GCODES and self._is_host_printing()
+			if gcode == b"M112":
+				# the emergency stop must not wait behind an upload
+				priority = PRIORITY_URGENT
 
 			# special handling for relative positioning support
 			if gcode in [b"G0", b"G1"] and self._noG91 and self._relative_pos:
 				# try to convert relative positioning to absolute
-				self._logger.debug("G0/G1 with rel pos")
-				match = FlashForge.regex_g1.search(data)
-				if match:
-					self._logger.debug("G1 {}".format(match.groupdict()))
-					data = b"G1"
-					for k, v in match.groupdict().items():
-						if v != None:
-							if k in ['X', 'Y', 'Z']:
-								v = self._pos[k] + float(v)
-								data += b" %s%06.4f" % (k.encode(), v)
-							elif k == 'E':
-								self._logger.debug("extruder {}, {}".format(self._extruder, self._pos[self._extruder]))
-								v = self._pos[self._extruder] + float(v)
-								data += b" %s%06.4f" % (k.encode(), v)
-							else:
-								v = int(v)
-								data += b" %s%d" % (k.encode(), v)
+				data = absolute_move(data, self._pos, self._extruder)
+				if debug.enabled:
+					self._logger.debug("G0/G1 with rel pos: {}".format(data.decode()))
 			elif gcode == b"G90":
 				self._relative_pos = False
 			elif gcode == b"G91":
@@ -352,31 +650,186 @@ class FlashForge(object):
 					data = b"G90"
 			elif gcode == b"M23":
 				# we started an SD print - make sure to set printer state
-				self._status_time = 0.0
+				self._last_status = now
 				data += b"\r\n~M119"
 			elif gcode == b"M27":
 				# make sure we have the current printer status before getting SD card progress, because SD card
 				# progress reports printing when cancelled or finished...
-				self._status_time = 0.0
+				self._last_status = now
 				data = b"M119\r\n~M27"
 			elif gcode == b"M105":
-				self._temp_time = 0.0
+				self._last_temp = now
 			elif gcode == b"M108":
 				self._extruder = "E1" if b"T1" in payload else "E0"
-				self._logger.debug("select extruder {0}".format(self._extruder))
+				if debug.enabled:
+					self._logger.debug("select extruder {0}".format(self._extruder))
 			elif gcode == b"M601":
-				# make sure we have the current printer status as soon as we connect
-				self._status_time = 0.0
+				# make sure we have the current printer status and firmware as soon as we connect, answered in the same
+				# read as the hello
+				self._last_status = now
+				self._is_autoident = True
+				data += b"\r\n~M119\r\n~M115"
+
+			if self._minifier:
+				data = self._minifier.command(data)
+
+			if self._keep_alive_enabled and now - self._last_status >= self.STATUS_INTERVAL and \
+				gcode not in self.NO_STATUS_GCODES:
+				# piggyback the status poll on this command rather than leaving it to the keep alive
+				self._last_status = now
 				data += b"\r\n~M119"
 
+		future = None
 		try:
-			self._logger.debug("write() {0}".format(data.decode()))
-			self._handle.bulkWrite(self._usb_cmd_endpoint_out, b"~%s\r\n" % data, int(self._write_timeout * 1000.0))
-			self._writelock.release()
-			return data_len
+			if debug.enabled:
+				self._logger.debug("write() {0}".format(data.decode()))
+			data = b"~%s\r\n" % data
+			self._track(data, now)
+			if self._recorder:
+				self._recorder.record(OUT, self._usb_cmd_endpoint_out, data)
+			if self._io:
+				# queued while holding the lock so the I/O thread writes commands in the order they were formatted
+				future = self._io.submit(partial(self._handle.bulkWrite, self._usb_cmd_endpoint_out, data,
+												 int(self._write_timeout * 1000.0)), priority)
+			else:
+				self._handle.bulkWrite(self._usb_cmd_endpoint_out, data, int(self._write_timeout * 1000.0))
+			self._last_write = now
+			if pipelined:
+				self._pipeline_move()
 		except usb1.USBError as usberror:
+			metrics.usb_errors += 1
 			self._writelock.release()
 			raise FlashForgeError('USB Error write()', usberror)
+		self._writelock.release()
+		if future is not None:
+			self._io_result(future, "write()")
+		end = timer()
+		metrics.writes += 1
+		metrics.cmd_out_bytes += len(data)
+		metrics.write_seconds.observe(end - start)
+		tracer = self._tracer
+		if tracer is not None and tracer.enabled:
+			tracer.complete("writelock", "lock", start, now)
+			tracer.complete("write", "io", start, end, dict(data=data))
+		return data_len
+
+
+	def _io_result(self, future, what):
+		"""Wait for a request queued on the I/O thread and return its result
+
+		Raises:
+			FlashForgeError if the USB request failed or the connection was closed before it ran
+		"""
+		try:
+			return future.result()
+		except (usb1.USBError, IoError) as usberror:
+			self._metrics.usb_errors += 1
+			raise FlashForgeError("USB Error {}".format(what), usberror)
+
+
+	def _track(self, data, now):
+		"""Record the commands written to the printer so their answers go to OctoPrint, and remember the M commands
+		(and when) so ones it never answers can be spotted"""
+
+		expect = self._correlator.expect
+		for line in data.split(b"\r\n"):
+			if line:
+				gcode = line.lstrip(b"~").split(b" ", 1)[0]
+				expect(gcode)
+				if gcode.startswith(b"M"):
+					# _answered() walks the deque on the reader thread
+					with self._tracklock:
+						self._unanswered.append((gcode, now))
+
+
+	def _answered(self, gcode):
+		"""The printer answered a command - anything sent before it that is still waiting was ignored"""
+
+		with self._tracklock:
+			self._supported.add(gcode)
+			self._misses.pop(gcode, None)
+			changed = gcode.decode() in self._unsupported
+			if changed:
+				self._logger.info("printer answered {}, no longer treated as unsupported".format(gcode.decode()))
+				self._unsupported.discard(gcode.decode())
+			ignored = []
+			if any(sent == gcode for sent, when in self._unanswered):
+				while True:
+					sent, when = self._unanswered.popleft()
+					if sent == gcode:
+						self._metrics.latency(gcode, timer() - when)
+						break
+					if sent not in self.ALWAYS_SUPPORTED_GCODES:
+						ignored.append(sent)
+					if sent in self._supported or sent in self.ALWAYS_SUPPORTED_GCODES or \
+						sent.decode() in self._unsupported:
+						continue
+					misses = self._misses.get(sent, 0) + 1
+					if misses < self.UNSUPPORTED_MISSES:
+						self._misses[sent] = misses
+						continue
+					del self._misses[sent]
+					self._logger.info("printer did not answer {}, treating it as unsupported".format(sent.decode()))
+					self._unsupported.add(sent.decode())
+					changed = True
+		for sent in ignored:
+			# no answer is coming for it, so it must not take the answer of a later command with the same gcode
+			self._correlator.skip(sent)
+		if changed:
+			self._plugin.on_capabilities(self)
+
+
+	def forget_unsupported(self):
+		"""Forget the commands learned to be unsupported, they are sent to the printer again"""
+
+		with self._tracklock:
+			self._unsupported.clear()
+			self._misses.clear()
+		self._logger.info("forgot unsupported commands")
+		self._plugin.on_capabilities(self)
+
+
+	def _is_host_printing(self):
+		"""Return true if OctoPrint is streaming a print to the printer (rather than printing from SD)"""
+		return self._comm is not None and self._comm.isPrinting() and not self._comm.isSdPrinting()
+
+
+	def _pipeline_move(self):
+		"""Track a move sent while printing from OctoPrint
+
+		If there is credit left in the pipeline window, acknowledge the move to OctoPrint straight away so it sends the
+		next line without waiting for the printer. The real ok is swallowed when it arrives.
+		"""
+		with self._pipelinelock:
+			preacked = self._pipeline_credits > 0
+			if preacked:
+				self._pipeline_credits -= 1
+				self._incoming.put(b"ok")
+			self._pipeline.append(preacked)
+
+
+	def _pipeline_ack(self):
+		"""An ok arrived for the oldest pipelined move
+
+		Returns:
+			True if the ok must be passed on to OctoPrint, False if it was already acknowledged
+		"""
+		with self._pipelinelock:
+			if not self._pipeline:
+				return True
+			preacked = self._pipeline.popleft()
+			if preacked:
+				self._pipeline_credits += 1
+			return not preacked
+
+
+	def _pipeline_reset(self):
+		"""Forget outstanding moves - the printer has gone quiet so no more oks are coming"""
+		with self._pipelinelock:
+			if self._pipeline and debug.enabled:
+				self._logger.debug("pipeline reset with {} moves outstanding".format(len(self._pipeline)))
+			self._pipeline.clear()
+			self._pipeline_credits = self._pipeline_window
 
 
 	def writeraw(self, data, command = True):
@@ -386,15 +839,164 @@ class FlashForge(object):
 		command: True to send g-code, False to send to upload SD card
 		"""
 
-		self._logger.debug("writeraw() called by thread {}".format(threading.currentThread().getName()))
+		if debug.enabled:
+			self._logger.debug("writeraw() called by thread {}".format(threading.currentThread().getName()))
 
+		endpoint = self._usb_cmd_endpoint_out if command else self._usb_sd_endpoint_out
+		recorder = self._recorder
+		if recorder:
+			if command:
+				recorder.record(OUT, endpoint, bytes(data))
+			else:
+				recorder.record(UPLOAD, endpoint, bytes(data) if recorder.upload_data else None, len(data))
 		try:
-			self._handle.bulkWrite(self._usb_cmd_endpoint_out if command else self._usb_sd_endpoint_out, data)
+			if self._io:
+				# upload data gives way to commands queued in between its chunks
+				self._io_result(self._io.submit(partial(self._handle.bulkWrite, endpoint, data),
+												PRIORITY_COMMAND if command else PRIORITY_UPLOAD), "writeraw()")
+			else:
+				self._handle.bulkWrite(endpoint, data)
+			self._last_write = timer()
+			if command:
+				self._metrics.cmd_out_bytes += len(data)
+			else:
+				self._metrics.sd_out_bytes += len(data)
 			return len(data)
 		except usb1.USBError as usberror:
+			self._metrics.usb_errors += 1
 			raise FlashForgeError('USB Error writeraw()', usberror)
 
 
+	def upload(self, file, size, progress=None):
+		"""Stream a file to the SD endpoint, the caller must have started the transfer with M28
+
+		Parameters:
+			file : file object opened in binary mode
+			size : number of bytes to send
+			progress : optional function(sent, size) called as data is sent
+
+		Returns:
+			Number of bytes sent
+		"""
+		self._logger.debug("upload() {} bytes in {} byte chunks, {} transfers".format(
+			size, self._upload_chunk_size, self._upload_transfers))
+		if not self._handle:
+			raise FlashForgeError("Not connected")
+
+		start = timer()
+		sent = self._upload(file, size, progress)
+		end = timer()
+		metrics = self._metrics
+		metrics.uploads += 1
+		metrics.upload_bytes += sent
+		metrics.upload_seconds.observe(end - start)
+		if self._tracer is not None and self._tracer.enabled:
+			self._tracer.complete("upload", "io", start, end, dict(bytes=sent))
+		return sent
+
+
+	def _upload(self, file, size, progress):
+		"""Send the file data for upload(), returns the number of bytes sent"""
+
+		if self._upload_transfers:
+			engine = UploadEngine(self._usbcontext, self._handle, self._usb_sd_endpoint_out, self._upload_chunk_size,
+								  self._upload_transfers, self._write_timeout)
+			try:
+				# the engine drives its own transfers on this thread, so the I/O thread stays free for M112 and commands
+				sent = engine.send(file, size, progress)
+			except UploadError as error:
+				raise FlashForgeError("USB upload failed", error)
+			self._last_write = timer()
+			self._metrics.sd_out_bytes += sent
+			if self._recorder:
+				self._recorder.record(UPLOAD, self._usb_sd_endpoint_out, None, sent)
+			return sent
+
+		# stream the file through a single reusable buffer so memory use does not depend on the file size, the buffer
+		# is writable so libusb can use it without making a copy
+		view = memoryview(bytearray(self._upload_chunk_size))
+		sent = 0
+		while sent < size:
+			try:
+				length = file.readinto(view[:min(self._upload_chunk_size, size - sent)])
+			except (IOError, OSError) as error:
+				raise FlashForgeError("Unable to read file", error)
+			if not length:
+				raise FlashForgeError("Unexpected end of file")
+			if not self.writeraw(view[:length], False):
+				raise FlashForgeError("File transfer interrupted")
+			sent += length
+			if progress:
+				progress(sent, size)
+		return sent
+
+
+	def sd_upload(self, file, size, remote_name, progress=None):
+		"""Upload a file to the printer SD card
+
+		Makes sure the heaters are off, creates the file with M28, streams the data and closes the file with M29.
+
+		Parameters:
+			file : file object opened in binary mode
+			size : number of bytes to send
+			remote_name : name of the file on the SD card (in 0:/user/)
+			progress : optional function(sent, size) called as data is sent
+
+		Returns:
+			Time (s) taken to transfer the file data
+
+		Raises:
+			FlashForgeError with the reason the upload failed
+		"""
+		# there must be something coming back from the printer (eg keep alive) or we will block here until the
+		# Octoprint comm monitor readline times out
+		tracer = self._tracer
+		with span(tracer, "makeexclusive", "lock"):
+			self.makeexclusive(True)
+		self.enable_keep_alive(False)
+		try:
+			# make sure heaters are off
+			with span(tracer, "heaters off", "upload"):
+				# one round trip for all of them, only the first answer matters
+				ok, answer = self.sendcommands([b"M104 S0 T0", b"M104 S0 T1", b"M140 S0"])[0]
+				if not ok:
+					self._logger.info("sd_upload() printer busy: {}".format(answer))
+					raise FlashForgeError("printer busy")
+
+			ok, answer = self.sendcommand(b"M28 %d 0:/user/%s" % (size, remote_name.encode()), 5000)
+			if not ok or b"open failed" in answer:
+				self._logger.info("sd_upload() M28 failed: {}".format(answer))
+				if answer and b"open failed" in answer:
+					self._plugin.on_sd_open_failed(self)
+				raise FlashForgeError("could not create file on printer SD card")
+
+			self._logger.debug("M28 file tx started")
+			# with dedicated SD endpoints commands can not end up in the file data, so the I/O thread lets other threads'
+			# commands in between the chunks (with shared endpoints only M112 gets through)
+			interleave = self._io is not None and self._usb_sd_endpoint_out != self._usb_cmd_endpoint_out
+			if interleave:
+				self._io.release()
+			start = timer()
+			try:
+				self.upload(file, size, progress)
+			except FlashForgeError as ffe:
+				self._logger.info("sd_upload() interrupted: {}".format(ffe))
+				raise FlashForgeError("file transfer incomplete")
+			finally:
+				if interleave:
+					self._io.hold()
+			elapsed = timer() - start
+
+			with span(tracer, "close file", "upload"):
+				result, response = self.sendcommand(b"M29", 10000)
+			if not result or b"failed" in response:
+				raise FlashForgeError("file transfer incomplete")
+			return elapsed
+		finally:
+			self.makeexclusive(False)
+			self.enable_keep_alive(True)
+
+
 	def readline(self):
 		"""Read line worth of response from printer. OctoPrint Serial Factory method
 
@@ -405,158 +1007,306 @@ class FlashForge(object):
 			List of lines returned from the printer
 		"""
 
-		self._logger.debug("readline() called by thread {}".format(threading.currentThread().getName()))
+		if debug.enabled:
+			self._logger.debug("readline() called by thread {}".format(threading.currentThread().getName()))
+
+		if self._io:
+			return self._readline_io()
 
+		start = timer()
 		self._readlock.acquire()
+		locked = timer()
+		metrics = self._metrics
+		metrics.readlock_wait_seconds.observe(locked - start)
+		metrics.readlines += 1
 
 		# return any line we have buffered
 		if not self._incoming.empty():
 			self._readlock.release()
+			self._readline_done(start, locked)
 			return self._incoming.get_nowait()
 
-		# fetch some data
-		data = self.readraw()
-		# parse and buffer it
-		data = self._parse_response(data)
-		if b"CMD M601 " in data:
-			# should also be getting a status response
-			status = self.readraw()
-			# parse and buffer it
-			data += self._parse_response(status)
+		# fetch some data, parse and buffer it
+		frames = self._parse_response(self._receive(lines=True))
+		if not frames and self._pipeline:
+			self._pipeline_reset()
+		gcodes = [frame.gcode for frame in frames]
+		if b"M601" in gcodes:
+			# should also be getting the status and firmware responses sent with the hello
+			while frames and (self._is_autoident or b"M119" not in gcodes):
+				frames = self._parse_response(self._receive(lines=True))
+				gcodes.extend(frame.gcode for frame in frames)
+			if self._is_autoident:
+				# timed out waiting for our M115, its answer must not swallow the one to an M115 from OctoPrint
+				self._is_autoident = False
 
 		self._readlock.release()
+		self._readline_done(start, locked)
 		# return the buffer
 		return self._incoming.get_nowait()
 
 
+	def _readline_io(self):
+		"""readline() with an I/O thread: wait for it to buffer a line instead of reading from the printer"""
+
+		start = timer()
+		self._metrics.readlines += 1
+		try:
+			line = self._incoming.get(timeout=self._read_timeout)
+		except queue.Empty:
+			line = b""
+			self._metrics.read_timeouts += 1
+			# our M115 sent with the hello went unanswered, do not swallow the answer to one from OctoPrint
+			self._is_autoident = False
+			if self._pipeline:
+				self._pipeline_reset()
+		if self._rxerror is not None:
+			raise FlashForgeError("USB Error readline()", self._rxerror)
+		self._readline_done(start, start)
+		return line
+
+
+	def _readline_done(self, start, locked):
+		"""Record the time taken by readline() that started at start and got the read lock at locked"""
+
+		end = timer()
+		self._metrics.readline_seconds.observe(end - start)
+		tracer = self._tracer
+		if tracer is not None and tracer.enabled:
+			tracer.complete("readlock", "lock", start, locked)
+			tracer.complete("readline", "io", start, end)
+
+
 	def _parse_response(self, data):
 		"""Parse raw data from printer into lines and buffer them
 
-		Manipulates printer response if necessary into something OctoPrint understands, breaks into lines and stores
-		in a buffer for readline() method.
+		Splits the response into per command frames and passes each to the handler for its gcode (if any) to
+		manipulate it into something OctoPrint understands. The resulting lines are stored in a buffer for the
+		readline() method.
+
+		Parameters:
+			data : bytes or list of lines received from the printer
+
+		Returns:
+			List of response frames
 		"""
-		if len(data):
-			if b"CMD M27 " in data:
-				# need to filter out bogus SD print progress from cancelled or paused prints
-				if b"printing byte" in data:
-					match = FlashForge.regex_SDPrintProgress.search(data)
-					if match:
-						try:
-							current = int(match.group("current"))
-							total = int(match.group("total"))
-						except:
-							pass
-						else:
-							# Note: there is an issue with .gx files indicating the current byte size is greater than the
-							# total when the print is started
-							if self._printerstate == self.STATE_READY and current >= total:
-								# Ultra 3D: after completing print it still indicates SD card progress
-								data = b"CMD M27 Received.\r\nDone printing file\r\nok\r\n"
-							elif self._printerstate in [self.STATE_SD_PAUSED, self.STATE_SD_BUILDING] and \
-								not self._comm.isSdFileSelected():
-								# user manually started a print or we connected while one was running
-								data = b"File opened: SD_printing.gcode Size: %d\r\nok\r\n" % total
-							elif self._printerstate == self.STATE_SD_PAUSED:
-								# when paused still printer indicates printing so change the response
-								# TODO: there may be a proper way to signal this using "action"?
-								data = b"CMD M27 Received.\r\nPrinting paused\r\nok\r\n"
-								if self._comm.isSdPrinting():
-									# this is for when we connect and the printer is printing but paused or the user
-									# manually paused the print using the printer screen. doesn't seem to be a way to
-									# tell OctoPrint the correct state so we do it the dirty way
-									self._comm._changeState(self._comm.STATE_PAUSED)
-							elif self._printerstate != self.STATE_SD_BUILDING:
-								# after print is cancelled M27 always looks like its printing from sd card
-								data = b"CMD M27 Received.\r\nNot SD printing\r\nok\r\n"
-
-				elif not data.strip().endswith(b"ok"):
-					# for Dremel 3D20 not responding correctly when not printing from SD card:
-					if self._printerstate == self.STATE_READY:
-						data = b"CMD M27 Received.\r\nDone printing file\r\nok\r\n"
-					else:
-						data += b"ok\r\n"
-
-			elif b"CMD M105 " in data:
-				if self._is_autotemp:
-					# this was generated as an auto temp report by our keep alive so filter out the CMD and OK
-					# so as not to confuse the OctoPrint buffer counter
-					data = data.replace(b"CMD M105 Received.\r\n", b"")
-					# TODO: add " W:?" to the string to indicate that the printer is waiting to get to temp if state
-					#  indicates waiting on tool or bed. This should prevent OctoPrint from triggering timeouts?
-					if not (b"CMD " in data and self._printerstate in [self.STATE_SD_BUILDING, self.STATE_SD_PAUSED]):
-						# do not drop the "ok" if there is the response to another command in here and we are printing from SD?
-						data = data.replace(b"\r\nok", b"")
-				self._is_autotemp = False
-
-			elif b"CMD M114 " in data:
-				# looks like get current position returns A: and B: for extruders?
-				data = data.replace(b" A:", b" E0:").replace(b" B:", b" E1:")
-				match = FlashForge.regex_M114position.search(data)
-				if match:
-					for k, v in match.groupdict().items():
-						if v != None:
-							self._pos[k] = float(v)
-					self._logger.debug("pos: {}".format(self._pos))
+		frames = parse_frames(data.splitlines() if isinstance(data, bytes) else data)
+		self._buffer_frames(self._route_frames(frames))
+		return frames
 
-			elif b"CMD M115 " in data:
-				# Try to make the firmware response more readable by OctoPrint
-				data = data.replace(b"Firmware:", b"FIRMWARE_NAME: FlashForge VER:")
-
-			elif b"CMD M119 " in data:
-				# this was generated by us so do not return anything to OctoPrint
-				oldstate = self._printerstate
-				if b"MachineStatus: READY" in data:
-					if b"MoveMode: READY" in data:
-						self._printerstate = self.STATE_READY
-					elif b"MoveMode: WAIT_ON_TOOL" in data or b"MoveMode: WAIT_ON_PLATFORM" in data:
-						# printing directly and printer waiting for bed or extruder to heat up
-						self._printerstate = self.STATE_WAIT_ON_TEMP
-					elif b"MoveMode: HOMING" in data:
-						# printing directly and printer waiting for bed or extruder to heat up
-						self._printerstate = self.STATE_HOMING
-					else:
-						# moving or homing
-						self._printerstate = self.STATE_BUSY
-				elif b"MachineStatus: BUILDING_FROM_SD" in data:
-					if b"MoveMode: PAUSED" in data:
-						self._printerstate = self.STATE_SD_PAUSED
-					else:
-						self._printerstate = self.STATE_SD_BUILDING
-				else:
-					self._printerstate = self.STATE_BUSY
-				# Remove M119 response (assuming it is the last part of the response, other command may be at the front)
-				# Typically if something is prepended, it will be a move related command.
-				data = data.split(b"CMD M119 ")[0]
-				if len(data) and (self._printerstate == self.STATE_READY or self._printerstate == self.STATE_SD_PAUSED):
-					# If the printer is still moving it will send the ok associated with the command later. If it has
-					# completed the movement a separate ok is never sent so we add it here
-					data += b"ok\r\n"
-
-				if oldstate != self._printerstate:
-					self._logger.debug("state changed from {} to {}".format(oldstate, self._printerstate))
-					# force temp reporting if busy while direct printing and waiting for extruder/bed to heat up
-					# (unless printer reports autotemp) so OctoPrint sees something.
-					# TODO: use OctoPrint state instead to decide when to do the temp check - ie if printing and temp wait
-					if self._printerstate == self.STATE_WAIT_ON_TEMP and self._autotemp_enabled:
-						self._temp_interval = settings().getFloat(["serial", "timeout", "temperatureAutoreport"])
-					else:
-						self._temp_interval = 0.0
-					# TODO: if we just connected and the printer is printing from SD then trigger an M27 to get
-					#		OctoPrint to detect SD printing
-
-			if len(data):
-				# turn data into list of lines
-				datalines = data.splitlines()
-				for i, line in enumerate(datalines):
-					self._logger.debug("buffering: {}".format(line))
-					self._incoming.put(line)
-			else:
-				self._incoming.put(data)
 
+	def _route_frames(self, frames):
+		"""Hand the answers to the plugin's own commands to their CommandFuture
+
+		Returns:
+			List of the frames for OctoPrint, answers nobody is waiting for any more are dropped
+		"""
+		others = []
+		resolve = self._correlator.resolve
+		for frame in frames:
+			if frame.gcode is not None:
+				self._answered(frame.gcode)
+				if resolve(frame) is not None:
+					continue
+			others.append(frame)
+		return others
+
+
+	def _buffer_frames(self, frames):
+		"""Pass frames through the response handlers and buffer the resulting lines for readline()"""
+
+		lines = []
+		previous = None
+		for frame in frames:
+			handler = self._response_handlers.get(frame.gcode)
+			lines.extend(handler(frame, previous) if handler else frame.tolines())
+			previous = frame
+
+		if lines:
+			if debug.enabled:
+				for line in lines:
+					self._logger.debug("buffering: {}".format(line))
+			for line in lines:
+				self._incoming.put(line)
 		else:
-			self._incoming.put(data)
+			self._incoming.put(b"")
 
-		return data
+
+	def _on_ack_response(self, frame, previous):
+		"""Move or a bare ok - drop the ok if it belongs to a pipelined move OctoPrint has already been sent one for"""
+
+		if frame.ok and self._pipeline and not self._pipeline_ack():
+			frame.ok = False
+		return frame.tolines()
+
+
+	def _on_m23_response(self, frame, previous):
+		"""Select SD file - let the plugin know if the file is not on the card"""
+
+		if frame.contains(b"open failed"):
+			self._plugin.on_sd_open_failed(self)
+		return frame.tolines()
+
+
+	def _on_m27_response(self, frame, previous):
+		"""SD print progress - need to filter out bogus progress from cancelled or paused prints"""
+
+		progress = None
+		for line in frame.lines:
+			if b"printing byte" in line:
+				progress = line
+				break
+
+		if progress is not None:
+			match = FlashForge.regex_SDPrintProgress.search(progress)
+			if match:
+				try:
+					current = int(match.group("current"))
+					total = int(match.group("total"))
+				except:
+					pass
+				else:
+					self._update_status(sd_progress=(current, total))
+					# Note: there is an issue with .gx files indicating the current byte size is greater than the
+					# total when the print is started
+					if self._printerstate == self.STATE_READY and current >= total:
+						# Ultra 3D: after completing print it still indicates SD card progress
+						return [b"CMD M27 Received.", b"Done printing file", b"ok"]
+					elif self._printerstate in [self.STATE_SD_PAUSED, self.STATE_SD_BUILDING] and \
+						self._comm is not None and not self._comm.isSdFileSelected():
+						# user manually started a print or we connected while one was running
+						return [b"File opened: SD_printing.gcode Size: %d" % total, b"ok"]
+					elif self._printerstate == self.STATE_SD_PAUSED:
+						# when paused still printer indicates printing so change the response
+						# TODO: there may be a proper way to signal this using "action"?
+						if self._comm is not None and self._comm.isSdPrinting():
+							# this is for when we connect and the printer is printing but paused or the user
+							# manually paused the print using the printer screen. doesn't seem to be a way to
+							# tell OctoPrint the correct state so we do it the dirty way
+							self._comm._changeState(self._comm.STATE_PAUSED)
+						return [b"CMD M27 Received.", b"Printing paused", b"ok"]
+					elif self._printerstate != self.STATE_SD_BUILDING:
+						# after print is cancelled M27 always looks like its printing from sd card
+						return [b"CMD M27 Received.", b"Not SD printing", b"ok"]
+
+		elif not frame.ok:
+			# for Dremel 3D20 not responding correctly when not printing from SD card:
+			if self._printerstate == self.STATE_READY:
+				return [b"CMD M27 Received.", b"Done printing file", b"ok"]
+			frame.ok = True
+
+		return frame.tolines()
+
+
+	def _on_m105_response(self, frame, previous):
+		"""Temperature report"""
+
+		temperatures = parse_m105(frame.lines)
+		if temperatures:
+			self._update_status(temperatures=temperatures)
+		if self._is_autotemp:
+			# this was generated as an auto temp report by our keep alive so filter out the CMD and OK
+			# so as not to confuse the OctoPrint buffer counter
+			# TODO: add " W:?" to the string to indicate that the printer is waiting to get to temp if state
+			#  indicates waiting on tool or bed. This should prevent OctoPrint from triggering timeouts?
+			self._is_autotemp = False
+			return frame.lines
+		return frame.tolines()
+
+
+	def _on_m114_response(self, frame, previous):
+		"""Current position"""
+
+		for i, line in enumerate(frame.lines):
+			# looks like get current position returns A: and B: for extruders?
+			line = frame.lines[i] = line.replace(b" A:", b" E0:").replace(b" B:", b" E1:")
+			match = FlashForge.regex_M114position.search(line)
+			if match:
+				for k, v in match.groupdict().items():
+					if v != None:
+						self._pos[k] = float(v)
+				if debug.enabled:
+					self._logger.debug("pos: {}".format(self._pos))
+				self._update_status(position=dict(self._pos))
+		return frame.tolines()
+
+
+	def _on_m115_response(self, frame, previous):
+		"""Firmware info"""
+
+		if frame.lines:
+			self._identity = " ".join(line.strip().decode("utf-8", "replace") for line in frame.lines)
+			firmware = None
+			for line in frame.lines:
+				if line.startswith(b"Firmware:"):
+					firmware = line[9:].strip().decode("utf-8", "replace")
+					break
+			if firmware is not None and firmware != self._firmware:
+				if self._firmware is not None:
+					# what was learned about the old firmware no longer applies
+					self._logger.info("firmware changed from {} to {}".format(self._firmware, firmware))
+					with self._tracklock:
+						self._unsupported.clear()
+				self._firmware = firmware
+				self._plugin.on_capabilities(self)
+		if self._is_autoident:
+			# sent with the hello by us so do not return anything to OctoPrint
+			self._is_autoident = False
+			return []
+		# Try to make the firmware response more readable by OctoPrint
+		frame.lines = [line.replace(b"Firmware:", b"FIRMWARE_NAME: FlashForge VER:") for line in frame.lines]
+		return frame.tolines()
+
+
+	def _on_m119_response(self, frame, previous):
+		"""Printer status - this was generated by us so do not return anything to OctoPrint"""
+
+		machine_status, move_mode = parse_m119(frame.lines)
+		self._update_status(machine_status=machine_status, move_mode=move_mode)
+		oldstate = self._printerstate
+		if machine_status == "READY":
+			if move_mode == "READY":
+				self._printerstate = self.STATE_READY
+			elif move_mode == "WAIT_ON_TOOL" or move_mode == "WAIT_ON_PLATFORM":
+				# printing directly and printer waiting for bed or extruder to heat up
+				self._printerstate = self.STATE_WAIT_ON_TEMP
+			elif move_mode == "HOMING":
+				# printing directly and printer waiting for bed or extruder to heat up
+				self._printerstate = self.STATE_HOMING
+			else:
+				# moving or homing
+				self._printerstate = self.STATE_BUSY
+		elif machine_status == "BUILDING_FROM_SD":
+			if move_mode == "PAUSED":
+				self._printerstate = self.STATE_SD_PAUSED
+			else:
+				self._printerstate = self.STATE_SD_BUILDING
+		else:
+			self._printerstate = self.STATE_BUSY
+
+		if oldstate != self._printerstate:
+			self._logger.debug("state changed from {} to {}".format(oldstate, self._printerstate))
+			# force temp reporting if busy while direct printing and waiting for extruder/bed to heat up
+			# (unless printer reports autotemp) so OctoPrint sees something.
+			# TODO: use OctoPrint state instead to decide when to do the temp check - ie if printing and temp wait
+			if self._printerstate == self.STATE_WAIT_ON_TEMP and self._autotemp_enabled:
+				self._temp_interval = settings().getFloat(["serial", "timeout", "temperatureAutoreport"])
+			else:
+				self._temp_interval = 0.0
+			# poll schedule may have changed
+			self._keep_alive_wakeup.set()
+			# TODO: if we just connected and the printer is printing from SD then trigger an M27 to get
+			#		OctoPrint to detect SD printing
+
+		if previous is not None and not previous.ok and \
+			(self._printerstate == self.STATE_READY or self._printerstate == self.STATE_SD_PAUSED):
+			# If the printer is still moving it will send the ok associated with the previous command later. If it
+			# has completed the movement a separate ok is never sent so we add it here
+			previous.ok = True
+			if (previous.gcode is None or previous.gcode in self.MOVE_GCODES) and not self._pipeline_ack():
+				return []
+			return [b"ok"]
+		return []
 
 
 	def readraw(self, timeout=-1):
@@ -570,22 +1320,142 @@ class FlashForge(object):
 			String containing response from the printer
 		"""
 
-		data = b""
+		if self._io:
+			raise FlashForgeError("readraw() cannot be used with the I/O thread, use sendcommand()")
+		return self._receive(timeout)
+
+
+	def _receive(self, timeout=-1, lines=False):
+		"""
+		Read from the printer until the response is complete or timeout
+
+		Parameters:
+			timeout : max time to wait in ms
+			lines : true to return a list of lines instead of bytes
+
+		Returns:
+			bytes or list of lines containing response from the printer
+		"""
+
 		if timeout == -1:
 			timeout = int(self._read_timeout * 1000.0)
-		self._logger.debug("readraw() called by thread: {}, timeout: {}".format(threading.currentThread().getName(), timeout))
+		if debug.enabled:
+			self._logger.debug("readraw() called by thread: {}, timeout: {}".format(threading.currentThread().getName(), timeout))
+
+		start = timer()
+		metrics = self._metrics
+		rxbuffer = self._rxbuffer
+		if self._reader:
+			self._waitasync(timeout)
+			with self._rxcondition:
+				data = rxbuffer.takelines(True) if lines else rxbuffer.take()
+		else:
+			recorder = self._recorder
+			endpoint = self._usb_cmd_endpoint_in
+			try:
+				# read data from USB until ok signals end or timeout
+				while not rxbuffer.complete():
+					received = self._handle.bulkRead(endpoint, self._usb_cmd_read_size, timeout)
+					metrics.reads += 1
+					metrics.in_bytes += len(received)
+					if recorder:
+						recorder.record(IN, endpoint, received)
+					rxbuffer.write(received)
+			except usb1.USBErrorTimeout as usberror:
+				if debug.enabled:
+					self._logger.debug("readraw() TIMEOUT")
+				metrics.read_timeouts += 1
+				# keep anything that arrived before the timeout
+				received = getattr(usberror, "received", b"")
+				if received:
+					metrics.in_bytes += len(received)
+					if recorder:
+						recorder.record(IN, endpoint, received)
+				rxbuffer.write(received)
+			except usb1.USBError as usberror:
+				metrics.usb_errors += 1
+				rxbuffer.clear()
+				raise FlashForgeError("USB Error readraw()", usberror)
+			data = rxbuffer.takelines(True) if lines else rxbuffer.take()
+		end = timer()
+		metrics.read_seconds.observe(end - start)
+		if self._tracer is not None and self._tracer.enabled:
+			self._tracer.complete("readraw", "io", start, end, dict(timeout=timeout))
+
+		if debug.enabled:
+			self._logger.debug("readraw() returns: {}".format(
+				b" | ".join(data).decode() if lines else data.decode().replace("\r\n", " | ")))
+		return data
 
-		try:
-			# read data from USB until ok signals end or timeout
-			while not data.strip().endswith(b"ok"):
-				data += self._handle.bulkRead(self._usb_cmd_endpoint_in, self.BUFFER_SIZE, timeout)
-		except usb1.USBErrorTimeout:
-			self._logger.debug("readraw() TIMEOUT")
-		except usb1.USBError as usberror:
-			raise FlashForgeError("USB Error readraw()", usberror)
 
-		self._logger.debug("readraw() returns: {}".format(data.decode().replace("\r\n", " | ")))
-		return data
+	def _waitasync(self, timeout):
+		"""Wait for the asynchronous reader to collect a complete response (or timeout)"""
+
+		deadline = timer() + timeout / 1000.0
+		with self._rxcondition:
+			while not self._rxbuffer.complete() and self._rxerror is None:
+				remaining = deadline - timer()
+				if remaining <= 0:
+					if debug.enabled:
+						self._logger.debug("readraw() TIMEOUT")
+					self._metrics.read_timeouts += 1
+					break
+				self._rxcondition.wait(remaining)
+			if self._rxerror is not None:
+				raise FlashForgeError("USB Error readraw()", self._rxerror)
+
+
+	def _on_async_data(self, data):
+		"""Called with data received from the printer, from whichever thread is handling libusb events (the reader's,
+		the device index or an SD upload), so it must only take locks that are never held while handling events"""
+
+		if self._recorder:
+			self._recorder.record(IN, self._usb_cmd_endpoint_in, bytes(data))
+		with self._rxcondition:
+			self._metrics.reads += 1
+			self._metrics.in_bytes += len(data)
+			self._rxbuffer.write(data)
+			self._rx_time = timer()
+			self._rxcondition.notify_all()
+		if self._io:
+			self._io.wake()
+
+
+	def _on_async_error(self, error):
+		"""Called if the command endpoint fails, from whichever thread is handling libusb events"""
+
+		with self._rxcondition:
+			self._metrics.usb_errors += 1
+			self._rxerror = error
+			self._rxcondition.notify_all()
+		if self._io:
+			# wake up readline() so it reports the error
+			self._incoming.put(b"")
+
+
+	def _dispatch(self):
+		"""I/O thread - parse the responses received so far and hand them to whoever is waiting for them
+
+		Answers to the plugin's own commands go to their CommandFuture, everything else is buffered for readline().
+
+		Returns:
+			Max time (s) until it must be called again, None to wait for more data
+		"""
+		rxbuffer = self._rxbuffer
+		with self._rxcondition:
+			if not len(rxbuffer):
+				return None
+			if not rxbuffer.complete():
+				# wait for the rest of the response unless the printer has gone quiet
+				quiet = timer() - self._rx_time
+				if quiet < self._read_timeout:
+					return self._read_timeout - quiet
+			lines = rxbuffer.takelines(True)
+
+		others = self._route_frames(parse_frames(lines))
+		if others:
+			self._buffer_frames(others)
+		return None
 
 
 	def sendcommand(self, cmd, timeout=1000, readresponse=True):
@@ -602,35 +1472,124 @@ class FlashForge(object):
 			Optional : string containing response from the printer
 		"""
 
-		self._logger.debug("sendcommand() {}".format(cmd.decode()))
-
-		self.writeraw(b"~%s\r\n" % cmd)
 		if not readresponse:
+			if debug.enabled:
+				self._logger.debug("sendcommand() {}".format(cmd.decode()))
+			self._send_commands([cmd])[0].abandon()
+			self._metrics.commands += 1
 			return True, None
+		return self.sendcommands([cmd], timeout)[0]
 
-		# read response, make sure we are getting the command we sent
-		gcode = b"CMD %s " % cmd.split(b" ", 1)[0]
-		response = b""
-		while True:
-			response = self.readraw(timeout)
-			# TODO: if response is multiline and contains response to a previous command as well as this one then
-			#  we lose the previous command. We might need to parse each line and save old responses into the buffer
-			if not response or gcode in response:
-				break
-			# we got the response from some previous OctoPrint command so parse it into the buffer used for
-			# OctoPrint listener so it will be read later
-			self._parse_response(response)
-		# note that sometimes the ok response is not terminated with \r\n eg M104 on Dreamer
-		if b"\r\nok" in response:
-			self._logger.debug("sendcommand() got an ok")
-			return True, response
-		return False, response
+
+	def sendcommands(self, commands, timeout=1000):
+		"""
+		Send several g-code commands to the printer in one transfer and wait for all the answers, so they take a
+		single round trip
+
+		Parameters:
+			commands : list of FF formatted g-code commands
+			timeout : max time to wait for all the answers in ms
+
+		Returns:
+			List with a (ok, response) tuple per command as returned by sendcommand(), in the order of commands
+		"""
+
+		if debug.enabled:
+			self._logger.debug("sendcommand() {}".format(" | ".join(cmd.decode() for cmd in commands)))
+
+		start = timer()
+		futures = self._send_commands(commands)
+		deadline = start + timeout / 1000.0
+		if self._io:
+			# the I/O thread resolves the futures as the answers arrive
+			for future in futures:
+				future.wait(max(0.0, deadline - timer()))
+		else:
+			# read the answers ourselves, anything else is the response to some previous OctoPrint command so it is
+			# buffered for OctoPrint to read later
+			while not all(future.done() for future in futures):
+				remaining = deadline - timer()
+				if remaining <= 0:
+					break
+				response = self._receive(max(1, int(remaining * 1000.0)))
+				if not response:
+					break
+				others = self._route_frames(parse_frames(response.splitlines()))
+				if others:
+					self._buffer_frames(others)
+
+		end = timer()
+		metrics = self._metrics
+		metrics.commands += len(futures)
+		metrics.sendcommand_seconds.observe(end - start)
+		results = []
+		for future in futures:
+			if not future.done():
+				# a late answer is dropped rather than passed to OctoPrint
+				future.abandon()
+			# note that sometimes the ok response is not terminated with \r\n eg M104 on Dreamer
+			ok = future.ok
+			if not ok:
+				metrics.command_failures += 1
+			elif debug.enabled:
+				self._logger.debug("sendcommand() got an ok for {}".format(future.gcode.decode()))
+			results.append((ok, future.response))
+		if self._tracer is not None and self._tracer.enabled:
+			self._tracer.complete("sendcommand", "io", start, end, dict(cmd=b" | ".join(commands),
+																		 ok=all(ok for ok, response in results)))
+		return results
+
+
+	def _send_commands(self, commands):
+		"""Write commands in one transfer with a pending response record for each
+
+		Returns:
+			List of CommandFuture, one per command
+		"""
+		futures = [CommandFuture(cmd) for cmd in commands]
+		data = b"".join(b"~%s\r\n" % cmd for cmd in commands)
+		if not self._io:
+			# the caller has exclusive use of the connection (makeexclusive()) so nothing can be written in between
+			self._expect(futures)
+			self.writeraw(data)
+			return futures
+
+		# record and queue in one go so the records are in the order the commands go out
+		with self._writelock:
+			self._expect(futures)
+			if self._recorder:
+				self._recorder.record(OUT, self._usb_cmd_endpoint_out, data)
+			future = self._io.submit(partial(self._handle.bulkWrite, self._usb_cmd_endpoint_out, data), PRIORITY_COMMAND)
+		self._io_result(future, "sendcommand()")
+		self._last_write = timer()
+		self._metrics.cmd_out_bytes += len(data)
+		return futures
+
+
+	def _expect(self, futures):
+		"""Record the plugin commands about to be written"""
+		now = timer()
+		expect = self._correlator.expect
+		for future in futures:
+			expect(future.gcode, future)
+			if future.gcode.startswith(b"M"):
+				with self._tracklock:
+					self._unanswered.append((future.gcode, now))
 
 
 	def makeexclusive(self, exclusive):
-		"""	Obtain exclusive use of the connection for the current thread"""
+		"""	Obtain exclusive use of the connection for the current thread
+
+		With an I/O thread this only defers the USB requests of other threads, they are not blocked until they wait
+		for their own request and readline() keeps returning responses.
+		"""
 
-		if exclusive:
+		if self._io:
+			if exclusive:
+				self._io.hold()
+			else:
+				self._io.release()
+		elif exclusive:
 			self._readlock.acquire()
 			self._writelock.acquire()
 		else:
@@ -639,42 +1598,110 @@ class FlashForge(object):
 
 
 	def close(self):
-		"""	Close USB connection and cleanup. OctoPrint Serial Factory method"""
+		"""	Close USB connection and cleanup. OctoPrint Serial Factory method
+
+		Takes at most DRAIN_DEADLINE plus the keep alive's current write to return, the USB interface is released in
+		the background (see wait_released()).
+		"""
 
 		self._logger.debug("close()")
+		start = timer()
 
 		self._disconnect_event = True
-		if self._keep_alive_t:
-			self._keep_alive_t.join()
+		self._keep_alive_wakeup.set()
+		if self._keep_alive_t and self._keep_alive_t is not threading.current_thread():
+			self._keep_alive_t.join(self.TEARDOWN_TIMEOUT)
+
+		if self._io:
+			# requests still queued fail, the threads waiting on them get an error
+			self._io.stop()
+
+		if self._reader:
+			# stop the asynchronous transfers so the endpoint can be drained below
+			self._reader.stop()
+			self._reader = None
 
 		# cleanup
-		if self._handle:
-			self._logger.debug("closing handle...")
-			if not self._readlock.locked():
-				# TODO: try to fetch any pending replies from the printer.
-				#  This doesn't really work properly right now as sometimes the printer stops returning responses...
-				#  Unfortunately if we close the port without reading all pending data it seems to break subsequent
-				#  connections to the printer, requiring a printer reboot
-				self._readlock.acquire()
+		handle = self._handle
+		if handle:
+			if self._readlock.acquire(False):
+				# If we close the port without reading all pending data it seems to break subsequent connections to the
+				# printer, requiring a printer reboot. So read until the printer has been quiet for a moment, but do
+				# not let a chatty printer hold up the disconnect.
 				try:
-					while True:
-						data = self._handle.bulkRead(self._usb_cmd_endpoint_in, self.BUFFER_SIZE, 3000)
-						self._logger.debug("bulkRead() {}".format(data.decode().replace("\r\n", " | ")))
-				except usb1.USBError as usberror:
-					self._logger.debug("bulkRead() error {}".format(usberror))
-					pass
-				self._readlock.release()
-			try:
-				self._handle.releaseInterface(0)
-			except usb1.USBError as usberror:
-				self._logger.debug("Error releasing handle {}".format(usberror))
-				pass
-			try:
-				self._handle.close()
-			except usb1.USBError as usberror:
-				raise FlashForgeError("Error closing USB handle", usberror)
+					self._drain(handle)
+				finally:
+					self._readlock.release()
 			self._handle = None
+			thread = threading.Thread(target=self._release, args=(handle,), name="FlashForge.Release")
+			thread.daemon = True
+			with FlashForge._releasing_lock:
+				FlashForge._releasing[(self._printer["bus"], self._printer["addr"])] = thread
+			thread.start()
+
+		if self._recorder:
+			self._recorder.stop()
 
 		self._incoming = None
+		self._logger.info("closed connection to {} in {:.3f}s".format(self._portname, timer() - start))
+
+		self._plugin.on_disconnect(self)
+
+
+	def _drain(self, handle):
+		"""Read and discard responses until the printer is quiet for DRAIN_QUIET or DRAIN_DEADLINE passes"""
+
+		deadline = timer() + self.DRAIN_DEADLINE
+		while True:
+			remaining = deadline - timer()
+			if remaining <= 0:
+				self._logger.debug("drain deadline reached")
+				break
+			try:
+				data = handle.bulkRead(self._usb_cmd_endpoint_in, self._usb_cmd_read_size,
+									   max(1, int(min(self.DRAIN_QUIET, remaining) * 1000.0)))
+			except usb1.USBError as usberror:
+				self._logger.debug("bulkRead() error {}".format(usberror))
+				break
+			if self._recorder:
+				self._recorder.record(IN, self._usb_cmd_endpoint_in, data)
+			self._logger.debug("bulkRead() {}".format(data.decode().replace("\r\n", " | ")))
+
 
-		self._plugin.on_disconnect()
+	def _release(self, handle):
+		"""Release the USB interface and close the handle - runs on its own thread so close() does not wait on it"""
+
+		start = timer()
+		try:
+			handle.releaseInterface(0)
+		except usb1.USBError as usberror:
+			self._logger.debug("Error releasing handle {}".format(usberror))
+		try:
+			handle.close()
+		except usb1.USBError as usberror:
+			self._logger.info("Error closing USB handle {}".format(usberror))
+		with FlashForge._releasing_lock:
+			key = (self._printer["bus"], self._printer["addr"])
+			if FlashForge._releasing.get(key) is threading.current_thread():
+				del FlashForge._releasing[key]
+		self._logger.debug("released {} in {:.3f}s".format(self._portname, timer() - start))
+
+
+	@staticmethod
+	def wait_released(printer=None, timeout=TEARDOWN_TIMEOUT):
+		"""Wait for closed connections to finish releasing their USB interface
+
+		Parameters:
+			printer : printer dict (bus, addr) to wait for, None to wait for every printer
+			timeout : max time (s) to wait
+
+		Returns:
+			True if nothing is being released any more
+		"""
+		with FlashForge._releasing_lock:
+			threads = [thread for key, thread in FlashForge._releasing.items()
+					   if printer is None or key == (printer["bus"], printer["addr"])]
+		deadline = timer() + timeout
+		for thread in threads:
+			thread.join(max(0.0, deadline - timer()))
+		return not any(thread.is_alive() for thread in threads)
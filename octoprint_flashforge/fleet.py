@@ -0,0 +1,352 @@
+"""
+Fleet of FlashForge printers connected to the same host.
+
+The Fleet owns the shared USB context and one FlashForge connection per device. Each connection gets its own worker
+thread that runs queued jobs (commands, SD uploads) one at a time, so jobs for different printers run concurrently.
+The printer OctoPrint is connected to is just another member of the fleet - its connection is created through the
+serial factory hook and OctoPrint does the reading, for every other printer the worker also reads (and so parses the
+status of) the printer responses.
+"""
+import os
+import threading
+
+import usb1
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+from .devices import DeviceIndex
+from .flashforge import FlashForge, FlashForgeError
+
+
+class Job(object):
+	"""A queued fleet job - wait() for it to finish and then check result or error"""
+
+	def __init__(self, description, function):
+		self.description = description
+		self.result = None
+		self.error = None
+		self._function = function
+		self._done = threading.Event()
+
+
+	def __repr__(self):
+		return "Job({}{})".format(self.description, ", done" if self.done() else "")
+
+
+	def run(self, connection):
+		try:
+			self.result = self._function(connection)
+		except (FlashForgeError, IOError, OSError) as error:
+			self.error = error
+		except Exception as error:
+			# a bug in the job must not take the printer's worker thread down with it
+			import logging
+			logging.getLogger("octoprint.plugins.flashforge").exception("fleet job {} failed".format(self.description))
+			self.error = error
+		finally:
+			self._done.set()
+
+
+	def cancel(self, reason):
+		self.error = FlashForgeError(reason)
+		self._done.set()
+
+
+	def done(self):
+		return self._done.is_set()
+
+
+	def wait(self, timeout=None):
+		"""Wait for the job to finish, returns true if it did"""
+		return self._done.wait(timeout)
+
+
+class Member(object):
+	"""A connected printer and the worker thread that runs its jobs"""
+
+	POLL_TIMEOUT = 0.5
+	""" Max time (s) the worker waits for printer responses before checking for jobs """
+	STOP_TIMEOUT = 2.0
+	""" Max time (s) stop() waits for the job being run, it fails by itself once the connection is closed """
+
+	def __init__(self, portname, connection, octoprint):
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+
+		self.portname = portname
+		self.connection = connection
+		self.octoprint = octoprint
+		self._jobs = queue.Queue()
+		self._running = True
+		self._thread = threading.Thread(target=self._work, name="FlashForge.Fleet.{}".format(portname))
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def submit(self, job):
+		if not self._running:
+			job.cancel("Printer disconnected")
+		else:
+			self._jobs.put(job)
+		return job
+
+
+	def stop(self):
+		self._running = False
+		# wake the worker up rather than waiting for its poll to time out
+		self._jobs.put(None)
+		if self._thread is not threading.current_thread():
+			self._thread.join(self.STOP_TIMEOUT)
+			if self._thread.is_alive():
+				self._logger.info("fleet worker for {} is still busy, not waiting for it".format(self.portname))
+		# anything still queued will never run
+		while True:
+			try:
+				job = self._jobs.get_nowait()
+			except queue.Empty:
+				break
+			if job:
+				job.cancel("Printer disconnected")
+
+
+	def _work(self):
+		self._logger.debug("fleet worker for {} started".format(self.portname))
+		while self._running:
+			try:
+				job = self._jobs.get(timeout=self.POLL_TIMEOUT) if self.octoprint else self._jobs.get_nowait()
+			except queue.Empty:
+				if not self.octoprint:
+					# nobody else reads from this printer, drain the responses so status stays up to date
+					try:
+						self.connection.readline()
+					except (FlashForgeError, AttributeError) as error:
+						# connection closed underneath us
+						self._logger.debug("fleet worker for {} read failed: {}".format(self.portname, error))
+						break
+				continue
+			if job is None:
+				# woken up by stop()
+				continue
+			self._logger.debug("fleet {} running {}".format(self.portname, job))
+			job.run(self.connection)
+		self._running = False
+		self._logger.debug("fleet worker for {} exiting".format(self.portname))
+
+
+class Fleet(object):
+	"""Connections to every FlashForge printer on the host"""
+
+	def __init__(self, plugin, vendor_ids, capabilities=None):
+		"""
+		Parameters:
+			plugin : FlashForgePlugin, notified about the connection used by OctoPrint
+			vendor_ids : dict of supported USB vendor ids -> vendor name
+			capabilities : optional CapabilityStore to remember what each printer model supports between connections
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+
+		self._plugin = plugin
+		self._vendor_ids = vendor_ids
+		self._capabilities = capabilities
+		self._usbcontext = None
+		self._devices = None
+		self._members = {}
+		self._lock = threading.RLock()
+
+
+	@property
+	def usbcontext(self):
+		if not self._usbcontext:
+			self._usbcontext = usb1.USBContext()
+			self._usbcontext.open()
+		return self._usbcontext
+
+
+	@property
+	def devices(self):
+		"""DeviceIndex of the attached printers, started on first use"""
+		with self._lock:
+			if not self._devices:
+				self._devices = DeviceIndex(self.usbcontext, self._vendor_ids)
+				self._devices.start()
+			return self._devices
+
+
+	def printers(self):
+		"""Return dict of port name -> printer dict (bus, addr, vid, did) of the attached printers"""
+		return self.devices.printers()
+
+
+	def connected(self):
+		"""Return the port names of the connected printers"""
+		with self._lock:
+			return list(self._members.keys())
+
+
+	def connection(self, portname):
+		"""Return the FlashForge connection for the printer or None if it is not connected"""
+		with self._lock:
+			member = self._members.get(portname)
+		return member.connection if member else None
+
+
+	def detect(self):
+		"""Return dict of port name -> printer dict of the attached printers
+
+		The device index is kept up to date by hotplug events (or periodic enumeration) so this does not do any USB I/O.
+		"""
+		return self.printers()
+
+
+	def connect(self, portname, comm=None, **options):
+		"""Connect to a printer
+
+		Parameters:
+			portname : port name from detect()
+			comm : OctoPrint MachineCom if OctoPrint is connecting, None for a printer managed by the fleet only
+			options : FlashForge connection options
+
+		Returns:
+			FlashForge connection
+		"""
+		printer = self.printers().get(portname)
+		if not printer:
+			raise FlashForgeError("Unknown printer {}".format(portname))
+		with self._lock:
+			member = self._members.get(portname)
+			if member:
+				if comm is None:
+					return member.connection
+				# OctoPrint takes over a printer the fleet was managing
+				self.disconnect(portname)
+
+		if comm is None:
+			options.setdefault("read_timeout", Member.POLL_TIMEOUT)
+		capabilities = self._capabilities.get(printer) if self._capabilities else None
+		endpoints = self.devices.endpoints(printer) or (capabilities or {}).get("endpoints")
+		# FlashForge calls on_connect() once it is up which adds it to the fleet
+		connection = FlashForge(self, comm, self.usbcontext, portname, printer, device=self.devices.device(printer),
+								endpoints=endpoints, capabilities=capabilities, **options)
+		self.devices.set_endpoints(printer, connection.endpoints)
+		if capabilities is None:
+			# first connection to this model
+			self.on_capabilities(connection)
+		return connection
+
+
+	def disconnect(self, portname):
+		"""Close the connection to a printer"""
+		connection = self.connection(portname)
+		if connection:
+			connection.close()
+
+
+	def close(self):
+		"""Disconnect every printer and release the USB context"""
+		for portname in self.connected():
+			self.disconnect(portname)
+		if self._devices:
+			self._devices.stop()
+			self._devices = None
+		# handles must be closed before the context
+		FlashForge.wait_released()
+		if self._usbcontext:
+			self._usbcontext.close()
+			self._usbcontext = None
+
+
+	def status(self, portname):
+		"""Return the PrinterStatus snapshot of a connected printer or None"""
+		connection = self.connection(portname)
+		return connection.status if connection else None
+
+
+	def submit(self, portname, description, function):
+		"""Queue function(connection) to run on the printer's worker thread
+
+		Returns:
+			Job
+		"""
+		with self._lock:
+			member = self._members.get(portname)
+		job = Job(description, function)
+		if not member:
+			job.cancel("Printer {} is not connected".format(portname))
+			return job
+		return member.submit(job)
+
+
+	def command(self, portname, cmd, timeout=1000):
+		"""Queue a command (FlashForge formatted g-code, bytes) for a printer
+
+		Returns:
+			Job, result is (ok, response)
+		"""
+		def send(connection):
+			connection.makeexclusive(True)
+			try:
+				return connection.sendcommand(cmd, timeout)
+			finally:
+				connection.makeexclusive(False)
+		return self.submit(portname, "command {}".format(cmd.decode()), send)
+
+
+	def upload(self, portname, path, remote_name=None):
+		"""Queue an upload of a local file to a printer's SD card
+
+		Returns:
+			Job, result is the remote file name
+		"""
+		remote_name = remote_name or os.path.basename(path)
+
+		def upload(connection):
+			with open(path, "rb") as file:
+				connection.sd_upload(file, os.fstat(file.fileno()).st_size, remote_name)
+			return remote_name
+		return self.submit(portname, "upload {}".format(remote_name), upload)
+
+
+	def forget_unsupported(self):
+		"""Forget the commands learned to be unsupported by every printer model and connected printer"""
+		if self._capabilities:
+			self._capabilities.forget_unsupported()
+		with self._lock:
+			members = list(self._members.values())
+		for member in members:
+			member.connection.forget_unsupported()
+
+
+	##~~ FlashForge connection callbacks
+
+	def on_connect(self, connection):
+		with self._lock:
+			member = Member(connection.port, connection, connection.is_octoprint_client())
+			self._members[connection.port] = member
+		self._logger.info("fleet: connected to {}".format(connection.port))
+		if member.octoprint:
+			self._plugin.on_connect(connection)
+
+
+	def on_disconnect(self, connection):
+		with self._lock:
+			member = self._members.get(connection.port)
+			if not member or member.connection is not connection:
+				return
+			del self._members[connection.port]
+		member.stop()
+		self._logger.info("fleet: disconnected from {}".format(connection.port))
+		if member.octoprint:
+			self._plugin.on_disconnect()
+
+
+	def on_capabilities(self, connection):
+		if self._capabilities:
+			self._capabilities.update(connection.printer, connection.capabilities)
+
+
+	def on_sd_open_failed(self, connection):
+		self._plugin.on_sd_open_failed(connection)
@@ -0,0 +1,40 @@
+"""
+G-code parsing for the plugin hooks (str commands, command word only) and the FlashForge connection and minifier
+(bytes commands, tokenized into words).
+"""
+import re
+
+regex_command = re.compile(r"^[GMT][0-9]+")
+""" Regex matching the command word at the start of a command queued by OctoPrint. """
+regex_word = re.compile(b"([A-Z])[ \t]*([-+]?[0-9.]+)")
+""" Regex matching a single address/value word eg "X10.5" - findall() tokenizes a line in one pass. """
+
+MOVE_FORMATS = {b"X": (b"X%06.4f", "X"), b"Y": (b"Y%06.4f", "Y"), b"Z": (b"Z%06.4f", "Z"), b"E": (b"E%06.4f", None)}
+""" Output format and position key for each axis of an absolute move, None is the active extruder """
+
+
+def is_command(cmd):
+	"""Return true if cmd (str) starts with a G, M or T command word"""
+	return regex_command.match(cmd) is not None
+
+
+def absolute_move(line, pos, extruder):
+	"""Translate a relative G0/G1 move into an absolute G1 move
+
+	Parameters:
+		line : relative move eg b"G1 X10 E-1 F300"
+		pos : dict of current axis positions, keys "X", "Y", "Z", "E0", "E1"
+		extruder : key of the active extruder in pos
+
+	Returns:
+		Absolute G1 move (bytes)
+	"""
+	parts = [b"G1"]
+	append = parts.append
+	for letter, value in regex_word.findall(line):
+		axis = MOVE_FORMATS.get(letter)
+		if axis:
+			append(axis[0] % (pos[axis[1] or extruder] + float(value)))
+		elif letter == b"F":
+			append(b"F%d" % int(float(value)))
+	return b" ".join(parts)
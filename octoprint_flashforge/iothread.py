@@ -0,0 +1,218 @@
+"""
+Single owner thread for the USB I/O of a printer connection.
+
+Callers queue requests - functions run on the owner thread - with a priority and get an IoFuture back, so they only
+ever wait for their own I/O. Requests run one at a time in priority order (first in first out within a priority).
+While a thread holds the connection (eg streaming a file to the SD card over the command endpoints) requests from
+other threads are deferred rather than blocking them on a lock, apart from urgent ones.
+"""
+import heapq
+import itertools
+import threading
+from timeit import default_timer as timer
+
+PRIORITY_URGENT = 0
+""" Emergency stop, runs even while another thread holds the connection """
+PRIORITY_COMMAND = 1
+""" Commands from OctoPrint and the plugin """
+PRIORITY_POLL = 2
+""" Keep alive and status polls """
+PRIORITY_UPLOAD = 3
+""" SD upload data, commands get in between the chunks """
+
+
+class IoError(Exception):
+	pass
+
+
+class IoFuture(object):
+	"""Result of a queued request - wait() for it to finish and then get its result()"""
+
+	__slots__ = ("priority", "owner", "_function", "_done", "_result", "_error")
+
+	def __init__(self, function, priority, owner):
+		self.priority = priority
+		self.owner = owner
+		self._function = function
+		self._done = threading.Event()
+		self._result = None
+		self._error = None
+
+
+	def done(self):
+		return self._done.is_set()
+
+
+	def wait(self, timeout=None):
+		"""Wait for the request to run, returns true if it did"""
+		return self._done.wait(timeout)
+
+
+	def result(self, timeout=None):
+		"""Wait for the request and return the function's result, or raise its exception
+
+		Raises:
+			IoError if the request did not run within timeout (s) or the I/O thread stopped before it could
+		"""
+		if not self._done.wait(timeout):
+			raise IoError("timed out")
+		if self._error is not None:
+			raise self._error
+		return self._result
+
+
+	def _run(self):
+		try:
+			self._result = self._function()
+		except Exception as error:
+			self._error = error
+		self._done.set()
+
+
+	def _fail(self, error):
+		self._error = error
+		self._done.set()
+
+
+class IoThread(object):
+	"""Thread that runs every USB request of a connection"""
+
+	def __init__(self, name, on_wake=None):
+		"""
+		Parameters:
+			name : thread name
+			on_wake : called on the I/O thread after each request and when woken with wake(), returns the max time (s)
+				until it must be called again or None
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._name = name
+		self._on_wake = on_wake
+		self._cv = threading.Condition()
+		self._queue = []			# heap of (priority, sequence, IoFuture)
+		self._sequence = itertools.count()
+		self._holder = None
+		self._holds = 0
+		self._woken = False
+		self._running = False
+		self._thread = None
+
+
+	@property
+	def queued(self):
+		"""Number of requests waiting to run"""
+		return len(self._queue)
+
+
+	def start(self):
+		self._running = True
+		self._thread = threading.Thread(target=self._run, name=self._name)
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self, timeout=1.0):
+		"""Stop the thread, requests that have not run yet fail with IoError"""
+
+		with self._cv:
+			self._running = False
+			self._cv.notify_all()
+		if self._thread and self._thread is not threading.current_thread():
+			self._thread.join(timeout)
+		with self._cv:
+			pending = [entry[2] for entry in self._queue]
+			self._queue = []
+		for future in pending:
+			future._fail(IoError("connection closed"))
+
+
+	def is_io_thread(self):
+		return self._thread is threading.current_thread()
+
+
+	def submit(self, function, priority=PRIORITY_COMMAND):
+		"""Queue function() to run on the I/O thread
+
+		Returns:
+			IoFuture, already done if called from the I/O thread itself (the function is run straight away)
+		"""
+		future = IoFuture(function, priority, threading.current_thread().ident)
+		if self.is_io_thread():
+			future._run()
+			return future
+		with self._cv:
+			if not self._running:
+				future._fail(IoError("connection closed"))
+				return future
+			heapq.heappush(self._queue, (priority, next(self._sequence), future))
+			self._cv.notify()
+		return future
+
+
+	def wake(self):
+		"""Have on_wake() called on the I/O thread, eg because response data arrived"""
+		with self._cv:
+			self._woken = True
+			self._cv.notify()
+
+
+	def hold(self):
+		"""Defer requests from other threads (except urgent ones) until release(), calls may be nested"""
+		with self._cv:
+			ident = threading.current_thread().ident
+			while self._holder not in (None, ident):
+				self._cv.wait()
+			self._holder = ident
+			self._holds += 1
+
+
+	def release(self):
+		with self._cv:
+			if self._holder == threading.current_thread().ident:
+				self._holds -= 1
+				if not self._holds:
+					self._holder = None
+					self._cv.notify_all()
+
+
+	def _next(self):
+		"""Remove and return the next request that may run, must be called with the condition held"""
+
+		queue = self._queue
+		if not queue:
+			return None
+		if self._holder is None or queue[0][0] == PRIORITY_URGENT or queue[0][2].owner == self._holder:
+			return heapq.heappop(queue)[2]
+		for entry in sorted(queue):
+			if entry[0] == PRIORITY_URGENT or entry[2].owner == self._holder:
+				queue.remove(entry)
+				heapq.heapify(queue)
+				return entry[2]
+		return None
+
+
+	def _run(self):
+		self._logger.debug("{} started".format(self._name))
+		wait = None
+		while True:
+			with self._cv:
+				deadline = None if wait is None else timer() + wait
+				request = self._next()
+				while request is None and self._running and not self._woken:
+					remaining = None if deadline is None else deadline - timer()
+					if remaining is not None and remaining <= 0:
+						break
+					self._cv.wait(remaining)
+					request = self._next()
+				if not self._running:
+					break
+				self._woken = False
+			if request is not None:
+				request._run()
+			if self._on_wake:
+				try:
+					wait = self._on_wake()
+				except Exception:
+					self._logger.exception("{} response handling failed".format(self._name))
+					wait = None
+		self._logger.debug("{} exiting".format(self._name))
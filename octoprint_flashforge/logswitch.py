@@ -0,0 +1,42 @@
+"""
+Debug logging of the hot paths (every command written, line read and upload chunk) is decided when the log level may
+have changed instead of on every call, so with debug off the per line cost is one attribute test rather than building
+messages (thread names, decoded responses) that are thrown away.
+"""
+import logging
+from timeit import default_timer as timer
+
+
+class DebugSwitch(object):
+	"""Whether a logger has debug enabled, for hot paths to test as a plain attribute"""
+
+	CHECK_INTERVAL = 5.0
+	""" Max time (s) between checks of the log level when nothing says it changed (eg set from OctoPrint's logging
+	settings) """
+
+	def __init__(self, name):
+		"""
+		Parameters:
+			name : logger name
+		"""
+		self._logger = logging.getLogger(name)
+		self._checked = 0.0
+		self.enabled = False
+		self.refresh()
+
+
+	def refresh(self):
+		"""Check the log level now, call when it may have changed"""
+		self.enabled = self._logger.isEnabledFor(logging.DEBUG)
+		self._checked = timer()
+		return self.enabled
+
+
+	def check(self, now):
+		"""Check the log level if it has not been checked for CHECK_INTERVAL, for threads that wake up regularly"""
+		if now - self._checked >= self.CHECK_INTERVAL:
+			self.refresh()
+
+
+debug = DebugSwitch("octoprint.plugins.flashforge")
+""" Debug switch of the plugin logger, shared by the plugin and its connections """
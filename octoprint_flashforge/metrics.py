@@ -0,0 +1,149 @@
+"""
+Connection metrics cheap enough to be left on: plain counters and fixed bucket histograms, exported in the Prometheus
+text format.
+
+Updates are unsynchronized increments made under the connection's read or write lock (or from a single thread), so
+they cost a few attribute updates and a bisect. Scraping reads the values without locking, a scrape taken while an
+update is in progress may be off by one.
+"""
+import bisect
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+""" Upper bounds (s) of the buckets used for command and I/O latencies """
+UPLOAD_BUCKETS = (1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+""" Upper bounds (s) of the buckets used for SD upload times """
+
+PREFIX = "flashforge_"
+
+
+class Histogram(object):
+	"""Count of observations per fixed bucket, with their sum"""
+
+	__slots__ = ("buckets", "counts", "sum", "count")
+
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)		# last entry is +Inf
+		self.sum = 0.0
+		self.count = 0
+
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+
+class ConnectionMetrics(object):
+	"""Metrics of one printer connection"""
+
+	COUNTERS = [
+		# attribute, metric name, labels, help
+		("writes", "writes_total", None, "Commands written by write()"),
+		("cmd_out_bytes", "usb_out_bytes_total", 'endpoint="cmd"', "Bytes written to the printer"),
+		("sd_out_bytes", "usb_out_bytes_total", 'endpoint="sd"', "Bytes written to the printer"),
+		("reads", "usb_reads_total", None, "Reads of printer responses"),
+		("in_bytes", "usb_in_bytes_total", None, "Bytes received from the printer"),
+		("read_timeouts", "usb_read_timeouts_total", None, "Reads that timed out before the response was complete"),
+		("usb_errors", "usb_errors_total", None, "USB errors on reads and writes"),
+		("readlines", "readlines_total", None, "Lines returned to OctoPrint by readline()"),
+		("commands", "sendcommand_total", None, "Commands sent by the plugin with sendcommand()"),
+		("command_failures", "sendcommand_failures_total", None, "sendcommand() calls that did not get an ok"),
+		("uploads", "uploads_total", None, "Files streamed to the SD card"),
+		("upload_bytes", "upload_bytes_total", None, "Bytes streamed to the SD card"),
+	]
+	HISTOGRAMS = [
+		("write_seconds", "write_seconds", "Time spent in write() including the USB write"),
+		("writelock_wait_seconds", "writelock_wait_seconds", "Time write() waited for the write lock"),
+		("read_seconds", "readraw_seconds", "Time spent reading a complete response"),
+		("readline_seconds", "readline_seconds", "Time spent in readline()"),
+		("readlock_wait_seconds", "readlock_wait_seconds", "Time readline() waited for the read lock"),
+		("sendcommand_seconds", "sendcommand_seconds", "Round trip time of sendcommand()"),
+		("upload_seconds", "upload_seconds", "Time taken to stream a file to the SD card"),
+	]
+
+	def __init__(self):
+		for attribute, name, labels, help in self.COUNTERS:
+			setattr(self, attribute, 0)
+		for attribute, name, help in self.HISTOGRAMS:
+			setattr(self, attribute, Histogram(UPLOAD_BUCKETS if attribute == "upload_seconds" else LATENCY_BUCKETS))
+		# gcode -> Histogram of time from write to the printer's answer, only M commands are tracked (moves are answered
+		# as the planner takes them, which says more about the print than about the connection)
+		self.command_latency = {}
+
+
+	def latency(self, gcode, seconds):
+		"""Record the time the printer took to answer an M command (gcode bytes)"""
+		histogram = self.command_latency.get(gcode)
+		if histogram is None:
+			histogram = self.command_latency.setdefault(gcode, Histogram())
+		histogram.observe(seconds)
+
+
+def _labels(*parts):
+	parts = [part for part in parts if part]
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _histogram_lines(name, labels, histogram):
+	lines = []
+	cumulative = 0
+	for bound, count in zip(histogram.buckets + (None,), histogram.counts):
+		cumulative += count
+		le = 'le="{}"'.format("+Inf" if bound is None else repr(float(bound)))
+		lines.append("{}_bucket{} {}".format(name, _labels(labels, le), cumulative))
+	lines.append("{}_sum{} {!r}".format(name, _labels(labels), histogram.sum))
+	lines.append("{}_count{} {}".format(name, _labels(labels), histogram.count))
+	return lines
+
+
+def _escape(value):
+	return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_prometheus(connections):
+	"""Return the metrics of a set of connections in the Prometheus text exposition format (version 0.0.4)
+
+	Parameters:
+		connections : list of (port name, ConnectionMetrics, dict of gauge name -> (value, help))
+	"""
+	lines = []
+	described = set()
+
+	def describe(name, kind, help):
+		if name not in described:
+			described.add(name)
+			lines.append("# HELP {} {}".format(name, help))
+			lines.append("# TYPE {} {}".format(name, kind))
+
+	ports = [('port="{}"'.format(_escape(port)), metrics, gauges) for port, metrics, gauges in connections]
+
+	for attribute, name, labels, help in ConnectionMetrics.COUNTERS:
+		name = PREFIX + name
+		describe(name, "counter", help)
+		for port, metrics, gauges in ports:
+			lines.append("{}{} {}".format(name, _labels(port, labels), getattr(metrics, attribute)))
+
+	for attribute, name, help in ConnectionMetrics.HISTOGRAMS:
+		name = PREFIX + name
+		describe(name, "histogram", help)
+		for port, metrics, gauges in ports:
+			lines.extend(_histogram_lines(name, port, getattr(metrics, attribute)))
+
+	name = PREFIX + "command_latency_seconds"
+	describe(name, "histogram", "Time from writing an M command to its answer being read")
+	for port, metrics, gauges in ports:
+		for gcode, histogram in sorted(metrics.command_latency.items()):
+			lines.extend(_histogram_lines(name, '{},gcode="{}"'.format(port, _escape(gcode.decode())), histogram))
+
+	helps = {}
+	for port, metrics, gauges in ports:
+		for gauge, (value, help) in gauges.items():
+			helps.setdefault(gauge, help)
+	for gauge in sorted(helps):
+		describe(PREFIX + gauge, "gauge", helps[gauge])
+		for port, metrics, gauges in ports:
+			if gauge in gauges:
+				lines.append("{}{} {}".format(PREFIX + gauge, _labels(port), gauges[gauge][0]))
+
+	return "\n".join(lines) + "\n"
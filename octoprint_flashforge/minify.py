@@ -0,0 +1,206 @@
+"""
+Streaming g-code minifier used before SD upload and when printing directly from OctoPrint.
+
+Comments are stripped, numbers are shortened to the printer's resolution and G0/G1 words that repeat the current
+(modal) position or feed rate are dropped. Only G0/G1/G92 are rewritten - every other command is passed through as is
+but still tracked so the modal state stays correct (eg positions are forgotten after homing).
+"""
+from .gcode import regex_word
+
+BINARY_EXTENSIONS = (".gx", ".g3drem")
+""" FlashPrint/Dremel files with binary headers - these are never minified """
+BINARY_MAGIC = (b"xgcode", b"g3drem")
+""" Start of files with binary headers """
+
+AXES = (b"X", b"Y", b"Z")
+
+
+def is_binary(path):
+	"""Return true if the file at path has a binary header and must not be minified"""
+
+	if path.lower().endswith(BINARY_EXTENSIONS):
+		return True
+	with open(path, "rb") as f:
+		return f.read(8).startswith(BINARY_MAGIC)
+
+
+def format_number(value, decimals):
+	"""Shortest representation of value rounded to decimals eg 10.500 -> b"10.5", -0.0001 -> b"0" """
+
+	text = b"%.*f" % (decimals, value)
+	if decimals:
+		text = text.rstrip(b"0").rstrip(b".")
+	return b"0" if text == b"-0" else text
+
+
+def trim_literal(value):
+	"""Remove redundant zeros from a number without changing its value eg b"+1.500" -> b"1.5" """
+
+	negative = value.startswith(b"-")
+	value = value.lstrip(b"+-").lstrip(b"0")
+	if b"." in value:
+		value = value.rstrip(b"0").rstrip(b".")
+	if not value or value.startswith(b"."):
+		value = b"0" + value
+	return b"-" + value if negative and value != b"0" else value
+
+
+class Minifier(object):
+	"""Minify a stream of g-code commands
+
+	State is carried from one command to the next so a Minifier must see every command sent to the printer, in order.
+	"""
+
+	AXIS_DECIMALS = 3
+	""" Resolution of X/Y/Z positions (mm) """
+	EXTRUDER_DECIMALS = 5
+	""" Resolution of E positions (mm) """
+
+	def __init__(self, axis_decimals=AXIS_DECIMALS, extruder_decimals=EXTRUDER_DECIMALS):
+		self._decimals = {b"X": axis_decimals, b"Y": axis_decimals, b"Z": axis_decimals, b"E": extruder_decimals,
+						  b"F": 0}
+		self.reset()
+
+
+	def reset(self):
+		"""Forget the modal state and byte counts, eg at the start of a job"""
+
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self._pos = {b"X": None, b"Y": None, b"Z": None, b"E": None}
+		self._feed = None
+		self._absolute = True
+		self._absolute_e = True
+
+
+	@property
+	def saved(self):
+		"""Number of bytes removed so far"""
+		return self.bytes_in - self.bytes_out
+
+
+	def line(self, line):
+		"""Minify a line from a file (bytes, may include a comment and line terminator)
+
+		Returns:
+			The minified command without a line terminator or b"" if the line can be dropped
+		"""
+		self.bytes_in += len(line)
+		cmd = line.split(b";", 1)[0].strip()
+		if cmd:
+			cmd = self._command(cmd, True)
+		self.bytes_out += len(cmd) + 1 if cmd else 0
+		return cmd
+
+
+	def command(self, cmd):
+		"""Minify a single command (bytes, no comment or line terminator) that must be sent
+
+		Returns:
+			The minified command, the command is returned unchanged if it would otherwise have been dropped
+		"""
+		self.bytes_in += len(cmd)
+		cmd = self._command(cmd, False)
+		self.bytes_out += len(cmd)
+		return cmd
+
+
+	def _command(self, cmd, drop):
+		gcode = cmd.split(b" ", 1)[0]
+		if gcode == b"G0" or gcode == b"G1":
+			return self._move(gcode, cmd, drop)
+		elif gcode == b"G92":
+			return self._set_position(cmd)
+		elif gcode == b"G90":
+			self._absolute = self._absolute_e = True
+		elif gcode == b"G91":
+			# positions are unknown once we start moving relative
+			self._absolute = self._absolute_e = False
+			self._forget(AXES + (b"E",))
+		elif gcode == b"M82":
+			self._absolute_e = True
+		elif gcode == b"M83":
+			self._absolute_e = False
+			self._forget((b"E",))
+		elif gcode.startswith(b"T") or gcode == b"M108":
+			# tool change, the new extruder has its own position
+			self._forget((b"E",))
+		elif gcode.startswith(b"G") and gcode not in (b"G4", b"G20", b"G21"):
+			# homing, arcs, probing etc - do not know where we are
+			self._forget(AXES + (b"E",))
+		return cmd
+
+
+	def _forget(self, axes):
+		for axis in axes:
+			self._pos[axis] = None
+
+
+	def _move(self, gcode, cmd, drop):
+		parts = [gcode]
+		for letter, value in regex_word.findall(cmd[len(gcode):]):
+			decimals = self._decimals.get(letter)
+			if decimals is None:
+				# not something we know how to minify
+				parts.append(letter + value)
+				continue
+			absolute = self._absolute_e if letter == b"E" else self._absolute
+			if letter != b"F" and not absolute:
+				# rounding relative moves would accumulate errors so only trim the literal
+				parts.append(letter + trim_literal(value))
+				continue
+			try:
+				value = round(float(value), decimals)
+			except ValueError:
+				return cmd
+			if letter == b"F":
+				if value == self._feed:
+					continue
+				self._feed = value
+			else:
+				if value == self._pos[letter]:
+					continue
+				self._pos[letter] = value
+			parts.append(letter + format_number(value, decimals))
+
+		if len(parts) == 1:
+			# no movement and no change of feed rate
+			return b"" if drop else cmd
+		return b" ".join(parts)
+
+
+	def _set_position(self, cmd):
+		words = regex_word.findall(cmd)[1:]
+		if not words:
+			for axis in self._pos:
+				self._pos[axis] = 0.0
+			return cmd
+		parts = [b"G92"]
+		for letter, value in words:
+			decimals = self._decimals.get(letter)
+			if decimals is None or letter == b"F":
+				parts.append(letter + value)
+				continue
+			try:
+				value = round(float(value), decimals)
+			except ValueError:
+				return cmd
+			self._pos[letter] = value
+			parts.append(letter + format_number(value, decimals))
+		return b" ".join(parts)
+
+
+def minify_file(src, dst, minifier=None):
+	"""Minify g-code from one file object to another, both opened in binary mode
+
+	Returns:
+		(bytes read, bytes written)
+	"""
+	minifier = minifier or Minifier()
+	start_in, start_out = minifier.bytes_in, minifier.bytes_out
+	write = dst.write
+	for line in src:
+		cmd = minifier.line(line)
+		if cmd:
+			write(cmd + b"\n")
+	return minifier.bytes_in - start_in, minifier.bytes_out - start_out
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import json
+import os
+
+from octoprint.util.comm import gcode_command_for_cmd, strip_comment
+
+
+class PretranslatedFile(object):
+	"""Result of running the rewrite rules over every line of a file
+
+	changes : dict of command -> rewritten command(s) for every command in the file that the rules modify
+	identity : set of gcodes where every command in the file passes through unchanged
+	"""
+
+	def __init__(self, changes, identity):
+		self.changes = changes
+		self.identity = identity
+
+
+	def lookup(self, cmd, gcode):
+		"""Return the rewritten command(s) for cmd or None if it has to be translated on the fly"""
+
+		result = self.changes.get(cmd)
+		if result is not None:
+			return result
+		if gcode in self.identity:
+			return cmd
+		return None
+
+
+	def save(self, path):
+		with io.open(path, "w", encoding="utf-8") as f:
+			# json.dump() writes str on Python 2, which a text file does not take
+			f.write(u"" + json.dumps({"changes": self.changes, "identity": sorted(self.identity)}))
+
+
+	@classmethod
+	def load(cls, path):
+		with io.open(path, "r", encoding="utf-8") as f:
+			data = json.load(f)
+		# JSON turns the (cmd, cmd_type) tuples used by the rewrite rules into lists
+		changes = {}
+		for cmd, result in data["changes"].items():
+			if isinstance(result, list):
+				result = [tuple(item) if isinstance(item, list) else item for item in result]
+			changes[cmd] = result
+		return cls(changes, set(data["identity"]))
+
+
+class PretranslationCache(object):
+	"""On disk cache of pretranslated files
+
+	Files are keyed by content hash and the printer profile flags that affect translation so the same job on a different
+	printer (or after a profile change) gets its own entry.
+	"""
+
+	MAX_ENTRIES = 20
+	""" Number of pretranslated files to keep on disk """
+
+	def __init__(self, folder, translate, dynamic=()):
+		"""
+		Parameters:
+			folder : folder to store the cache in
+			translate : function(cmd, gcode) returning the rewritten command(s) while printing from OctoPrint
+			dynamic : gcodes whose translation depends on state at the time they are sent and can not be cached
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._folder = folder
+		self._translate = translate
+		self._dynamic = set(dynamic)
+
+
+	def get(self, path, flags):
+		"""Return the PretranslatedFile for the file at path, building it if it is not already in the cache
+
+		Parameters:
+			path : path of the file on disk
+			flags : dict of printer profile flags that affect translation
+		"""
+		key = "{}-{}".format(self._hash(path), "-".join("{}{}".format(k, int(bool(v))) for k, v in sorted(flags.items())))
+		cache_path = os.path.join(self._folder, key + ".json")
+
+		if os.path.exists(cache_path):
+			try:
+				result = PretranslatedFile.load(cache_path)
+				# touch it so it is not pruned
+				os.utime(cache_path, None)
+				self._logger.debug("pretranslation cache hit for {}".format(path))
+				return result
+			except (IOError, OSError, ValueError, KeyError) as error:
+				self._logger.info("ignoring corrupt pretranslation cache {}: {}".format(cache_path, error))
+
+		result = self._build(path)
+		try:
+			if not os.path.isdir(self._folder):
+				os.makedirs(self._folder)
+			result.save(cache_path)
+			self._prune()
+		except (IOError, OSError, TypeError, ValueError) as error:
+			self._logger.info("unable to save pretranslation cache {}: {}".format(cache_path, error))
+		return result
+
+
+	def _build(self, path):
+		from timeit import default_timer as timer
+
+		start = timer()
+		changes = {}
+		unchanged = set()
+		changed = set()
+		lines = 0
+		with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+			for line in f:
+				# same processing OctoPrint does to each line of a file before queuing it
+				cmd = strip_comment(line).strip()
+				if not cmd:
+					continue
+				lines += 1
+				if cmd in changes:
+					continue
+				gcode = gcode_command_for_cmd(cmd)
+				if gcode in self._dynamic:
+					changed.add(gcode)
+					continue
+				result = self._translate(cmd, gcode)
+				if result is None or result == cmd:
+					if gcode:
+						unchanged.add(gcode)
+				else:
+					changes[cmd] = result
+					changed.add(gcode)
+
+		self._logger.info("pretranslated {} lines of {} in {:.2f}s, {} rewritten commands".format(
+			lines, path, timer() - start, len(changes)))
+		return PretranslatedFile(changes, unchanged - changed)
+
+
+	def _hash(self, path):
+		sha1 = hashlib.sha1()
+		with open(path, "rb") as f:
+			for chunk in iter(lambda: f.read(65536), b""):
+				sha1.update(chunk)
+		return sha1.hexdigest()
+
+
+	def _prune(self):
+		entries = [os.path.join(self._folder, name) for name in os.listdir(self._folder) if name.endswith(".json")]
+		if len(entries) > self.MAX_ENTRIES:
+			entries.sort(key=os.path.getmtime)
+			for entry in entries[:-self.MAX_ENTRIES]:
+				os.remove(entry)
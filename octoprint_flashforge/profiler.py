@@ -0,0 +1,127 @@
+"""
+Time limited sampling profiler for the threads doing the printer I/O: the plugin's own (FlashForge.*) and OctoPrint's
+comm threads that call readline() and write().
+
+A background thread looks at the stacks of those threads at a fixed interval and counts each distinct stack, the
+result is in the collapsed format used by flame graph tools (flamegraph.pl, speedscope, https://www.speedscope.app):
+
+	thread;outer function (file);...;inner function (file) samples
+
+Nothing is added to the profiled code, so the overhead is just the sampling thread (well under 1% of a core at the
+default 100 samples per second) and it can be left running during a print.
+"""
+import os
+import sys
+import threading
+from timeit import default_timer as timer
+
+
+class SamplingProfiler(object):
+	"""Count the stacks of a set of threads sampled at a fixed interval"""
+
+	THREADS = ("FlashForge.", "comm.")
+	""" Name prefixes of the threads that are sampled """
+	INTERVAL = 0.01
+	""" Default time (s) between samples """
+	MAX_DURATION = 300.0
+	""" Longest time (s) a profile may run for """
+	THREAD_REFRESH = 1.0
+	""" How often (s) the set of sampled threads is refreshed """
+
+	def __init__(self, duration=30.0, interval=INTERVAL, threads=THREADS):
+		"""
+		Parameters:
+			duration : time (s) to sample for, at most MAX_DURATION
+			interval : time (s) between samples
+			threads : name prefixes of the threads to sample
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._duration = min(max(duration, 0.0), self.MAX_DURATION)
+		self._interval = max(interval, 0.001)
+		self._prefixes = tuple(threads)
+		self._stacks = {}
+		self._labels = {}
+		self._samples = 0
+		self._sampling_time = 0.0
+		self._started = None
+		self._finished = None
+		self._stop = threading.Event()
+		self._thread = None
+
+
+	def start(self):
+		"""Start sampling in the background, it stops by itself after the duration"""
+		self._started = timer()
+		self._thread = threading.Thread(target=self._run, name="FlashForge.Profiler")
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self):
+		"""Stop sampling early"""
+		self._stop.set()
+		if self._thread and self._thread is not threading.current_thread():
+			self._thread.join()
+
+
+	@property
+	def running(self):
+		return self._thread is not None and self._thread.is_alive()
+
+
+	def summary(self):
+		"""Return a dict describing the run: running, elapsed (s), samples, stacks and overhead (fraction of a core)"""
+		end = self._finished or timer()
+		elapsed = end - self._started if self._started else 0.0
+		return dict(running=self.running, duration=self._duration, interval=self._interval, elapsed=elapsed,
+					samples=self._samples, stacks=len(self._stacks),
+					overhead=self._sampling_time / elapsed if elapsed else 0.0)
+
+
+	def collapsed(self):
+		"""Return the sampled stacks in the collapsed format, one "stack count" line per distinct stack"""
+		stacks = dict(self._stacks)
+		return "".join("{} {}\n".format(stack, count) for stack, count in sorted(stacks.items()))
+
+
+	def _run(self):
+		self._logger.info("profiling threads {} for {}s".format(", ".join(self._prefixes), self._duration))
+		deadline = self._started + self._duration
+		threads = {}
+		refresh = 0.0
+		own = threading.current_thread().ident
+		while not self._stop.wait(self._interval):
+			start = timer()
+			if start >= deadline:
+				break
+			if start >= refresh:
+				threads = dict((thread.ident, thread.name) for thread in threading.enumerate()
+							   if thread.name.startswith(self._prefixes) and thread.ident != own)
+				refresh = start + self.THREAD_REFRESH
+			frames = sys._current_frames()
+			for ident, name in threads.items():
+				frame = frames.get(ident)
+				if frame is not None:
+					stack = self._stack(name, frame)
+					self._stacks[stack] = self._stacks.get(stack, 0) + 1
+			del frames
+			self._samples += 1
+			self._sampling_time += timer() - start
+		self._finished = timer()
+		self._logger.info("profiling finished: {} samples, {} stacks".format(self._samples, len(self._stacks)))
+
+
+	def _stack(self, name, frame):
+		labels = self._labels
+		parts = []
+		while frame is not None:
+			code = frame.f_code
+			label = labels.get(code)
+			if label is None:
+				label = labels[code] = "{} ({})".format(code.co_name, os.path.basename(code.co_filename)).replace(";", ":")
+			parts.append(label)
+			frame = frame.f_back
+		parts.append(name.replace(";", ":"))
+		parts.reverse()
+		return ";".join(parts)
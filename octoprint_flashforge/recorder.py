@@ -0,0 +1,202 @@
+"""
+Compact binary recorder of the USB traffic of a printer connection, to reproduce field problems offline (see replay.py).
+
+The hot path only appends a tuple to a deque. A background thread packs the records and writes them to a gzip
+compressed file that is rotated when it gets too big, keeping a number of older files (capture.1, capture.2, ...). A
+capture left by an earlier connection is rotated the same way when recording starts.
+
+Each file is: MAGIC, a JSON header line, then records of RECORD (time since the capture started (s), direction, endpoint,
+transfer length, stored length) each followed by the stored bytes. SD upload data is only stored if asked for, otherwise
+just its length is recorded.
+"""
+import gzip
+import json
+import os
+import struct
+import threading
+from collections import deque
+from timeit import default_timer as timer
+
+MAGIC = b"FFUSB1\n"
+RECORD = struct.Struct("<dBBII")
+OUT = 0
+""" Direction of data written to the printer """
+IN = 1
+""" Direction of data received from the printer """
+UPLOAD = 2
+""" Direction of file data streamed to the SD card, kept apart so a replay can tell it from commands """
+
+
+class UsbRecorder(object):
+	"""Record bulk transfers to a rotating compressed file"""
+
+	FLUSH_INTERVAL = 0.5
+	""" How often (s) the writer thread packs pending records and writes them out """
+
+	def __init__(self, path, max_bytes=16 * 1024 * 1024, backups=4, upload_data=False):
+		"""
+		Parameters:
+			path : capture file, older captures are rotated to path.1, path.2, ...
+			max_bytes : uncompressed size at which the file is rotated
+			backups : number of rotated files to keep
+			upload_data : true to store SD upload data, otherwise only its length is recorded
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._path = path
+		self._max_bytes = max_bytes
+		self._backups = backups
+		self.upload_data = upload_data
+		self._header = None
+		self._pending = deque()
+		self._start = 0.0
+		self._file = None
+		self._written = 0
+		self._part = 0
+		self._thread = None
+		self._stop = threading.Event()
+
+
+	@property
+	def path(self):
+		return self._path
+
+
+	def start(self, header):
+		"""Open the capture and start the writer thread
+
+		Parameters:
+			header : dict describing the connection (port, printer, endpoints) stored at the start of every file
+		"""
+		self._header = dict(header)
+		self._start = timer()
+		if os.path.exists(self._path):
+			# keep the capture of the previous connection
+			self._shift()
+		self._open()
+		self._thread = threading.Thread(target=self._run, name="FlashForge.Recorder")
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def record(self, direction, endpoint, data, length=None):
+		"""Record a transfer - data must not change afterwards, pass None with the length to record the length only"""
+		self._pending.append((timer(), direction, endpoint, data, len(data) if length is None else length))
+
+
+	def stop(self):
+		"""Write out everything recorded so far and close the capture"""
+		if self._thread:
+			self._stop.set()
+			if self._thread is not threading.current_thread():
+				self._thread.join()
+			self._thread = None
+		self._flush()
+		if self._file:
+			self._file.close()
+			self._file = None
+
+
+	def _run(self):
+		while not self._stop.wait(self.FLUSH_INTERVAL):
+			self._flush()
+
+
+	def _flush(self):
+		if not self._file:
+			return
+		chunks = []
+		pending = self._pending
+		start = self._start
+		while pending:
+			time, direction, endpoint, data, length = pending.popleft()
+			data = data or b""
+			chunks.append(RECORD.pack(time - start, direction, endpoint, length, len(data)))
+			chunks.append(data)
+		if not chunks:
+			return
+		data = b"".join(chunks)
+		try:
+			self._file.write(data)
+			self._file.flush()
+		except (IOError, OSError) as error:
+			self._logger.info("USB capture {} failed: {}".format(self._path, error))
+			self._file = None
+			return
+		self._written += len(data)
+		if self._written >= self._max_bytes:
+			self._rotate()
+
+
+	def _open(self):
+		folder = os.path.dirname(self._path)
+		try:
+			if folder and not os.path.isdir(folder):
+				os.makedirs(folder)
+			self._file = gzip.open(self._path, "wb")
+			header = dict(self._header, part=self._part)
+			self._file.write(MAGIC + json.dumps(header, sort_keys=True).encode("utf-8") + b"\n")
+		except (IOError, OSError) as error:
+			self._logger.info("unable to open USB capture {}: {}".format(self._path, error))
+			self._file = None
+		self._written = 0
+
+
+	def _rotate(self):
+		self._file.close()
+		self._shift()
+		self._part += 1
+		self._open()
+
+
+	def _shift(self):
+		"""Move the current file to path.1, path.1 to path.2, ... dropping the oldest"""
+		try:
+			for n in range(self._backups, 0, -1):
+				older = "{}.{}".format(self._path, n)
+				if os.path.exists(older):
+					if n == self._backups:
+						os.remove(older)
+					else:
+						os.rename(older, "{}.{}".format(self._path, n + 1))
+			if self._backups:
+				os.rename(self._path, "{}.1".format(self._path))
+		except (IOError, OSError) as error:
+			self._logger.info("unable to rotate USB capture {}: {}".format(self._path, error))
+
+
+def read_capture(path):
+	"""Read a capture file
+
+	Returns:
+		(header dict, iterator of (time, direction, endpoint, length, data))
+	"""
+	f = gzip.open(path, "rb")
+	if f.read(len(MAGIC)) != MAGIC:
+		f.close()
+		raise ValueError("{} is not a USB capture".format(path))
+	header = json.loads(f.readline().decode("utf-8"))
+
+	def records():
+		with f:
+			read = f.read
+			while True:
+				packed = read(RECORD.size)
+				if len(packed) < RECORD.size:
+					# end of the file (or it was cut short)
+					return
+				time, direction, endpoint, length, stored = RECORD.unpack(packed)
+				yield time, direction, endpoint, length, read(stored) if stored else b""
+	return header, records()
+
+
+def capture_files(path):
+	"""Return the files of a rotated capture, oldest first"""
+	files = []
+	n = 1
+	while os.path.exists("{}.{}".format(path, n)):
+		files.insert(0, "{}.{}".format(path, n))
+		n += 1
+	if os.path.exists(path):
+		files.append(path)
+	return files
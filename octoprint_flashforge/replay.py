@@ -0,0 +1,222 @@
+"""
+Replay a USB capture made by UsbRecorder through a FlashForge connection, to reproduce field problems and profile the
+response handling without the printer:
+
+	python -m octoprint_flashforge.replay captures/FlashForge.ffusb --speed 10 --lines
+
+The recorded responses are played back by a ReplayPrinter on an emulated USB device at the recorded time (divided by
+speed, 0 = as fast as possible) while readline() is called in a loop like OctoPrint's monitor does. Recorded commands
+are written through write() again so the connection goes through the same states, status polls it piggybacked on them
+are regenerated by write() itself and keep alive polls are replayed as such. SD upload data is skipped.
+
+Commands the plugin sent itself with sendcommand() look the same as OctoPrint's in a capture, so their responses are
+returned by readline() in the replay. Playing back as fast as possible may deliver responses before the commands that
+caused them have been replayed.
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+import threading
+import time
+from timeit import default_timer as timer
+
+from .emulator import EmulatedContext, EmulatedPrinter
+from .flashforge import FlashForge
+from .metrics import format_prometheus
+from .recorder import IN, OUT, capture_files, read_capture
+
+POLL = b"~M119\r\n"
+POLL_TEMP = b"~M119\r\n~M105\r\n"
+
+
+class ReplayPrinter(EmulatedPrinter):
+	"""Printer that sends recorded responses instead of answering the commands it is sent"""
+
+	def __init__(self, header):
+		"""
+		Parameters:
+			header : capture header from read_capture()
+		"""
+		printer = header.get("printer") or {}
+		endpoints = header.get("endpoints") or {}
+		options = {}
+		if "vid" in printer:
+			options.update(vid=printer["vid"], pid=printer["did"])
+		EmulatedPrinter.__init__(self, bus=printer.get("bus", 1), addr=printer.get("addr", 2),
+								 sd_endpoints=endpoints.get("sd_out", 0) != endpoints.get("cmd_out", 0), **options)
+		self.written = 0
+
+
+	def write(self, endpoint, data):
+		self.written += len(data)
+
+
+	def feed(self, data):
+		"""Make recorded response data available to read"""
+		with self._cv:
+			self._respond(data, timer())
+			self._cv.notify_all()
+		self._notify()
+
+
+class Plugin(object):
+	"""Connection callbacks"""
+
+	def on_connect(self, connection):
+		pass
+
+	def on_disconnect(self, connection):
+		pass
+
+	def on_capabilities(self, connection):
+		pass
+
+	def on_sd_open_failed(self, connection):
+		pass
+
+
+class Replay(object):
+	"""Feed a capture through a FlashForge connection"""
+
+	READ_TIMEOUT = 0.25
+	""" readline() timeout (s), short so the reader notices the end of the replay """
+
+	def __init__(self, files, speed=1.0, **options):
+		"""
+		Parameters:
+			files : capture files, oldest first
+			speed : playback speed relative to the recording, 0 for as fast as possible
+			options : FlashForge connection options
+		"""
+		self._files = files
+		self._speed = speed
+		self._options = options
+		self._done = threading.Event()
+		self.lines = []			# (time, line) returned by readline()
+		self.records = 0
+		self.connection = None
+		self._start = 0.0
+		self._error = None
+
+
+	def _records(self):
+		for path in self._files:
+			header, records = read_capture(path)
+			for record in records:
+				yield record
+
+
+	def run(self):
+		"""Play the capture back, returns the time (s) it took"""
+
+		header, records = read_capture(self._files[0])
+		records.close()
+		printer = ReplayPrinter(header)
+		context = EmulatedContext([printer])
+		# the simulated temperature reports need OctoPrint's settings, they are replayed as recorded instead
+		connection = self.connection = FlashForge(Plugin(), None, context, header.get("port", "replay"),
+												  printer.printer_dict(), read_timeout=self.READ_TIMEOUT,
+												  keep_alive=3600.0, capabilities=dict(autotemp=False), **self._options)
+		connection.enable_keep_alive(False)
+		# readline() runs on this thread so it shows up when the replay is profiled
+		self._start = timer()
+		driver = threading.Thread(target=self._drive, args=(printer,), name="FlashForge.Replay")
+		driver.daemon = True
+		driver.start()
+		try:
+			self._read()
+		finally:
+			self._done.set()
+			driver.join()
+			elapsed = timer() - self._start
+			connection.close()
+		if self._error:
+			raise self._error
+		return elapsed
+
+
+	def _drive(self, printer):
+		"""Play the records back at their recorded time"""
+
+		try:
+			for when, direction, endpoint, length, data in self._records():
+				if self._done.is_set():
+					break
+				self.records += 1
+				if self._speed:
+					delay = self._start + when / self._speed - timer()
+					if delay > 0:
+						time.sleep(delay)
+				if direction == IN:
+					printer.feed(data)
+				elif direction == OUT and data:
+					self._write(self.connection, data)
+			# let the reader take everything that was played back
+			while printer.next_ready() is not None and not self._done.is_set():
+				time.sleep(0.01)
+			time.sleep(self.READ_TIMEOUT)
+		except Exception as error:
+			self._error = error
+		finally:
+			self._done.set()
+
+
+	def _write(self, connection, data):
+		if data in (POLL, POLL_TEMP):
+			connection._poll(data == POLL_TEMP)
+			return
+		commands = [line.lstrip(b"~") for line in data.split(b"\r\n") if line]
+		if not commands:
+			return
+		if commands[:2] == [b"M119", b"M27"]:
+			# write() sends M27 as a status poll followed by the progress request
+			commands = commands[1:]
+		connection.write(commands[0])
+
+
+	def _read(self):
+		start = self._start
+		readline = self.connection.readline
+		while not self._done.is_set():
+			line = readline()
+			if line:
+				self.lines.append((timer() - start, line))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("capture", help="capture file, rotated older files are played first")
+	parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 for as fast as possible")
+	parser.add_argument("--lines", action="store_true", help="print the lines returned to OctoPrint")
+	parser.add_argument("--metrics", action="store_true", help="print the connection metrics")
+	parser.add_argument("--profile", action="store_true", help="profile the replay and print the top functions")
+	args = parser.parse_args()
+
+	files = capture_files(args.capture)
+	if not files:
+		parser.error("{} not found".format(args.capture))
+	replay = Replay(files, args.speed)
+	if args.profile:
+		import cProfile
+		import pstats
+		profiler = cProfile.Profile()
+		elapsed = profiler.runcall(replay.run)
+	else:
+		elapsed = replay.run()
+
+	if args.lines:
+		for when, line in replay.lines:
+			print("{:10.3f} {}".format(when, line.decode("utf-8", "replace")))
+	print("replayed {} records from {} file(s) in {:.3f}s, {} lines returned by readline()".format(
+		replay.records, len(files), elapsed, len(replay.lines)))
+	if args.metrics:
+		connection = replay.connection
+		print(format_prometheus([(connection.port, connection.metrics, connection.gauges())]), end="")
+	if args.profile:
+		pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
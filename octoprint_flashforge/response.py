@@ -0,0 +1,72 @@
+class Frame(object):
+	"""Printer response to a single command
+
+	FlashForge printers start each response with "CMD <gcode> Received." and (usually) end it with "ok". Lines that
+	arrive outside of a CMD header (eg a late "ok" when a move completes) are collected into a frame with no gcode.
+	"""
+
+	__slots__ = ("gcode", "header", "lines", "ok")
+
+	def __init__(self, gcode=None, header=None):
+		self.gcode = gcode
+		self.header = header
+		self.lines = []
+		self.ok = False
+
+
+	def __repr__(self):
+		return "Frame({}, {} lines{})".format(self.gcode, len(self.lines), ", ok" if self.ok else "")
+
+
+	def contains(self, text):
+		"""Return true if any line in the body of the response contains text"""
+		for line in self.lines:
+			if text in line:
+				return True
+		return False
+
+
+	def tolines(self):
+		"""Return the response as a list of lines"""
+		lines = [self.header] if self.header else []
+		lines.extend(self.lines)
+		if self.ok:
+			lines.append(b"ok")
+		return lines
+
+
+def parse_frames(lines):
+	"""Split a sequence of response lines into frames at the "CMD <gcode> Received." boundaries
+
+	Parameters:
+		lines : iterable of lines without line terminators
+
+	Returns:
+		List of Frame
+	"""
+	frames = []
+	frame = None
+	for line in lines:
+		if line.startswith(b"okCMD "):
+			# an ok without a line terminator (eg M104 on Dreamer) ran into the response to the next command
+			if frame is None:
+				frame = Frame()
+				frames.append(frame)
+			frame.ok = True
+			line = line[2:]
+		if line.startswith(b"CMD "):
+			frame = Frame(line[4:].split(b" ", 1)[0], line)
+			frames.append(frame)
+		elif line.strip() == b"ok":
+			if frame is None:
+				# ok for a command whose response was read earlier
+				frame = Frame()
+				frames.append(frame)
+			frame.ok = True
+			frame = None
+		elif line:
+			if frame is None:
+				frame = Frame()
+				frames.append(frame)
+			frame.lines.append(line)
+	return frames
@@ -0,0 +1,202 @@
+"""
+Rules for rewriting commands queued by OctoPrint into something FlashForge printers understand.
+
+RULES is a declarative table of (gcode, action, states, profile flag). When a printer connects the table is compiled
+into a dict per connection state so rewriting a command is a single lookup. To support a new printer quirk add a flag
+to the printer's entry in FlashForgePlugin.PRINTER_PROFILES and a rule using that flag here.
+
+Actions are called as action(plugin, comm_instance, cmd, cmd_type) and return the command unchanged, modified, a list
+of replacement commands or [] to drop it.
+"""
+from collections import namedtuple
+
+STATE_IDLE = "idle"
+STATE_PRINTING = "printing"
+STATE_SD_PRINTING = "sd_printing"
+STATES = (STATE_IDLE, STATE_PRINTING, STATE_SD_PRINTING)
+HOST_STATES = (STATE_IDLE, STATE_PRINTING)
+
+SD_PRINTING_ALLOWED = ["M24", "M25", "M26", "M27", "M105", "M110", "M112", "M114", "M115", "M117", "M400"]
+""" allow a very limited set of commands while printing from SD to minimize problems... """
+
+Rule = namedtuple("Rule", "gcode action states profile")
+RuleTable = namedtuple("RuleTable", "actions default")
+
+
+def rule(gcode, action, states=HOST_STATES, profile=None):
+	"""Declare a rule - profile is a flag that must be set in the printer profile for the rule to apply"""
+	return Rule(gcode, action, states, profile)
+
+
+##~~ Actions
+
+def keep(plugin, comm_instance, cmd, cmd_type):
+	return cmd
+
+
+def drop(plugin, comm_instance, cmd, cmd_type):
+	return []
+
+
+def replace_with(replacement):
+	"""Replace the whole command"""
+	def action(plugin, comm_instance, cmd, cmd_type):
+		return [replacement]
+	return action
+
+
+def substitute(old, new):
+	"""Replace the command word, keeping the parameters"""
+	def action(plugin, comm_instance, cmd, cmd_type):
+		return [cmd.replace(old, new)]
+	return action
+
+
+def home(plugin, comm_instance, cmd, cmd_type):
+	return cmd.replace('0', '')
+
+
+def home_axes_separately(plugin, comm_instance, cmd, cmd_type):
+	# F2G2: does not support "G28 X Y"?
+	cmd = cmd.replace('0', '')
+	return ["G28 X", "G28 Y"] if cmd == "G28 X Y" else cmd
+
+
+def relative_positioning(plugin, comm_instance, cmd, cmd_type):
+	if plugin.G91_disabled():
+		# F2G2: try to convert relative positioning to absolute so add in some commands
+		plugin._serial_obj.disable_G91(True)
+		return [("G91", cmd_type), "M114"]
+	plugin._serial_obj.disable_G91(False)
+	return cmd
+
+
+def select_sd_file(plugin, comm_instance, cmd, cmd_type):
+	# if the file path is incorrect (eg it came from Cura) then ignore the command
+	return [] if "M23 /" in cmd else cmd
+
+
+def pause(plugin, comm_instance, cmd, cmd_type):
+	# pause during cancel causes issues
+	return [] if comm_instance.isCancelling() else cmd
+
+
+def cancel(plugin, comm_instance, cmd, cmd_type):
+	# M26 S0 generated during OctoPrint cancel - use it to send cancel
+	if (cmd == "M26 S0" and comm_instance.isCancelling()) or cmd == "M26":
+		return [("M26", cmd_type)]
+	return []
+
+
+def fan(plugin, comm_instance, cmd, cmd_type):
+	return ["M107"] if "S0" in cmd else cmd
+
+
+def stop_heat_wait(plugin, comm_instance, cmd, cmd_type):
+	# M108 Tx is a toolhead change so only drop the bare command
+	return [] if cmd == "M108" else cmd
+
+
+def hello(plugin, comm_instance, cmd, cmd_type):
+	# if we connected and the printer is already printing then trigger an M27 so we can trigger a file open
+	# for OctoPrint
+	if plugin._serial_obj.is_sd_printing() and not plugin._comm.isSdFileSelected():
+		return ["M27"]
+	return []
+
+
+def select_extruder(plugin, comm_instance, cmd, cmd_type):
+	return [("M108 %s" % cmd, cmd_type)]
+
+
+##~~ Rules - later rules for the same gcode override earlier ones
+
+RULES = [
+	# homing
+	rule("G28", home),
+	rule("G28", home_axes_separately, profile="noG28XY"),
+
+	# relative positioning
+	rule("G91", relative_positioning),
+
+	# M20 list SD card, M21 init SD card - do not work and some printers may not respond causing timeouts,
+	# so ignore them
+	rule("M20", drop),
+	rule("M21", drop),
+
+	# M23 = select (and start printing) sd file
+	rule("M23", select_sd_file),
+
+	# M25 = pause
+	rule("M25", pause, STATES),
+
+	# M26 is sent by OctoPrint during SD prints:
+	# M26 in Marlin = set SD card position : FlashForge = cancel
+	rule("M26", cancel, STATES),
+
+	# M82 in Marlin = extruder abs positioning : FlashForge = undefined?
+	rule("M82", drop),
+
+	# M83 in Marlin = extruder rel positioning : FlashForge = undefined?
+	rule("M83", drop),
+
+	# M84 by default sent when OctoPrint cancelling print
+	# M84 in Marlin = disable steppers : M18 is FlashForge equivalent
+	rule("M84", replace_with("M18")),
+
+	# M106 S0 is sent by OctoPrint control panel:
+	# M106 S0 in Marlin = fan off : M107 is FlashForge equivalent
+	rule("M106", fan),
+
+	# M108 is sent by OctoPrint during SD cancel if abortHeatupOnCancel is set:
+	# M108 in Marlin = stop heat wait & continue : FlashForge M108 Tx = change toolhead (no equivalent?),
+	# drop if this is the command
+	rule("M108", stop_heat_wait),
+
+	# M109 in Marlin = wait for extruder temp : M6 in FlashForge (this may need to be moved to the write() method)
+	rule("M109", substitute("M109", "M6")),
+
+	# M110 is sent by OctoPrint as default hello but also when connected:
+	# M110 Set line number/hello in Marlin : FlashForge uses M601 S0 to take control via USB
+	rule("M110", hello, STATES),
+
+	# M119 get status we generate automatically so skip this
+	rule("M119", drop),
+
+	# M132 load default positions does not work at command line for some printers
+	rule("M132", drop, profile="noM132"),
+
+	# M146 = set LED colors: not in SD_PRINTING_ALLOWED so it is not sent while printing from SD (does not work,
+	# may cause issues)
+
+	# M190 in Marlin = wait for bed temp : M7 in FlashForge
+	rule("M190", substitute("M190", "M7")),
+
+	# Tx = select extruder : FlashForge uses M108
+	rule("T", select_extruder),
+]
+
+
+def compile_rules(profile, rules=RULES, unsupported=()):
+	"""Compile the rules that apply to a printer profile into a RuleTable per connection state
+
+	Parameters:
+		profile : printer profile dict from FlashForgePlugin.PRINTER_PROFILES
+		unsupported : gcodes the printer is known not to answer, these are dropped in every state
+
+	Returns:
+		dict of state -> RuleTable, where actions is a dict of gcode -> action and default is the action for any
+		gcode not in actions (None = pass through unchanged)
+	"""
+	rules = list(rules) + [rule(gcode, drop, STATES) for gcode in unsupported]
+	tables = {}
+	for state in STATES:
+		actions = {}
+		for r in rules:
+			if state in r.states and (r.profile is None or profile.get(r.profile)):
+				actions[r.gcode] = r.action
+		if state == STATE_SD_PRINTING:
+			tables[state] = RuleTable(dict((gcode, actions.get(gcode, keep)) for gcode in SD_PRINTING_ALLOWED), drop)
+		else:
+			tables[state] = RuleTable(actions, None)
+	return tables
@@ -0,0 +1,119 @@
+class ReceiveBuffer(object):
+	"""Receive buffer for printer responses
+
+	Data is copied once into a preallocated bytearray through a memoryview. Line endings are found incrementally as
+	data arrives (each byte is only scanned once) and the "ok" terminator is detected by looking at the tail of the
+	buffer rather than rescanning the whole response after every USB packet.
+	"""
+
+	WHITESPACE = bytearray(b" \t\r\n")
+
+	def __init__(self, size=4096):
+		self._buf = bytearray(size)
+		self._view = memoryview(self._buf)
+		self._start = 0			# first byte not yet taken
+		self._end = 0			# end of valid data
+		self._scanned = 0		# bytes before this offset have been checked for line endings
+		self._linestart = 0		# start of the line currently being framed
+		self._lines = []		# (start, end) offsets of complete lines, end excludes the line terminator
+
+
+	def __len__(self):
+		return self._end - self._start
+
+
+	def write(self, data):
+		"""Append data (bytes, bytearray or memoryview) to the buffer
+
+		Returns:
+			number of bytes written
+		"""
+		size = len(data)
+		if size:
+			self._reserve(size)
+			self._view[self._end:self._end + size] = data
+			self._end += size
+			self._frame()
+		return size
+
+
+	def complete(self):
+		"""Return true if the buffered data ends with the "ok" terminator (ignoring trailing whitespace)"""
+
+		end = self._end
+		while end > self._start and self._buf[end - 1] in self.WHITESPACE:
+			end -= 1
+		return end - self._start >= 2 and self._buf[end - 2] == 0x6f and self._buf[end - 1] == 0x6b
+
+
+	def take(self):
+		"""Remove and return all buffered data as bytes"""
+
+		data = self._view[self._start:self._end].tobytes()
+		self.clear()
+		return data
+
+
+	def takelines(self, final=False):
+		"""Remove and return all complete lines (without line terminators)
+
+		Parameters:
+			final : true to also return a trailing partial line, otherwise it stays buffered
+		"""
+
+		lines = [self._view[start:end].tobytes() for start, end in self._lines]
+		self._lines = []
+		self._start = self._linestart
+		if final and self._start < self._end:
+			lines.append(self._view[self._start:self._end].tobytes().rstrip(b"\r"))
+			self._start = self._end
+		if self._start == self._end:
+			self.clear()
+		return lines
+
+
+	def clear(self):
+		self._start = self._end = self._scanned = self._linestart = 0
+		self._lines = []
+
+
+	def _frame(self):
+		"""Find the line endings in the data added since the last call"""
+
+		find = self._buf.find
+		pos = find(b"\n", self._scanned, self._end)
+		while pos >= 0:
+			end = pos
+			if end > self._linestart and self._buf[end - 1] == 0x0d:
+				end -= 1
+			self._lines.append((self._linestart, end))
+			self._linestart = pos + 1
+			pos = find(b"\n", self._linestart, self._end)
+		self._scanned = self._end
+
+
+	def _reserve(self, size):
+		"""Make room for size more bytes, compacting or growing the buffer as needed"""
+
+		if self._end + size <= len(self._buf):
+			return
+		used = self._end - self._start
+		if used + size > len(self._buf):
+			# grow - the old view must be released before the bytearray can be replaced
+			capacity = len(self._buf)
+			while used + size > capacity:
+				capacity *= 2
+			buf = bytearray(capacity)
+			buf[:used] = self._view[self._start:self._end]
+			self._view.release()
+			self._buf = buf
+			self._view = memoryview(buf)
+		elif used:
+			self._view[:used] = self._view[self._start:self._end]
+		# shift the offsets down to the start of the buffer
+		shift = self._start
+		self._lines = [(start - shift, end - shift) for start, end in self._lines]
+		self._scanned -= shift
+		self._linestart -= shift
+		self._start = 0
+		self._end = used
@@ -0,0 +1,102 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+
+class SdIndex(object):
+	"""Index of the files uploaded to each printer's SD card, keyed by content hash
+
+	Lets an upload of a file that is already on the card be skipped. The index only knows what was uploaded through
+	OctoPrint so it can go stale (card swapped, file deleted on the printer) - invalidate() it when the printer reports
+	that a file could not be opened.
+
+	Stored as JSON: {printer key: {sha1: {"remote": remote name, "time": upload time}}}
+	"""
+
+	def __init__(self, path):
+		"""
+		Parameters:
+			path : file to store the index in
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+		self._path = path
+		self._lock = threading.Lock()
+		self._index = None
+
+
+	@staticmethod
+	def printer_key(printer, identity):
+		"""Return the index key for a printer
+
+		Parameters:
+			printer : printer dict from detect_printer() (bus, addr)
+			identity : printer identity from M115
+		"""
+		return "{}:{}:{}".format(printer["bus"], printer["addr"], identity)
+
+
+	@staticmethod
+	def hash(path):
+		"""Return the content hash of the file at path"""
+		sha1 = hashlib.sha1()
+		with open(path, "rb") as f:
+			for chunk in iter(lambda: f.read(65536), b""):
+				sha1.update(chunk)
+		return sha1.hexdigest()
+
+
+	def lookup(self, key, digest):
+		"""Return the remote name of the file with content hash digest on the printer or None"""
+
+		with self._lock:
+			entry = self._load().get(key, {}).get(digest)
+		return entry["remote"] if entry else None
+
+
+	def add(self, key, digest, remote):
+		"""Record that the file with content hash digest was uploaded to the printer as remote"""
+
+		with self._lock:
+			files = self._load().setdefault(key, {})
+			# anything else with the same name has been overwritten
+			for other in [d for d, entry in files.items() if entry["remote"] == remote]:
+				del files[other]
+			files[digest] = {"remote": remote, "time": time.time()}
+			self._save()
+
+
+	def invalidate(self, key):
+		"""Forget everything known about the printer's SD card"""
+
+		with self._lock:
+			if self._load().pop(key, None) is not None:
+				self._logger.info("SD card index invalidated for {}".format(key))
+				self._save()
+
+
+	def _load(self):
+		if self._index is None:
+			self._index = {}
+			if os.path.exists(self._path):
+				try:
+					with io.open(self._path, "r", encoding="utf-8") as f:
+						self._index = json.load(f)
+				except (IOError, OSError, ValueError) as error:
+					self._logger.info("ignoring corrupt SD card index {}: {}".format(self._path, error))
+		return self._index
+
+
+	def _save(self):
+		try:
+			folder = os.path.dirname(self._path)
+			if not os.path.isdir(folder):
+				os.makedirs(folder)
+			with io.open(self._path, "w", encoding="utf-8") as f:
+				# json.dump() writes str on Python 2, which a text file does not take
+				f.write(u"" + json.dumps(self._index))
+		except (IOError, OSError, TypeError, ValueError) as error:
+			self._logger.info("unable to save SD card index {}: {}".format(self._path, error))
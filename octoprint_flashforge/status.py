@@ -0,0 +1,83 @@
+"""
+Structured printer status parsed from the M119/M105/M114/M27 responses as they are received.
+
+A PrinterStatus is immutable - every update produces a new snapshot with a higher version so readers (the plugin API,
+other plugins) can grab the current snapshot without locking or generating USB traffic and can tell if it changed
+since they last looked.
+"""
+import re
+from collections import namedtuple
+from time import time
+
+regex_machine_status = re.compile(b"MachineStatus: *(?P<status>[A-Z_]+)")
+""" Regex matching machine status from M119 """
+regex_move_mode = re.compile(b"MoveMode: *(?P<mode>[A-Z_]+)")
+""" Regex matching move mode from M119 """
+regex_temperature = re.compile(b"(?P<tool>[TB][0-9]*): *(?P<actual>-?[0-9.]+) */ *(?P<target>-?[0-9.]+)")
+""" Regex matching each actual/target temperature pair from M105 """
+
+
+class PrinterStatus(namedtuple("PrinterStatus",
+							   "version timestamp machine_status move_mode temperatures position sd_progress")):
+	"""Snapshot of the printer status
+
+	version : incremented on every change
+	timestamp : time (time.time()) of the last change
+	machine_status : MachineStatus from M119 eg "READY", "BUILDING_FROM_SD"
+	move_mode : MoveMode from M119 eg "READY", "MOVING", "PAUSED", "WAIT_ON_TOOL"
+	temperatures : dict of tool ("T0", "B" etc) -> (actual, target)
+	position : dict of axis ("X", "Y", "Z", "E0", "E1") -> position
+	sd_progress : (current, total) bytes of the SD print or None
+	"""
+	__slots__ = ()
+
+	def update(self, **changes):
+		"""Return a new snapshot with the changes applied, or this one if nothing changed"""
+
+		if all(getattr(self, k) == v for k, v in changes.items()):
+			return self
+		return self._replace(version=self.version + 1, timestamp=time(), **changes)
+
+
+	def to_dict(self):
+		"""Return the snapshot as a JSON serializable dict"""
+
+		result = self._asdict()
+		result["temperatures"] = dict((tool, {"actual": actual, "target": target})
+									  for tool, (actual, target) in self.temperatures.items())
+		result["position"] = dict(self.position)
+		if self.sd_progress is not None:
+			result["sd_progress"] = {"current": self.sd_progress[0], "total": self.sd_progress[1]}
+		return result
+
+
+EMPTY_STATUS = PrinterStatus(0, 0.0, None, None, {}, {}, None)
+""" Status before anything has been received from the printer """
+
+
+def parse_m119(lines):
+	"""Return (machine status, move mode) (str or None) from the lines of an M119 response"""
+
+	machine_status = move_mode = None
+	for line in lines:
+		match = regex_machine_status.search(line)
+		if match:
+			machine_status = match.group("status").decode()
+		match = regex_move_mode.search(line)
+		if match:
+			move_mode = match.group("mode").decode()
+	return machine_status, move_mode
+
+
+def parse_m105(lines):
+	"""Return a dict of tool -> (actual, target) from the lines of an M105 response"""
+
+	temperatures = {}
+	for line in lines:
+		for match in regex_temperature.finditer(line):
+			try:
+				temperatures[match.group("tool").decode()] = (float(match.group("actual")),
+															  float(match.group("target")))
+			except ValueError:
+				pass
+	return temperatures
@@ -0,0 +1,106 @@
+"""
+Opt-in span tracing of the plugin hooks, the printer I/O and the keep alive thread, exported as a Chrome trace (JSON
+that chrome://tracing and https://ui.perfetto.dev load) so contention between threads shows up on a timeline.
+
+Spans are kept in a bounded in-memory buffer, the oldest are dropped when it is full. Tracing costs one attribute test
+per instrumented call while it is off.
+"""
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+
+class Tracer(object):
+	"""Buffer of completed spans"""
+
+	MAX_EVENTS = 200000
+	""" Default number of spans kept """
+
+	def __init__(self, max_events=MAX_EVENTS):
+		self.enabled = False
+		self._events = deque(maxlen=max_events)
+		self._threads = {}
+		self._origin = timer()
+
+
+	def start(self, max_events=None):
+		"""Clear the buffer and start tracing
+
+		Parameters:
+			max_events : number of spans to keep, None to keep the current size
+		"""
+		self._events = deque(maxlen=max_events or self._events.maxlen)
+		self._threads = {}
+		self._origin = timer()
+		self.enabled = True
+
+
+	def stop(self):
+		"""Stop tracing, the buffered spans can still be exported"""
+		self.enabled = False
+
+
+	def __len__(self):
+		return len(self._events)
+
+
+	def complete(self, name, category, start, end, args=None):
+		"""Record a span timed by the caller
+
+		Parameters:
+			name : span name
+			category : span category (eg io, lock, plugin)
+			start, end : timeit.default_timer() values
+			args : optional dict shown with the span, bytes values are decoded on export
+		"""
+		thread = threading.current_thread()
+		self._threads[thread.ident] = thread.name
+		self._events.append((name, category, start, end, thread.ident, args))
+
+
+	@contextmanager
+	def span(self, name, category, **args):
+		"""Record the time taken by the body of a with statement"""
+		start = timer()
+		try:
+			yield
+		finally:
+			self.complete(name, category, start, timer(), args or None)
+
+
+	def export(self):
+		"""Return the buffered spans as a Chrome trace (dict to be serialized as JSON)"""
+
+		pid = os.getpid()
+		origin = self._origin
+		events = [dict(name="process_name", ph="M", pid=pid, tid=0, args=dict(name="OctoPrint"))]
+		for tid, name in list(self._threads.items()):
+			events.append(dict(name="thread_name", ph="M", pid=pid, tid=tid, args=dict(name=name)))
+		for name, category, start, end, tid, args in list(self._events):
+			event = dict(name=name, cat=category, ph="X", pid=pid, tid=tid,
+						 ts=round((start - origin) * 1e6, 3), dur=round((end - start) * 1e6, 3))
+			if args:
+				event["args"] = dict((key, value.decode("utf-8", "replace").strip() if isinstance(value, bytes) else value)
+									 for key, value in args.items())
+			events.append(event)
+		return dict(traceEvents=events, displayTimeUnit="ms")
+
+
+class _NoSpan(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(tracer, name, category, **args):
+	"""Return a context manager timing a span if tracer is set and enabled, otherwise one that does nothing"""
+	if tracer is not None and tracer.enabled:
+		return tracer.span(name, category, **args)
+	return NO_SPAN
@@ -0,0 +1,144 @@
+import usb1
+from collections import deque
+
+
+class UploadError(Exception):
+	def __init__(self, message, status=None):
+		super(UploadError, self).__init__(message if status is None else "{} ({})".format(message, status))
+		self.status = status
+
+
+class UploadEngine(object):
+	"""Stream a file to a bulk OUT endpoint keeping several asynchronous transfers queued
+
+	Each transfer owns a buffer. As soon as a transfer completes its buffer is refilled from the file and it is
+	resubmitted, so reading the next chunks from disk overlaps the USB writes of the previous ones and the bus never
+	sits idle waiting for the host. The engine runs its event loop on the calling thread.
+	"""
+
+	EVENT_TIMEOUT = 0.1
+	""" Max time (s) to block in libusb waiting for a transfer to complete """
+
+	def __init__(self, usbcontext, handle, endpoint, chunk_size, transfers=4, timeout=10.0):
+		"""
+		Parameters:
+			usbcontext : usb1.USBContext used to drive the transfers
+			handle : open usb1.USBDeviceHandle
+			endpoint : bulk OUT endpoint address
+			chunk_size : size of each transfer in bytes
+			transfers : number of transfers to keep in flight
+			timeout : max time (s) to wait for any transfer to complete
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+
+		self._usbcontext = usbcontext
+		self._handle = handle
+		self._endpoint = endpoint
+		self._chunk_size = chunk_size
+		self._count = transfers
+		self._timeout = timeout
+		self._completed = deque()
+
+
+	def send(self, file, size, progress=None):
+		"""Send size bytes from file
+
+		Parameters:
+			file : file object opened in binary mode, read with readinto()
+			size : number of bytes to send
+			progress : optional function(sent, size) called as transfers complete
+
+		Returns:
+			Number of bytes sent
+
+		Raises:
+			UploadError if the file could not be read or a transfer failed
+		"""
+		from timeit import default_timer as timer
+
+		self._logger.debug("UploadEngine.send() endpoint 0x{:02x}, {} x {} bytes".format(
+			self._endpoint, self._count, self._chunk_size))
+		self._completed.clear()
+		transfers = []
+		free = []
+		for i in range(self._count):
+			transfer = self._handle.getTransfer()
+			transfers.append(transfer)
+			free.append((transfer, memoryview(bytearray(self._chunk_size))))
+
+		queued = 0
+		sent = 0
+		in_flight = {}
+		try:
+			while sent < size:
+				# refill and submit every free transfer
+				while free and queued < size:
+					transfer, view = free.pop()
+					try:
+						length = file.readinto(view[:min(self._chunk_size, size - queued)])
+					except (IOError, OSError) as error:
+						raise UploadError("unable to read file", error)
+					if not length:
+						raise UploadError("unexpected eof")
+					transfer.setBulk(self._endpoint, view[:length], callback=self._on_transfer,
+									 timeout=int(self._timeout * 1000.0))
+					transfer.submit()
+					in_flight[transfer] = (view, length)
+					queued += length
+
+				deadline = timer() + self._timeout
+				while not self._completed:
+					if timer() > deadline:
+						raise UploadError("timed out")
+					try:
+						self._usbcontext.handleEventsTimeout(tv=self.EVENT_TIMEOUT)
+					except usb1.USBErrorInterrupted:
+						pass
+
+				# completions may be delivered on another thread (eg the AsyncReader) so consume them one at a time
+				while self._completed:
+					transfer = self._completed.popleft()
+					view, length = in_flight.pop(transfer)
+					status = transfer.getStatus()
+					if status != usb1.TRANSFER_COMPLETED or transfer.getActualLength() != length:
+						raise UploadError("transfer failed", status)
+					sent += length
+					free.append((transfer, view))
+				if progress:
+					progress(sent, size)
+
+		except usb1.USBError as usberror:
+			raise UploadError("transfer failed", usberror)
+
+		finally:
+			if in_flight:
+				self._cancel(in_flight)
+			for transfer in transfers:
+				if not transfer.isSubmitted():
+					transfer.close()
+
+		return sent
+
+
+	def _cancel(self, in_flight):
+		"""Cancel outstanding transfers and wait (briefly) for libusb to hand them back"""
+
+		for transfer in in_flight:
+			try:
+				if transfer.isSubmitted():
+					transfer.cancel()
+			except usb1.USBError:
+				pass
+		for i in range(10):
+			if not any(transfer.isSubmitted() for transfer in in_flight):
+				break
+			try:
+				self._usbcontext.handleEventsTimeout(tv=self.EVENT_TIMEOUT)
+			except usb1.USBError:
+				break
+
+
+	def _on_transfer(self, transfer):
+		"""libusb callback - runs on whichever thread is handling events"""
+		self._completed.append(transfer)
@@ -0,0 +1,129 @@
+import threading
+import usb1
+
+
+class AsyncReader(object):
+	"""Keep a number of bulk IN transfers permanently submitted on an endpoint
+
+	Completed transfers are handed to on_data() and immediately resubmitted so there is always somewhere for the
+	printer response to go. The reader runs a thread that handles libusb events, but the USB context is shared (device
+	hotplug, SD uploads) and libusb runs completion callbacks on whichever thread is handling events. So on_data() and
+	on_error() may be called from any of those threads, while they hold none of their own locks. libusb only lets one
+	thread handle events at a time, so the callbacks never overlap and data arrives in order.
+	"""
+
+	EVENT_TIMEOUT = 0.1
+	""" Max time (s) the reader's event thread blocks in libusb before checking if it should exit """
+
+	def __init__(self, usbcontext, handle, endpoint, on_data, on_error, transfers=4, size=512):
+		"""
+		Parameters:
+			usbcontext : usb1.USBContext used to drive the transfers
+			handle : open usb1.USBDeviceHandle
+			endpoint : bulk IN endpoint address
+			on_data : called with a memoryview of the received bytes, only valid for the duration of the call, from
+				whichever thread is handling libusb events
+			on_error : called with the libusb transfer status or USBError if the endpoint fails, from any event thread
+			transfers : number of transfers to keep in flight
+			size : size of each transfer buffer in bytes
+		"""
+		import logging
+		self._logger = logging.getLogger("octoprint.plugins.flashforge")
+
+		self._usbcontext = usbcontext
+		self._handle = handle
+		self._endpoint = endpoint
+		self._on_data = on_data
+		self._on_error = on_error
+		self._count = transfers
+		self._size = size
+		self._transfers = []
+		self._thread = None
+		self._running = False
+
+
+	def start(self):
+		"""Submit the transfers and start the event handling thread"""
+
+		self._logger.debug("AsyncReader.start() endpoint 0x{:02x}, {} x {} bytes".format(self._endpoint, self._count, self._size))
+		self._running = True
+		try:
+			for i in range(self._count):
+				transfer = self._handle.getTransfer()
+				# bytearray buffer lets libusb write straight into memory we own
+				transfer.setBulk(self._endpoint, bytearray(self._size), callback=self._on_transfer)
+				transfer.submit()
+				self._transfers.append(transfer)
+		except usb1.USBError:
+			self.stop()
+			raise
+
+		self._thread = threading.Thread(target=self._handle_events, name="FlashForge.USB_Events")
+		self._thread.daemon = True
+		self._thread.start()
+
+
+	def stop(self, timeout=1.0):
+		"""Cancel outstanding transfers and wait for the event thread to finish"""
+
+		self._logger.debug("AsyncReader.stop()")
+		self._running = False
+		for transfer in self._transfers:
+			try:
+				if transfer.isSubmitted():
+					transfer.cancel()
+			except usb1.USBError:
+				# already completed or device gone
+				pass
+		if self._thread and self._thread is not threading.current_thread():
+			self._thread.join(timeout)
+		self._thread = None
+
+
+	def is_running(self):
+		return self._running
+
+
+	def _in_flight(self):
+		return any(transfer.isSubmitted() for transfer in self._transfers)
+
+
+	def _handle_events(self):
+		"""Event thread - keep handling libusb events until stopped and all the transfers have been reaped"""
+
+		while self._running or self._in_flight():
+			try:
+				self._usbcontext.handleEventsTimeout(tv=self.EVENT_TIMEOUT)
+			except usb1.USBErrorInterrupted:
+				pass
+			except usb1.USBError as usberror:
+				self._logger.debug("AsyncReader event handling error {}".format(usberror))
+				self._running = False
+				self._on_error(usberror)
+				break
+		self._logger.debug("AsyncReader event thread exiting")
+
+
+	def _on_transfer(self, transfer):
+		"""libusb callback - runs on whichever thread is handling events on the context"""
+
+		status = transfer.getStatus()
+		if status == usb1.TRANSFER_COMPLETED:
+			length = transfer.getActualLength()
+			if length:
+				self._on_data(memoryview(transfer.getBuffer())[:length])
+		elif status == usb1.TRANSFER_CANCELLED:
+			return
+		elif status != usb1.TRANSFER_TIMED_OUT:
+			# stall, overflow, device gone...
+			self._logger.debug("AsyncReader transfer failed with status {}".format(status))
+			self._running = False
+			self._on_error(status)
+			return
+
+		if self._running:
+			try:
+				transfer.submit()
+			except usb1.USBError as usberror:
+				self._running = False
+				self._on_error(usberror)